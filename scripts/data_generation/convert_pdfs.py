@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List, Optional
+
+# Make the shared `pipeline` package (scripts/pipeline) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline.config import LOCAL_METADATA_PATH
+from pipeline.conversion import PDF_CACHE_PATH, convert_to_store
+
+
+def load_metadata(path: str, limit: Optional[int] = None) -> List[Dict]:
+    papers = []
+    with open(path, "r") as f:
+        for line in f:
+            papers.append(json.loads(line))
+            if limit is not None and len(papers) >= limit:
+                break
+    return papers
+
+
+# Converts the PDFs of local papers (not in arxiv-markdown) into the local paper store read by curator_ollama.py.
+# Example: python scripts/data_generation/convert_pdfs.py --metadata data/arxiv_metadata_nlin.jsonl --workers 16
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert local papers' PDFs to markdown with docling, in parallel and cached by content.")
+    parser.add_argument('--metadata', default=LOCAL_METADATA_PATH,
+                        help='JSONL of papers with arxiv_id and pdf_url (or pdf_path), plus doi, authors, dates and categories')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of papers to convert')
+    parser.add_argument('--workers', type=int, default=None, help='Conversion processes (default: all cores)')
+    parser.add_argument('--cache', default=PDF_CACHE_PATH, help='Markdown cache keyed by PDF content hash')
+    args = parser.parse_args()
+    convert_to_store(load_metadata(args.metadata, args.limit), workers=args.workers, cache_path=args.cache)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Make the shared `pipeline` package (scripts/pipeline) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline.cli import main
+
+# Example: python scripts/data_generation/generate.py --backends gemini togetherai-maverick
+if __name__ == "__main__":
+    main()
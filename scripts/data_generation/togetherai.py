@@ -1,370 +1,410 @@
+"""
+Generate reasoning chains with the Together AI client directly (without Curator).
+
+Requests run on asyncio: a fixed pool of `--concurrency` workers pulls
+(paper, entry type) jobs from the paper stream, so dozens of requests can be
+in flight from one process. Each request has a timeout and is retried with
+jittered exponential backoff on transient errors (timeouts, connection
+errors, 429 and 5xx). Responses are streamed and checked while they arrive
+(see pipeline/streaming.py): a response that breaks a hard rule (wrong
+roles, missing <think>, references to "the paper", runaway output) is
+cancelled at once instead of being paid for to the end. Responses failing the
+quality rules (see pipeline/quality.py) are requested again up to
+`--quality-retries` times, cancelled ones included.
+`--rpm`/`--tpm` additionally pace requests through the adaptive limiter (see
+pipeline/limiter.py).
+
+Progress is kept in the same checkpoint store as the Curator scripts, keyed by
+paper, entry type and model, so interrupted runs resume where they stopped and
+papers done by `generate.py --backends togetherai-maverick` are skipped here
+(and vice versa). The old .checkpoint_* files in data/ are imported once.
+"""
+
 import os
+import sys
 import json
-import threading
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
-from typing import List, Dict, Set
-from pydantic import BaseModel, Field
-from random import shuffle
-from together import Together
-from datasets import load_dataset # Added
-from transformers import AutoTokenizer
-# Removed: from docling.document_converter import DocumentConverter
-
-# --- Initialize Together AI client ---
+
+# Make the shared `pipeline` package (scripts/pipeline) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.checkpoint import save_result
+from pipeline.cli import add_selection_arguments, output_paths, parse_shard, selection_from_args
+from pipeline.config import DATASET_PATH, ENTRY_TYPES, ensure_dirs
+from pipeline.limiter import AdaptiveRateLimiter, estimate_tokens, is_throttle_error
+from pipeline.prompts import PromptTemplate, build_prompt, get_prompts
+from pipeline.quality import DEFAULT_QUALITY_RETRIES, failed_rules
+from pipeline.schemas import Conversation, build_record
+from pipeline.selection import PaperSelection
+from pipeline.shards import Shard
+from pipeline.store import STORE_PATH, CheckpointStore, get_store
+from pipeline.streaming import DEFAULT_MAX_OUTPUT_TOKENS, ConversationStream, StreamAborted
+from pipeline.telemetry import configure_telemetry, get_telemetry, serve_metrics
+from pipeline.tokens import close_counter, get_counter
+from pipeline.writer import close_all, install_signal_handlers
+
 load_dotenv()
-api_key = os.getenv("TOGETHER_API_KEY")
-if api_key is None:
-    raise ValueError("TOGETHER_API_KEY environment variable not set")
-together = Together(api_key=api_key)
 
 # --- Configuration ---
 # model = "deepseek-ai/DeepSeek-V3"
 model = "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8"
 
-
-# Define Pydantic models for structured output
-class ConversationEntry(BaseModel):
-    role: str = Field(description="The role of the participant in the conversation (user or assistant)")
-    content: str = Field(description="The content of the message")
-
-class Conversation(BaseModel):
-    conversations: List[ConversationEntry] = Field(description="List of conversation entries")
-
-# --- Paths ---
-DATASET_DIR = "data/jsonls" # Adjusted directory name
-DATASET_PATH = os.path.join(DATASET_DIR, "zraw.jsonl")
-CHECKPOINT_DIR = "data" # Adjusted directory name
-# Create model-specific checkpoint files
-MULTI_SHORT_CHECKPOINT = os.path.join(CHECKPOINT_DIR, f".checkpoint_multi_short_{model.replace('/', '_')}")
-SINGLE_LONG_CHECKPOINT = os.path.join(CHECKPOINT_DIR, f".checkpoint_single_long_{model.replace('/', '_')}")
-
-# --- Ensure Directories Exist ---
-os.makedirs(DATASET_DIR, exist_ok=True)
-os.makedirs(CHECKPOINT_DIR, exist_ok=True)
-
-# --- Thread Lock for File Writing ---
-# Ensures safety if you ever introduce concurrency, good practice anyway.
-file_lock = threading.Lock()
-
-# --- Checkpointing Functions (Adapted from paste-2.txt) ---
-def load_checkpoint(checkpoint_path: str) -> Set[str]:
-    """Load processed arxiv_ids from checkpoint file."""
-    processed_ids = set()
-    if os.path.exists(checkpoint_path):
+DEFAULT_CONCURRENCY = 16
+DEFAULT_TIMEOUT = 600.0 # Seconds per request; long single-long generations can take minutes
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 120.0
+
+TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+TRANSIENT_ERRORS = ("Timeout", "Connection", "RateLimit", "ServiceUnavailable")
+
+METRICS_SOURCE = "togetherai"
+
+# Text checkpoints written by earlier versions of this script
+LEGACY_CHECKPOINT_DIR = "data"
+
+def legacy_checkpoint_path(entry_type: str) -> str:
+    return os.path.join(LEGACY_CHECKPOINT_DIR, f".checkpoint_{entry_type.replace('-', '_')}_{model.replace('/', '_')}")
+
+
+# --- Together AI client (created on first use, so importing this script stays cheap) ---
+def get_client():
+    from together import AsyncTogether
+
+    api_key = os.getenv("TOGETHER_API_KEY")
+    if api_key is None:
+        raise ValueError("TOGETHER_API_KEY environment variable not set")
+    return AsyncTogether(api_key=api_key)
+
+
+# --- Requests ---
+def is_transient_error(error: BaseException) -> bool:
+    """Errors worth retrying: timeouts, connection problems, throttling and server errors."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    return is_throttle_error(error) or any(name in type(error).__name__ for name in TRANSIENT_ERRORS)
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+async def stream_completion(client, prompt: str, max_output_tokens: Optional[int]) -> Tuple[str, object]:
+    """Stream one chat completion through the rule checker; returns (content, usage) or raises StreamAborted."""
+    stream = await client.chat.completions.create(
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a helpful assistant. Only answer in JSON format.",
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        model=model,
+        response_format={
+            "type": "json_object",
+            "schema": Conversation.model_json_schema()
+        },
+        stream=True,
+        # Add other parameters like temperature, max_tokens if needed
+        # max_tokens=500000,
+        # temperature=0.7,
+    )
+    checker = ConversationStream(max_output_tokens)
+    usage = None
+    try:
+        async for chunk in stream:
+            # The usage is sent with the last chunk
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta and checker.feed(delta):
+                raise StreamAborted(checker.violation, checker.text)
+    finally:
+        # Closing the stream drops the connection, which cancels the generation
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is not None:
+            await close()
+    return checker.text, usage
+
+async def request_completion(
+    client,
+    prompt: str,
+    timeout: float,
+    max_retries: int,
+    limiter: Optional[AdaptiveRateLimiter],
+    label: str,
+    max_output_tokens: Optional[int] = DEFAULT_MAX_OUTPUT_TOKENS,
+) -> Optional[str]:
+    """Send one chat completion, retrying transient failures. Returns the message content or None.
+
+    Raises StreamAborted if the response broke a hard rule while streaming.
+    """
+    telemetry = get_telemetry()
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            await asyncio.to_thread(limiter.acquire, 1, estimate_tokens(len(prompt)))
+        start = time.monotonic()
         try:
-            with open(checkpoint_path, "r") as f:
-                for line in f:
-                    arxiv_id = line.strip()
-                    if arxiv_id:
-                        processed_ids.add(arxiv_id)
+            content, usage = await asyncio.wait_for(stream_completion(client, prompt, max_output_tokens), timeout=timeout)
+            if limiter is not None:
+                limiter.record_success()
+            telemetry.record_request(
+                METRICS_SOURCE, model, time.monotonic() - start,
+                input_tokens=getattr(usage, "prompt_tokens", None) or estimate_tokens(len(prompt)),
+                output_tokens=getattr(usage, "completion_tokens", None) or estimate_tokens(len(content)),
+                retries=1 if attempt else 0,
+            )
+            return content
+        except StreamAborted as e:
+            if limiter is not None:
+                limiter.record_success()
+            # Only what was streamed before the cancellation is billed
+            telemetry.record_request(
+                METRICS_SOURCE, model, time.monotonic() - start,
+                input_tokens=estimate_tokens(len(prompt)), output_tokens=estimate_tokens(len(e.text)),
+                retries=1 if attempt else 0,
+            )
+            raise
         except Exception as e:
-            print(f"Warning: Could not load checkpoint {checkpoint_path}. Error: {e}")
-    return processed_ids
+            telemetry.record_request(
+                METRICS_SOURCE, model, time.monotonic() - start,
+                input_tokens=estimate_tokens(len(prompt)), retries=1 if attempt else 0, error=type(e).__name__,
+            )
+            if limiter is not None and is_throttle_error(e):
+                limiter.record_throttle()
+            if not is_transient_error(e) or attempt == max_retries:
+                print(f"Error calling Together API for {label}: {type(e).__name__}: {e}")
+                return None
+            delay = backoff_delay(attempt)
+            print(f"  Transient error for {label} ({type(e).__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def generate_entry(
+    client,
+    paper: Dict,
+    entry_type: str,
+    template: PromptTemplate,
+    store: CheckpointStore,
+    stats: Dict[str, int],
+    timeout: float,
+    max_retries: int,
+    limiter: Optional[AdaptiveRateLimiter],
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    dataset_path: str = DATASET_PATH,
+    max_output_tokens: Optional[int] = DEFAULT_MAX_OUTPUT_TOKENS,
+):
+    arxiv_id = paper["arxiv_id"]
+    label = f"{entry_type} {arxiv_id}"
+    prompt = build_prompt(template, paper)
+    for attempt in range(quality_retries + 1):
+        print(f"  Generating {label}...")
+        try:
+            response_content = await request_completion(client, prompt, timeout, max_retries, limiter, label, max_output_tokens)
+        except StreamAborted as e:
+            stats["aborted"] += 1
+            get_telemetry().record_outcome(METRICS_SOURCE, model, accepted=False, arxiv_id=arxiv_id)
+            print(f"  Response for {label} cancelled while streaming: {e.rule} (attempt {attempt + 1}/{quality_retries + 1})")
+            continue
+        if response_content is None:
+            stats["failed"] += 1
+            return
 
-def save_checkpoint(checkpoint_path: str, arxiv_id: str):
-    """Append arxiv_id to checkpoint file (thread-safe)."""
-    try:
-        with file_lock:
-            with open(checkpoint_path, "a") as f:
-                f.write(f"{arxiv_id}\n")
-    except Exception as e:
-        print(f"Error: Could not save checkpoint {checkpoint_path} for ID {arxiv_id}. Error: {e}")
-
-def save_result(dataset_path: str, result: Dict):
-    """Append a single result to the dataset file (thread-safe)."""
-    try:
-        with file_lock:
-            with open(dataset_path, "a") as f:
-                f.write(json.dumps(result) + "\n")
-    except Exception as e:
-        print(f"Error: Could not save result to {dataset_path}. Error: {e}\nResult: {result}")
-
-# --- Loading papers metadata from HuggingFace dataset (Adapted from paste-2.txt) ---
-def load_papers_metadata(limit=None): # Added limit parameter
-    # Using streaming=True is memory efficient
-    dataset = load_dataset("marcodsn/arxiv-markdown", split='train', streaming=True)
-    papers_data = []
-    print("Loading papers metadata...")
-    count = 0
-    for item in dataset:
-        # Map dataset fields to expected keys
-        papers_data.append({
-            "arxiv_id": item["arxiv_id"],
-            "paper_md": item["markdown"], # Use markdown directly
-            "paper_doi": item.get("paper_doi"), # Use .get for safety
-            "paper_authors": item.get("paper_authors"),
-            "paper_published_date": item.get("paper_published_date"),
-            "paper_updated_date": item.get("paper_updated_date"),
-            "categories": item.get("categories")
-        })
-        count += 1
-        if count % 1000 == 0:
-            print(f"  Loaded {count} papers...")
-        if limit is not None and count >= limit:
-            print(f"  Reached paper limit ({limit}). Stopping loading.")
+        try:
+            response_data = json.loads(response_content) # Parse JSON string
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON response for {label}: {e}")
+            print(f"  Raw response content: {response_content[:500]}...") # Log partial raw response
+            stats["failed"] += 1
+            return
+        conversation_list = response_data.get("conversations", [])
+        entry = build_record(paper, entry_type, model, conversation_list, 0.0)
+
+        # Same rules as parse() in the Curator scripts, checked before anything is saved
+        failed = failed_rules(entry)
+        get_telemetry().record_outcome(METRICS_SOURCE, model, accepted=not failed, arxiv_id=arxiv_id)
+        if not failed:
             break
-    print(f"Finished loading {len(papers_data)} papers.")
-    shuffle(papers_data) # Shuffle the list after loading
-    return papers_data
-
-# --- Loading Prompts (from paste.txt) ---
-def load_prompts():
-    prompts = {}
-    prompt_dir = "prompts"
-    try:
-        with open(os.path.join(prompt_dir, "extraction_examples.txt"), "r") as f:
-            prompts["multi-short"] = f.read()
-        with open(os.path.join(prompt_dir, "long_extraction_examples.txt"), "r") as f:
-            prompts["single-long"] = f.read()
-
-        paper_1_path = os.path.join(prompt_dir, "example_papers/paper_1.md")
-        paper_2_path = os.path.join(prompt_dir, "example_papers/paper_2.md")
-        paper_3_path = os.path.join(prompt_dir, "example_papers/paper_3.md")
-
-        if os.path.exists(paper_1_path):
-            with open(paper_1_path, "r") as f:
-                paper_1_content = f.read()
-                prompts["multi-short"] = prompts["multi-short"].replace("{paper_1}", paper_1_content)
-                prompts["single-long"] = prompts["single-long"].replace("{paper_1}", paper_1_content)
-        else:
-            print(f"Warning: Example paper not found at {paper_1_path}")
-
-        if os.path.exists(paper_2_path):
-            with open(paper_2_path, "r") as f:
-                paper_2_content = f.read()
-                prompts["multi-short"] = prompts["multi-short"].replace("{paper_2}", paper_2_content)
-                prompts["single-long"] = prompts["single-long"].replace("{paper_2}", paper_2_content)
-        else:
-            print(f"Warning: Example paper not found at {paper_2_path}")
-
-        if os.path.exists(paper_3_path):
-            with open(paper_3_path, "r") as f:
-                paper_3_content = f.read()
-                prompts["multi-short"] = prompts["multi-short"].replace("{paper_3}", paper_3_content)
-                prompts["single-long"] = prompts["single-long"].replace("{paper_3}", paper_3_content)
-        else:
-            print(f"Warning: Example paper not found at {paper_3_path}")
-
-    except FileNotFoundError as e:
-        print(f"Error loading prompts: {e}. Make sure the 'prompts' directory and files exist.")
-        raise # Re-raise the exception as prompts are essential
-    return prompts
-
-prompts = load_prompts()
-
-# --- Tokenizer and Helper Function ---
-# Removed: converter = DocumentConverter()
-tokenizer = AutoTokenizer.from_pretrained("unsloth/gemma-3-27b-it") # Or choose another appropriate tokenizer
-
-def _calculate_avg_thinking_tokens(conversations: List[Dict]) -> float:
-    """Helper to calculate average thinking tokens from conversation list."""
-    total_thinking_tokens = 0
-    assistant_replies = 0
-
-    for entry in conversations:
-        if entry["role"] == "assistant":
-            assistant_replies += 1
-            try:
-                # Ensure robust splitting even if tags are missing/malformed
-                parts = entry["content"].split("<think>", 1)
-                if len(parts) > 1:
-                    think_content = parts[1].split("</think>", 1)[0].strip()
-                    total_thinking_tokens += len(tokenizer.tokenize(think_content))
-                # else: No think tag found in this response, token count is 0
-            except Exception as e: # Catch potential errors during splitting/tokenizing
-                print(f"Warning: Error processing <think> tags: {e} in content: {entry.get('content', '')[:100]}...")
-
-    return total_thinking_tokens / assistant_replies if assistant_replies > 0 else 0.0
-
-# --- Main Dataset Generation Function ---
-def generate_dataset(paper_limit=50): # Add limit for testing/cost control
-    # Ensure dataset file exists (or create it)
-    if not os.path.exists(DATASET_PATH):
-        with open(DATASET_PATH, "w") as f:
-            pass # Create empty file
-
-    # Load checkpoints
-    processed_multi_short = load_checkpoint(MULTI_SHORT_CHECKPOINT)
-    processed_single_long = load_checkpoint(SINGLE_LONG_CHECKPOINT)
-    print(f"Loaded {len(processed_multi_short)} processed IDs for multi-short from {MULTI_SHORT_CHECKPOINT}")
-    print(f"Loaded {len(processed_single_long)} processed IDs for single-long from {SINGLE_LONG_CHECKPOINT}")
-
-    # Load papers metadata from HuggingFace dataset
-    papers_metadata = load_papers_metadata(limit=paper_limit)
-    total_papers_to_consider = len(papers_metadata)
-    print(f"Total papers loaded/to consider: {total_papers_to_consider}")
-
-    processed_count = 0
-    skipped_count = 0
-    error_count = 0
-
-    for i, paper in enumerate(papers_metadata):
+        stats["rejected"] += 1
+        print(f"  Response for {label} failed quality rules: {', '.join(failed)} (attempt {attempt + 1}/{quality_retries + 1})")
+    else:
+        stats["failed"] += 1
+        return
+
+    # Counted off the event loop by the shared batched counter
+    entry["avg_thinking_tokens"] = await asyncio.wrap_future(get_counter().submit(conversation_list))
+
+    # The store commits record and checkpoint together; zraw.jsonl can be rebuilt from it
+    if store.save_generation(entry):
+        save_result(dataset_path, entry)
+    stats["generated"] += 1
+    print(f"  Successfully generated and saved {label}")
+
+
+async def _produce(papers, queue: asyncio.Queue, store: CheckpointStore, stats: Dict[str, int], workers: int):
+    """Read the paper stream and enqueue every (paper, entry type) still missing."""
+    iterator = iter(papers)
+    while True:
+        # Reading the stream may block on the network, keep the event loop free
+        paper = await asyncio.to_thread(next, iterator, None)
+        if paper is None:
+            break
+        stats["papers"] += 1
         arxiv_id = paper.get("arxiv_id")
-        if not arxiv_id:
-            print(f"Warning: Skipping paper at index {i} due to missing arxiv_id.")
-            skipped_count += 1
+        if not arxiv_id or not paper.get("paper_md"):
+            print(f"Warning: Skipping paper {arxiv_id} due to missing arxiv_id or empty markdown.")
+            stats["skipped"] += 1
             continue
-
-        print(f"\nProcessing paper {i+1}/{total_papers_to_consider}: {arxiv_id}...")
-
+        generated = store.generated_for(arxiv_id)
+        entry_types = [entry_type for entry_type in ENTRY_TYPES if (entry_type, model) not in generated]
+        if not entry_types:
+            stats["skipped"] += 1 # Both entry types already processed
+            continue
+        for entry_type in entry_types:
+            await queue.put((paper, entry_type))
+    for _ in range(workers):
+        await queue.put(None)
+
+async def _consume(queue: asyncio.Queue, client, prompts: Dict[str, PromptTemplate], store: CheckpointStore, stats: Dict[str, int], **request_kwargs):
+    while True:
+        job = await queue.get()
+        if job is None:
+            break
+        paper, entry_type = job
         try:
-            # --- Get Paper Markdown ---
-            paper_md = paper.get("paper_md", "")
-            if not paper_md:
-                print(f"Warning: Skipping paper {arxiv_id} due to empty markdown content.")
-                skipped_count += 1
-                continue
+            await generate_entry(client, paper, entry_type, prompts[entry_type], store, stats, **request_kwargs)
+        except Exception as e:
+            print(f"!!! Critical Error processing {entry_type} for {paper.get('arxiv_id')}: {e}")
+            stats["failed"] += 1
+
+
+async def run_generation(
+    papers,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    limiter: Optional[AdaptiveRateLimiter] = None,
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    dataset_path: str = DATASET_PATH,
+    store_path: str = STORE_PATH,
+    max_output_tokens: Optional[int] = DEFAULT_MAX_OUTPUT_TOKENS,
+) -> Dict[str, int]:
+    client = get_client()
+    prompts = get_prompts()
+    store = get_store(store_path)
+    stats = {"papers": 0, "skipped": 0, "generated": 0, "rejected": 0, "aborted": 0, "failed": 0}
+
+    # The queue only holds what the workers are about to pick up, the stream is read lazily
+    queue = asyncio.Queue(maxsize=concurrency)
+    await asyncio.gather(
+        _produce(papers, queue, store, stats, concurrency),
+        *(
+            _consume(
+                queue, client, prompts, store, stats, timeout=timeout, max_retries=max_retries, limiter=limiter,
+                quality_retries=quality_retries, dataset_path=dataset_path, max_output_tokens=max_output_tokens
+            )
+            for _ in range(concurrency)
+        ),
+    )
+    return stats
 
-            # --- Check if Multi-Short processing is needed ---
-            generate_multi_short = arxiv_id not in processed_multi_short
-            if generate_multi_short:
-                print(f"  Generating multi-short entry for {arxiv_id}...")
-                prompt_multi_short = prompts["multi-short"].replace("{paper_4}", paper_md)
-
-                try:
-                    response = together.chat.completions.create(
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "You are a helpful assistant. Only answer in JSON format.",
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt_multi_short
-                            }
-                        ],
-                        model=model,
-                        response_format={
-                            "type": "json_object",
-                            "schema": Conversation.model_json_schema()
-                        },
-                        # Add other parameters like temperature, max_tokens if needed
-                        # max_tokens=500000,
-                        # temperature=0.7,
-                    )
-
-                    response_content = response.choices[0].message.content
-                    response_data = json.loads(response_content) # Parse JSON string
-                    conversation_list = response_data.get("conversations", [])
-
-                    avg_tokens = _calculate_avg_thinking_tokens(conversation_list)
-
-                    multi_short_entry = {
-                        "arxiv_id": arxiv_id,
-                        "paper_doi": paper.get("paper_doi", ""),
-                        "paper_authors": paper.get("paper_authors", []),
-                        "paper_published_date": paper.get("paper_published_date", ""),
-                        "paper_updated_date": paper.get("paper_updated_date", ""),
-                        "conversations": conversation_list,
-                        "entry_type": "multi-short",
-                        "categories": paper.get("categories", []),
-                        "avg_thinking_tokens": avg_tokens,
-                        "model": model
-                    }
-
-                    save_result(DATASET_PATH, multi_short_entry)
-                    save_checkpoint(MULTI_SHORT_CHECKPOINT, arxiv_id)
-                    print(f"  Successfully generated and saved multi-short for {arxiv_id}")
-
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON response for multi-short {arxiv_id}: {e}")
-                    print(f"  Raw response content: {response_content[:500]}...") # Log partial raw response
-                    # Optionally save failed attempts or retry logic here
-                except Exception as e:
-                    print(f"Error calling Together API for multi-short {arxiv_id}: {e}")
-                    # Optionally save failed attempts or retry logic here
-            else:
-                print(f"  Skipping multi-short for {arxiv_id} (already processed).")
-
-
-            # --- Check if Single-Long processing is needed ---
-            generate_single_long = arxiv_id not in processed_single_long
-            if generate_single_long:
-                print(f"  Generating single-long entry for {arxiv_id}...")
-                prompt_single_long = prompts["single-long"].replace("{paper_4}", paper_md)
-
-                try:
-                    response = together.chat.completions.create(
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "You are a helpful assistant. Only answer in JSON format."
-                            },
-                            {
-                                "role": "user",
-                                "content": prompt_single_long
-                            }
-                        ],
-                        model=model,
-                        response_format={
-                            "type": "json_object",
-                            "schema": Conversation.model_json_schema()
-                        }
-                        # Add other parameters like temperature, max_tokens if needed
-                        # max_tokens=500000,
-                        # temperature=0.7,
-                    )
-
-                    response_content = response.choices[0].message.content
-                    response_data = json.loads(response_content) # Parse JSON string
-                    conversation_list = response_data.get("conversations", [])
-
-                    avg_tokens = _calculate_avg_thinking_tokens(conversation_list)
-
-                    single_long_entry = {
-                        "arxiv_id": arxiv_id,
-                        "paper_doi": paper.get("paper_doi", ""),
-                        "paper_authors": paper.get("paper_authors", []),
-                        "paper_published_date": paper.get("paper_published_date", ""),
-                        "paper_updated_date": paper.get("paper_updated_date", ""),
-                        "conversations": conversation_list,
-                        "entry_type": "single-long",
-                        "categories": paper.get("categories", []),
-                        "avg_thinking_tokens": avg_tokens,
-                        "model": model
-                    }
-
-                    save_result(DATASET_PATH, single_long_entry)
-                    save_checkpoint(SINGLE_LONG_CHECKPOINT, arxiv_id)
-                    print(f"  Successfully generated and saved single-long for {arxiv_id}")
-
-                except json.JSONDecodeError as e:
-                    print(f"Error decoding JSON response for single-long {arxiv_id}: {e}")
-                    print(f"  Raw response content: {response_content[:500]}...") # Log partial raw response
-                    # Optionally save failed attempts or retry logic here
-                except Exception as e:
-                    print(f"Error calling Together API for single-long {arxiv_id}: {e}")
-                    # Optionally save failed attempts or retry logic here
-            else:
-                print(f"  Skipping single-long for {arxiv_id} (already processed).")
-
-            if not generate_multi_short and not generate_single_long:
-                 skipped_count += 1 # Count as skipped if both already done
-            else:
-                 processed_count += 1 # Count as processed if at least one was generated
 
-        except Exception as e:
-            print(f"!!! Critical Error processing paper {arxiv_id}: {e}")
-            error_count += 1
-            # Decide whether to continue or stop on critical errors
+# --- Main Dataset Generation Function ---
+def generate_dataset(
+    paper_limit: Optional[int] = 50, # Add limit for testing/cost control
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    shard: Optional[Shard] = None,
+    selection: Optional[PaperSelection] = None,
+    max_output_tokens: Optional[int] = DEFAULT_MAX_OUTPUT_TOKENS,
+):
+    from pipeline.papers import iter_papers
+
+    ensure_dirs()
+    dataset_path, store_path = output_paths(shard)
+    store = get_store(store_path)
+    for entry_type in ENTRY_TYPES:
+        store.import_legacy_generation_checkpoint(legacy_checkpoint_path(entry_type), entry_type, model)
+        print(f"Found {store.count_generated(entry_type, model)} papers already processed for {entry_type}")
+
+    # Papers already done are dropped before their markdown is read
+    selection = (selection or PaperSelection())._replace(
+        shard=shard, exclude=lambda arxiv_id: store.is_complete(arxiv_id, ENTRY_TYPES, [model])
+    )
+
+    limiter = None
+    if requests_per_minute:
+        limiter = AdaptiveRateLimiter("together_ai", requests_per_minute, tokens_per_minute)
+
+    try:
+        stats = asyncio.run(run_generation(
+            iter_papers(limit=paper_limit, selection=selection), concurrency, timeout, max_retries, limiter, quality_retries,
+            dataset_path, store_path, max_output_tokens
+        ))
+    finally:
+        # Records are saved once their tokens are counted, so drain the counter before the writers
+        close_counter()
+        close_all()
 
     print("\n--- Dataset Generation Summary ---")
-    print(f"Total papers considered: {total_papers_to_consider}")
-    print(f"Papers processed (at least one entry generated): {processed_count}")
-    print(f"Papers skipped (missing ID, empty markdown, or already processed): {skipped_count}")
-    print(f"Papers encountering critical errors during processing loop: {error_count}")
-    final_processed_multi = len(load_checkpoint(MULTI_SHORT_CHECKPOINT))
-    final_processed_single = len(load_checkpoint(SINGLE_LONG_CHECKPOINT))
-    print(f"Final count in multi-short checkpoint: {final_processed_multi}")
-    print(f"Final count in single-long checkpoint: {final_processed_single}")
-    print(f"Results saved to: {DATASET_PATH}")
-    print(f"Checkpoints at: {MULTI_SHORT_CHECKPOINT}, {SINGLE_LONG_CHECKPOINT}")
+    print(f"Total papers considered: {stats['papers']}")
+    print(f"Entries generated: {stats['generated']}")
+    print(f"Responses rejected by quality rules: {stats['rejected']}")
+    print(f"Responses cancelled while streaming: {stats['aborted']}")
+    print(f"Entries failed (after retries): {stats['failed']}")
+    print(f"Papers skipped (missing ID, empty markdown, or already processed): {stats['skipped']}")
+    for entry_type in ENTRY_TYPES:
+        print(f"Final count of {entry_type} entries for {model}: {store.count_generated(entry_type, model)}")
+    print(f"Results saved to: {dataset_path}")
+    get_telemetry().print_summary()
     print("--- Finished ---")
 
 
 # --- Call the function to generate the dataset ---
 if __name__ == "__main__":
-    # You can adjust the paper_limit here for testing, or set to None to process all
+    parser = argparse.ArgumentParser(description="Generate reasoning chains with the Together AI API directly.")
     # Be mindful of API costs and rate limits when processing large numbers.
-    generate_dataset(paper_limit=250) # Example: Process only the first 50 papers loaded
-    # generate_dataset(paper_limit=None) # Uncomment to process all papers from the stream
+    parser.add_argument('--limit', type=int, default=250, help='Maximum number of papers to read (<= 0 for no limit)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Requests in flight at once')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Seconds before a request is abandoned and retried')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES, help='Retries per request on transient errors')
+    parser.add_argument('--quality-retries', type=int, default=DEFAULT_QUALITY_RETRIES, help='Times a paper is sent again after its response fails the quality rules')
+    parser.add_argument('--max-output-tokens', type=int, default=DEFAULT_MAX_OUTPUT_TOKENS, help='Cancel a response once it grows past this many tokens (<= 0 for no limit)')
+    parser.add_argument('--rpm', type=float, default=None, help='Requests per minute to start pacing at (no pacing if not given)')
+    parser.add_argument('--tpm', type=float, default=None, help='Input tokens per minute to start pacing at (with --rpm)')
+    add_selection_arguments(parser)
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='I/N', help='Only process the papers whose arxiv_id hashes to shard I of N (merge with generate.py --merge-shards)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve request metrics in the Prometheus text format on this port')
+    parser.add_argument('--no-metrics-log', action='store_true', help='Do not write per-request events to data/metrics')
+    args = parser.parse_args()
+
+    configure_telemetry(log_events=not args.no_metrics_log)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    install_signal_handlers()
+    generate_dataset(
+        paper_limit=args.limit if args.limit > 0 else None,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        max_retries=args.max_retries,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        quality_retries=args.quality_retries,
+        shard=args.shard,
+        selection=selection_from_args(args),
+        max_output_tokens=args.max_output_tokens if args.max_output_tokens > 0 else None,
+    )
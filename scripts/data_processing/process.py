@@ -2,9 +2,14 @@ import os
 import json
 import pandas as pd
 import logging
+import sys
 import glob
 from tqdm.auto import tqdm
 
+# Make the shared `pipeline` package (scripts/pipeline) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.quality import RULES
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -91,42 +96,15 @@ for model, count in sorted(initial_model_counts.items(), key=lambda x: x[1], rev
     logging.info(f"  {model}: {count}")
 logging.info("-----------------------------------")
 
-# Filter out examples with avg_thinking_tokens == 0
-pre_filter = len(df)
-pre_model_counts = get_model_counts(df)
-df = df[df['avg_thinking_tokens'] != 0]
-post_model_counts = get_model_counts(df)
-logging.info(f"Removed no-thinking examples: {pre_filter} -> {len(df)}")
-display_model_changes(pre_model_counts, post_model_counts, "removing no-thinking examples")
-
-# Filter examples containing certain phrases
-pre_filter = len(df)
-pre_model_counts = get_model_counts(df)
-df = df[~df['conversations'].astype(str).str.contains("the text|the paper|the doc|The text|The paper|The doc")]
-post_model_counts = get_model_counts(df)
-logging.info(f"Skipped examples with 'the text', 'the paper' or 'the doc': {pre_filter} -> {len(df)}")
-display_model_changes(pre_model_counts, post_model_counts, "filtering specific phrases")
-
-# Filter examples where assistant answer does not end with a period
-pre_filter = len(df)
-pre_model_counts = get_model_counts(df)
-
-# Define a function to check if the last assistant message ends with a period
-def last_assistant_msg_ends_with_period(conversation_list):
-    # Get all assistant messages
-    assistant_msgs = [msg for msg in conversation_list if msg['role'] == 'assistant']
-    if not assistant_msgs:  # If no assistant messages found
-        return False
-    # Check if the last assistant message ends with a period
-    last_msg = assistant_msgs[-1].get('content', '').strip()
-    return len(last_msg) > 0 and last_msg[-1] == '.'
-
-# Apply the function to filter the dataframe
-df = df[df['conversations'].apply(last_assistant_msg_ends_with_period)]
-post_model_counts = get_model_counts(df)
-
-logging.info(f"Skipped examples with assistant answer not ending with a period: {pre_filter} -> {len(df)}")
-display_model_changes(pre_model_counts, post_model_counts, "filtering non-period-ending responses")
+# Apply the quality rules shared with the generation scripts (pipeline/quality.py).
+# New generations are already checked in parse(), this catches older records.
+for rule_name, rule in RULES.items():
+    pre_filter = len(df)
+    pre_model_counts = get_model_counts(df)
+    df = df[[rule(record) for record in df.to_dict('records')]]
+    post_model_counts = get_model_counts(df)
+    logging.info(f"Removed examples failing {rule_name} ({rule.__doc__}): {pre_filter} -> {len(df)}")
+    display_model_changes(pre_model_counts, post_model_counts, f"applying {rule_name}")
 
 # Final summary of model changes from start to end
 logging.info("\n=== SUMMARY: Model counts from start to end ===")
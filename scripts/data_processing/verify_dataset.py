@@ -1,9 +1,10 @@
 import os
+import sys
 import json
-import threading
+import argparse
 import time
 import random
-from typing import List, Dict, Set
+from typing import List, Dict
 import uuid
 from pydantic import BaseModel, Field, validator
 from dotenv import load_dotenv
@@ -12,6 +13,16 @@ import traceback # For better error logging
 # Import Curator
 from bespokelabs import curator
 
+# Make the shared `pipeline` package (scripts/pipeline) importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.batch import DEFAULT_MAX_ITEMS, DEFAULT_POLL_INTERVAL, BatchMixin, batch_enabled, check_batchable, configure_batch
+from pipeline.cache import CachedResponsesMixin
+from pipeline.calibration import DEFAULT_MAX_TOKENS, DEFAULT_PROMPT_TOKENS, calibrate, tuned_backend_params
+from pipeline.prompts import PromptTemplate
+from pipeline.store import get_store
+from pipeline.telemetry import MeteredMixin, get_telemetry
+from pipeline.writer import close_writer, get_writer, install_signal_handlers
+
 # Load environment variables
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
@@ -20,6 +31,7 @@ if api_key is None:
 
 # --- Model Configuration ---
 # List of verifier models
+# Local models take max_concurrent_requests from `--calibrate` once it was run (the value below is the fallback)
 verifier_models = [
     # {
     #     "name": "gemini-2.0-flash",
@@ -86,15 +98,13 @@ INPUT_DATASET_PATH = "data/jsonls/zprocessed.jsonl"
 OUTPUT_DATASET_PATH = "data/jsonls/zverified.jsonl"
 CHECKPOINT_DIR = "data/checkpoints"
 VERIFIER_PROMPT_PATH = "./prompts/verifier.txt"
+QA_PAIR_PLACEHOLDER = "{qa_pair_json}"
 
 # --- Ensure Directories Exist ---
 os.makedirs(os.path.dirname(INPUT_DATASET_PATH), exist_ok=True)
 os.makedirs(os.path.dirname(OUTPUT_DATASET_PATH), exist_ok=True)
 os.makedirs(CHECKPOINT_DIR, exist_ok=True)
 
-# --- Thread Lock for File Writing ---
-file_lock = threading.Lock()
-
 # --- Pydantic Models ---
 class ConversationEntry(BaseModel):
     role: str
@@ -129,7 +139,7 @@ def generate_content_id(conversations):
     return content_id
 
 def get_model_checkpoint_path(model_name: str) -> str:
-    """Get the checkpoint path specific to a model."""
+    """Get the legacy text checkpoint path specific to a model (imported into the checkpoint store)."""
     return os.path.join(CHECKPOINT_DIR, f".checkpoint_verifier_{model_name}")
 
 def get_model_output_path(model_name: str) -> str:
@@ -137,48 +147,23 @@ def get_model_output_path(model_name: str) -> str:
     base_name, ext = os.path.splitext(OUTPUT_DATASET_PATH)
     return f"{base_name}_{model_name}{ext}"
 
-def load_checkpoint(checkpoint_path: str) -> Set[str]:
-    """Load processed composite keys (arxiv_id_content_id) from checkpoint file."""
-    processed_keys = set()
-    if os.path.exists(checkpoint_path):
-        try:
-            with open(checkpoint_path, "r") as f:
-                for line in f:
-                    composite_key = line.strip()
-                    if composite_key:
-                        processed_keys.add(composite_key)
-        except Exception as e:
-            print(f"Warning: Could not load checkpoint {checkpoint_path}. Error: {e}")
-    return processed_keys
-
-def save_checkpoint(checkpoint_path: str, composite_key: str):
-    """Append composite_key to checkpoint file (thread-safe)."""
-    try:
-        with file_lock:
-            with open(checkpoint_path, "a") as f:
-                f.write(f"{composite_key}\n")
-    except Exception as e:
-        print(f"Error: Could not save checkpoint {checkpoint_path} for key {composite_key}. Error: {e}")
-
 def save_result(output_path: str, result: Dict):
-    """Append a single verified result to the output dataset file (thread-safe)."""
+    """Queue a single verified result for the output dataset file (group-committed, thread-safe)."""
     try:
-        with file_lock:
-            with open(output_path, "a") as f:
-                f.write(json.dumps(result) + "\n")
+        get_writer(output_path).write(result)
     except Exception as e:
         print(f"Error: Could not save result to {output_path}. Error: {e}\nResult: {result}")
 
-def load_verifier_prompt(prompt_path: str) -> str:
-    """Loads the verifier prompt template."""
+def load_verifier_prompt(prompt_path: str) -> PromptTemplate:
+    """Loads and compiles the verifier prompt template."""
     try:
         with open(prompt_path, "r") as f:
             prompt_template = f.read()
         if not prompt_template:
             raise ValueError(f"Verifier prompt file is empty: {prompt_path}")
-        if "{qa_pair_json}" not in prompt_template:
+        if QA_PAIR_PLACEHOLDER not in prompt_template:
              raise ValueError("Verifier prompt template must contain the placeholder '{qa_pair_json}'")
-        return prompt_template
+        return PromptTemplate(prompt_template, placeholder=QA_PAIR_PLACEHOLDER)
     except FileNotFoundError:
         print(f"Error: Verifier prompt file not found at {prompt_path}")
         raise
@@ -187,16 +172,18 @@ def load_verifier_prompt(prompt_path: str) -> str:
         raise
 
 # --- Curator Verifier LLM Class ---
-class VerifierLLM(curator.LLM):
-    def __init__(self, prompt_template: str, output_path: str, checkpoint_path: str, model_name: str, **kwargs):
+class VerifierLLM(BatchMixin, MeteredMixin, CachedResponsesMixin, curator.LLM):
+    def __init__(self, prompt_template: PromptTemplate, output_path: str, model_name: str, **kwargs):
         super().__init__(model_name, **kwargs)
+        self.init_response_cache(model_name, kwargs.get("backend"), kwargs.get("backend_params"), kwargs.get("response_format"))
         self.prompt_template = prompt_template
         self.output_path = output_path
-        self.checkpoint_path = checkpoint_path
         self.model_name = model_name.split("/")[-1]
+        self.init_metrics("verifier", self.model_name)
+        self.init_batch(model_name)
         print(f"Initialized VerifierLLM with model: {self.model_name}")
         print(f"  Saving results to: {self.output_path}")
-        print(f"  Updating checkpoint: {self.checkpoint_path}")
+        print(f"  Updating checkpoint store: {get_store().path}")
 
     def prompt(self, item_to_verify: Dict) -> str:
         """Formats the prompt for the verifier LLM."""
@@ -210,7 +197,7 @@ class VerifierLLM(curator.LLM):
             conversation_json_str = json.dumps({"conversations": conversation}, indent=2)
 
         try:
-            formatted_prompt = self.prompt_template.replace("{qa_pair_json}", conversation_json_str)
+            formatted_prompt = self.prompt_template.render(conversation_json_str)
             return formatted_prompt
         except Exception as e:
             print(f"Error formatting prompt for {arxiv_id}: {e}")
@@ -220,11 +207,13 @@ class VerifierLLM(curator.LLM):
         """
         Parses the structured response and saves the verification result.
         """
+        self.remember_response(item_to_verify, response)
         arxiv_id = item_to_verify.get("arxiv_id")
         conversations = item_to_verify.get("conversations", [])
 
         if not arxiv_id:
             print("Warning: Processing item with missing arxiv_id. Skipping save.")
+            self.record_outcome(item_to_verify, response, accepted=False)
             return []
 
         # Generate content_id and create composite key
@@ -244,14 +233,16 @@ class VerifierLLM(curator.LLM):
 
         # Save results
         try:
-            # Save to model-specific output
-            save_result(self.output_path, augmented_result)
-            save_checkpoint(self.checkpoint_path, composite_key)
+            # Result and checkpoint are committed together; the model-specific output is appended after
+            if get_store().save_verification(content_id, self.model_name, augmented_result):
+                save_result(self.output_path, augmented_result)
 
             print(f"Saved verification for {composite_key}. Classification: {response.classification}")
+            self.record_outcome(item_to_verify, response, accepted=True)
         except Exception as e:
             print(f"Error during saving for {composite_key}: {e}")
             traceback.print_exc()
+            self.record_outcome(item_to_verify, response, accepted=False)
 
         return [augmented_result]
 
@@ -277,22 +268,23 @@ def verify_dataset():
         model_output_path = get_model_output_path(model_name)
 
         print(f"\n=== Processing with verifier model: {model_name} ===")
-        print(f"Model checkpoint: {model_checkpoint_path}")
+        print(f"Legacy checkpoint: {model_checkpoint_path}")
         print(f"Model output: {model_output_path}")
 
-        # Load checkpoint for this model
-        processed_ids = load_checkpoint(model_checkpoint_path)
-        print(f"Loaded {len(processed_ids)} processed IDs from checkpoint for model {model_name}.")
+        # Migrate the old text checkpoint for this model, if any
+        store = get_store()
+        store.import_legacy_verifier_checkpoint(model_checkpoint_path, model_name)
 
         # Initialize VerifierLLM for this model
         try:
+            if batch_enabled():
+                check_batchable(verifier_model["name"])
             verifier_llm = VerifierLLM(
                 prompt_template=verifier_prompt_template,
                 output_path=model_output_path,
-                checkpoint_path=model_checkpoint_path,
                 model_name=verifier_model["name"],
                 backend=verifier_model["backend"],
-                backend_params=verifier_model["backend_params"],
+                backend_params=tuned_backend_params(verifier_model["name"], verifier_model["backend_params"]),
                 response_format=VerificationResult,
                 batch=False
             )
@@ -324,12 +316,11 @@ def verify_dataset():
                         if "conversations" not in item or not isinstance(item["conversations"], list):
                             continue
 
-                        # Generate content_id and create composite key
+                        # Generate content_id
                         content_id = generate_content_id(conversations)
-                        composite_key = f"{arxiv_id}_{content_id}"
 
                         # Check if this model already processed this item
-                        if composite_key not in processed_ids:
+                        if not store.is_verified(content_id, model_name):
                             items_to_process.append(item)
                     except Exception:
                         continue
@@ -359,7 +350,11 @@ def verify_dataset():
         # Process items with this model
         start_time = time.time()
         try:
-            verification_results = verifier_llm(items_to_process)
+            # Items verified before by the same model and prompt are answered from the response cache
+            if batch_enabled():
+                verification_results = verifier_llm.call_batch(items_to_process)
+            else:
+                verification_results = verifier_llm.call_cached(items_to_process)
             processed_count = len(verification_results)
             error_count = total_to_process - processed_count
 
@@ -370,12 +365,49 @@ def verify_dataset():
             print(f"Error during verification with model {model_name}: {e}")
             traceback.print_exc()
         finally:
+            # Flush this model's buffered results before moving on
+            close_writer(model_output_path)
             end_time = time.time()
             total_time = end_time - start_time
             print(f"Total time for model {model_name}: {total_time:.2f} seconds")
 
+    get_telemetry().print_summary()
     print("\nVerification complete. Run the merge_verification_results.py script to merge all verifier outputs.")
 
+def calibrate_verifiers(prompt_tokens: int = DEFAULT_PROMPT_TOKENS, max_tokens: int = DEFAULT_MAX_TOKENS):
+    """Calibrate the concurrency of every verifier model served locally."""
+    for verifier_model in verifier_models:
+        base_url = verifier_model["backend_params"].get("base_url")
+        if base_url is None:
+            print(f"Verifier {verifier_model['name']}: not served through a base_url, skipping")
+            continue
+        calibrate(verifier_model["name"], base_url, prompt_tokens, max_tokens)
+
 # --- Run the Verification ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify the processed dataset with an ensemble of LLM verifiers.")
+    parser.add_argument('--batch', action='store_true',
+                        help="Send requests through the provider's batch API (cheaper, results within 24h) instead of Curator")
+    parser.add_argument('--batch-base-url', default=None, metavar='URL',
+                        help='Send batch jobs to this OpenAI-compatible server instead of the provider')
+    parser.add_argument('--batch-max-items', type=int, default=DEFAULT_MAX_ITEMS,
+                        help='Requests per batch job')
+    parser.add_argument('--batch-poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between batch job status checks')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Find and store the best max_concurrent_requests of the local verifier models and exit')
+    parser.add_argument('--calibration-prompt-tokens', type=int, default=DEFAULT_PROMPT_TOKENS,
+                        help='Prompt length of the calibration requests')
+    parser.add_argument('--calibration-max-tokens', type=int, default=DEFAULT_MAX_TOKENS,
+                        help='Output tokens per calibration request')
+    args = parser.parse_args()
+    if args.calibrate:
+        calibrate_verifiers(args.calibration_prompt_tokens, args.calibration_max_tokens)
+        sys.exit(0)
+    configure_batch(
+        enabled=args.batch, base_url=args.batch_base_url,
+        max_items=args.batch_max_items, poll_interval=args.batch_poll_interval
+    )
+
+    install_signal_handlers()
     verify_dataset()
@@ -0,0 +1,7 @@
+"""
+Shared generation pipeline for the academic-chains data_generation scripts.
+
+Providers are registered in `pipeline.backends`, the Curator extractors live in
+`pipeline.extractors` and `pipeline.scheduler` fans a single paper stream out
+over every selected backend at once.
+"""
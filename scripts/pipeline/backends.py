@@ -0,0 +1,141 @@
+"""
+Registry of generation backends.
+
+Each backend is a factory returning a model config dict:
+
+    {
+        "name": ...,            # value written to the record's "model" field
+        "model_name": ...,      # model name as passed to Curator (with provider prefix)
+        "backend": ...,         # Curator backend
+        "backend_params": ...,  # Curator backend params (rate limits, api key, ...)
+        "rate_limit_key": ...,  # optional, backends sharing a provider quota share a limiter
+    }
+
+The rate limits are starting points for the adaptive limiter in `pipeline.limiter`;
+local backends take their concurrency from `pipeline.calibration` once calibrated.
+
+Factories run lazily so that only the API keys of the selected backends are required.
+"""
+
+import os
+from typing import Callable, Dict, List
+
+from dotenv import load_dotenv
+
+from pipeline.calibration import tuned_backend_params
+
+# Load environment variables
+load_dotenv()
+
+BACKENDS: Dict[str, Callable[[], Dict]] = {}
+
+
+def register_backend(name: str):
+    """Decorator registering a backend factory under `name`."""
+    def decorator(factory: Callable[[], Dict]) -> Callable[[], Dict]:
+        if name in BACKENDS:
+            raise ValueError(f"Backend '{name}' is already registered")
+        BACKENDS[name] = factory
+        return factory
+    return decorator
+
+def get_backend(name: str) -> Dict:
+    """Build the model config for a registered backend."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Available backends: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[name]()
+
+def get_backends(names: List[str]) -> List[Dict]:
+    return [get_backend(name) for name in names]
+
+def _require_env(var: str) -> str:
+    value = os.getenv(var)
+    if value is None:
+        raise ValueError(f"{var} environment variable not set")
+    return value
+
+
+# --- Gemini ---
+def _gemini(name: str, max_requests_per_minute: int, max_tokens_per_minute: int) -> Dict:
+    return {
+        "name": name,
+        "model_name": "gemini/" + name,
+        "backend": "litellm",
+        "rate_limit_key": "gemini/" + name, # Gemini quotas are per model
+        "backend_params": {
+            "api_key": _require_env("GEMINI_API_KEY"),
+            "max_requests_per_minute": max_requests_per_minute,
+            "max_tokens_per_minute": max_tokens_per_minute
+        }
+    }
+
+@register_backend("gemini")
+def gemini_2_5_flash():
+    return _gemini("gemini-2.5-flash-preview-04-17", 10, 250_000)
+
+@register_backend("gemini-2.0-flash")
+def gemini_2_0_flash():
+    return _gemini("gemini-2.0-flash", 15, 1_000_000)
+
+@register_backend("gemini-2.5-pro")
+def gemini_2_5_pro():
+    return _gemini("gemini-2.5-pro-exp-03-25", 5, 250_000)
+
+
+# --- Together AI ---
+def _together(name: str) -> Dict:
+    _require_env("TOGETHER_API_KEY") # Read by litellm from the environment
+    return {
+        "name": name,
+        "model_name": "together_ai/" + name,
+        "backend": "litellm",
+        "rate_limit_key": "together_ai", # Account-wide limits
+        "backend_params": {
+            "max_requests_per_minute": 30,
+            "max_tokens_per_minute": 60_000
+        }
+    }
+
+@register_backend("togetherai")
+def together_deepseek_v3():
+    return _together("deepseek-ai/DeepSeek-V3")
+
+@register_backend("togetherai-maverick")
+def together_llama_4_maverick():
+    return _together("meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8")
+
+@register_backend("togetherai-llama-3.1-70b")
+def together_llama_3_1_70b():
+    return _together("meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo")
+
+
+# --- Cohere ---
+# NOTE: structured output through litellm was never confirmed to work with Cohere.
+@register_backend("cohere")
+def cohere_command_a():
+    return {
+        "name": "command-a-03-2025",
+        "model_name": "command-a-03-2025",
+        "backend": "litellm",
+        "rate_limit_key": "cohere",
+        "backend_params": {
+            "api_key": _require_env("COHERE_API_KEY"),
+            "max_requests_per_minute": 20
+        }
+    }
+
+
+# --- Ollama (local) ---
+OLLAMA_BASE_URL = "http://localhost:11434"
+
+@register_backend("ollama")
+def ollama_qwen_rdc():
+    return {
+        "name": "qwen-rdc-7b",
+        "model_name": "ollama/qwen-rdc-7b",
+        "backend": "litellm",
+        # Run `generate.py --backends ollama --calibrate` to pick max_concurrent_requests for this machine
+        "backend_params": tuned_backend_params("ollama/qwen-rdc-7b", {
+            "base_url": OLLAMA_BASE_URL
+        })
+    }
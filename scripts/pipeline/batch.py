@@ -0,0 +1,364 @@
+"""
+Provider batch-API mode (asynchronous, discounted requests).
+
+Instead of sending requests through Curator, `BatchMixin.submit_batch(rows)`
+writes them as OpenAI-compatible batch jobs (a JSONL file of chat
+completion requests, then a batch over it), which Gemini and Together AI
+both accept at about half the price. `wait_batches()` polls the jobs until
+they finish, downloads the output and runs every response through `parse()`,
+exactly like a fresh Curator response: it is journaled, cached, checked by
+the quality rules and saved.
+
+Jobs and their items are tracked in data/checkpoints/batches.sqlite, keyed by
+a hash of the LLM settings and the prompt, so after a restart the still
+running jobs are polled again instead of being re-submitted. Items without a
+valid response (or in a job that failed or expired) are submitted again,
+while rows with an item in a running job are not submitted twice.
+
+`--batch-base-url` points every job at another OpenAI-compatible server,
+e.g. a local fake batch server for testing.
+"""
+
+import os
+import json
+import zlib
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pipeline.config import CHECKPOINT_DIR
+from pipeline.store import _Transaction
+from pipeline.telemetry import get_telemetry
+
+BATCH_PATH = os.path.join(CHECKPOINT_DIR, "batches.sqlite")
+DEFAULT_MAX_ITEMS = 500 # Requests per job
+DEFAULT_POLL_INTERVAL = 60.0 # Seconds between status checks
+# Submissions of an item (the first one, plus retries of its failures) before it is left for a later run;
+# the count starts over whenever the item is submitted again from the paper stream
+MAX_ATTEMPTS = 3
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+BATCH_SOURCE_SUFFIX = "-batch" # Appended to the telemetry source of LLMs in batch mode
+
+# OpenAI-compatible batch endpoints by model name prefix: (base_url, API key variable)
+PROVIDERS = {
+    "gemini/": ("https://generativelanguage.googleapis.com/v1beta/openai/", "GEMINI_API_KEY"),
+    "gemini-": ("https://generativelanguage.googleapis.com/v1beta/openai/", "GEMINI_API_KEY"),
+    "together_ai/": ("https://api.together.xyz/v1", "TOGETHER_API_KEY"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    job_id TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    base_url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    items INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS batch_jobs_namespace ON batch_jobs (namespace, status);
+
+CREATE TABLE IF NOT EXISTS batch_items (
+    custom_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    arxiv_id TEXT,
+    row BLOB NOT NULL, -- zlib-compressed JSON, emptied once done
+    status TEXT NOT NULL, -- pending, done or failed
+    attempts INTEGER NOT NULL -- Since the item was last submitted from the paper stream
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS batch_items_job ON batch_items (job_id);
+CREATE INDEX IF NOT EXISTS batch_items_arxiv_id ON batch_items (arxiv_id, status);
+"""
+
+
+def provider_for(model_name: str) -> Optional[Tuple[str, str, str]]:
+    """(base_url, API key variable, provider model name) for a Curator/litellm model name, if batchable."""
+    for prefix, (base_url, key_var) in PROVIDERS.items():
+        if model_name.startswith(prefix):
+            return base_url, key_var, model_name[len(prefix):] if prefix.endswith("/") else model_name
+    return None
+
+
+# --- Settings ---
+_settings = {"enabled": False, "base_url": None, "max_items": DEFAULT_MAX_ITEMS, "poll_interval": DEFAULT_POLL_INTERVAL}
+
+def configure_batch(
+    enabled: Optional[bool] = None,
+    base_url: Optional[str] = None,
+    max_items: Optional[int] = None,
+    poll_interval: Optional[float] = None,
+):
+    """Switch batch mode on or off; `base_url` overrides the provider endpoints."""
+    for key, value in (("enabled", enabled), ("base_url", base_url), ("max_items", max_items), ("poll_interval", poll_interval)):
+        if value is not None:
+            _settings[key] = value
+
+def batch_enabled() -> bool:
+    return _settings["enabled"]
+
+def check_batchable(model_name: str):
+    """Raise if batch mode can't be used with a model."""
+    if _settings["base_url"] is None and provider_for(model_name) is None:
+        raise ValueError(f"Batch mode is not available for {model_name} (supported: {', '.join(PROVIDERS)})")
+
+
+# --- Provider client ---
+class BatchClient:
+    """Thin wrapper around the OpenAI SDK's files and batches endpoints."""
+
+    def __init__(self, base_url: str, api_key: str):
+        from openai import OpenAI
+
+        self.base_url = base_url
+        self._client = OpenAI(base_url=base_url, api_key=api_key)
+
+    def submit(self, requests: List[Dict]) -> str:
+        """Upload the requests and start a batch over them; returns the job id."""
+        data = "".join(json.dumps(request) + "\n" for request in requests).encode("utf-8")
+        input_file = self._client.files.create(file=("batch.jsonl", data), purpose="batch")
+        job = self._client.batches.create(input_file_id=input_file.id, endpoint=ENDPOINT, completion_window=COMPLETION_WINDOW)
+        return job.id
+
+    def retrieve(self, job_id: str):
+        return self._client.batches.retrieve(job_id)
+
+    def download(self, file_id: Optional[str]) -> List[Dict]:
+        if not file_id:
+            return []
+        text = self._client.files.content(file_id).text
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+_clients: Dict[str, BatchClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url: str, key_var: Optional[str]) -> BatchClient:
+    with _clients_lock:
+        if base_url not in _clients:
+            api_key = os.getenv(key_var) if key_var else None
+            _clients[base_url] = BatchClient(base_url, api_key or "no-key")
+        return _clients[base_url]
+
+def endpoint_for(model_name: str) -> Tuple[str, Optional[str], str]:
+    """(base_url, API key variable, provider model name) honouring the base_url override."""
+    provider = provider_for(model_name)
+    if _settings["base_url"] is not None:
+        return _settings["base_url"], provider[1] if provider else None, provider[2] if provider else model_name
+    if provider is None:
+        check_batchable(model_name)
+    return provider
+
+
+# --- Job tracking ---
+class BatchTracker:
+    """Submitted jobs and their items, in SQLite."""
+
+    def __init__(self, path: str = BATCH_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def pending_ids(self, custom_ids: List[str]) -> Set[str]:
+        """Those of `custom_ids` that are in a job still running."""
+        pending = set()
+        for start in range(0, len(custom_ids), 500):
+            chunk = custom_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            pending.update(custom_id for (custom_id,) in self._conn.execute(
+                f"SELECT custom_id FROM batch_items WHERE status = 'pending' AND custom_id IN ({placeholders})", chunk
+            ))
+        return pending
+
+    def pending_namespaces(self, arxiv_id: str) -> Set[str]:
+        """Namespaces with an item of this paper in a running job."""
+        return {namespace for (namespace,) in self._conn.execute(
+            "SELECT DISTINCT j.namespace FROM batch_items i JOIN batch_jobs j ON j.job_id = i.job_id WHERE i.arxiv_id = ? AND i.status = 'pending'",
+            (arxiv_id,)
+        )}
+
+    def add_job(self, job_id: str, namespace: str, base_url: str, items: List[Tuple[str, Dict]], retry: bool = False):
+        """Record a submitted job; `retry` counts it as another attempt of its items instead of a first one."""
+        now = time.time()
+        with _Transaction(self._conn) as conn:
+            conn.execute(
+                "INSERT INTO batch_jobs (job_id, namespace, base_url, status, items, created_at, updated_at) VALUES (?, ?, ?, 'submitted', ?, ?, ?)",
+                (job_id, namespace, base_url, len(items), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO batch_items (custom_id, job_id, arxiv_id, row, status, attempts) VALUES (?, ?, ?, ?, 'pending', 1) "
+                "ON CONFLICT (custom_id) DO UPDATE SET job_id = excluded.job_id, row = excluded.row, status = 'pending', "
+                "attempts = CASE WHEN ? THEN attempts + 1 ELSE 1 END",
+                [(custom_id, job_id, row.get("arxiv_id"), zlib.compress(json.dumps(row).encode("utf-8")), retry) for custom_id, row in items]
+            )
+
+    def active_jobs(self, namespace: str) -> List[Tuple[str, str, float]]:
+        """(job_id, base_url, created_at) of the jobs of `namespace` that haven't finished."""
+        placeholders = ",".join("?" * len(TERMINAL_STATUSES))
+        return self._conn.execute(
+            f"SELECT job_id, base_url, created_at FROM batch_jobs WHERE namespace = ? AND status NOT IN ({placeholders}) ORDER BY created_at",
+            (namespace, *TERMINAL_STATUSES)
+        ).fetchall()
+
+    def set_status(self, job_id: str, status: str):
+        self._conn.execute("UPDATE batch_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+    def job_items(self, job_id: str) -> Dict[str, Tuple[Dict, int]]:
+        """custom_id -> (row, attempts) of the items still pending in a job."""
+        return {
+            custom_id: (json.loads(zlib.decompress(row)), attempts) for custom_id, row, attempts in self._conn.execute(
+                "SELECT custom_id, row, attempts FROM batch_items WHERE job_id = ? AND status = 'pending'", (job_id,)
+            )
+        }
+
+    def finish_job(self, job_id: str, status: str, done: Iterable[str]):
+        """Record a finished job: `done` items succeeded, its other pending items failed."""
+        with _Transaction(self._conn) as conn:
+            conn.executemany("UPDATE batch_items SET status = 'done', row = x'' WHERE custom_id = ? AND job_id = ?", [(c, job_id) for c in done])
+            conn.execute("UPDATE batch_items SET status = 'failed' WHERE job_id = ? AND status = 'pending'", (job_id,))
+            conn.execute("UPDATE batch_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+
+_trackers: Dict[str, BatchTracker] = {}
+_trackers_lock = threading.Lock()
+
+def get_batch_tracker(path: str = BATCH_PATH) -> BatchTracker:
+    with _trackers_lock:
+        if path not in _trackers:
+            _trackers[path] = BatchTracker(path)
+        return _trackers[path]
+
+
+# --- LLM integration ---
+class BatchMixin:
+    """Batch jobs for curator.LLM subclasses that also use CachedResponsesMixin and MeteredMixin.
+
+    Call `init_batch` from `__init__`, after `init_metrics`. Job state lives in
+    the tracker, not on the LLM, since Curator hashes LLMs by pickling them.
+    """
+
+    def init_batch(self, model_name: str, batch_path: str = BATCH_PATH):
+        self.batch_model_name = model_name
+        self.batch_path = batch_path
+        if batch_enabled():
+            # Batch requests are billed at the batch price (see pipeline.telemetry.PRICE_FACTORS)
+            self.metrics_source = f"{self.metrics_source}{BATCH_SOURCE_SUFFIX}"
+
+    @property
+    def batch_namespace(self) -> str:
+        # Extractors of one backend share the cache namespace but parse differently
+        return f"{self.cache_namespace.hex()}:{self.__class__.__name__}"
+
+    def _batch_request(self, custom_id: str, row: Dict, provider_model: str) -> Dict:
+        body = {"model": provider_model, "messages": [{"role": "user", "content": self.prompt(row)}]}
+        if self.response_format_cls is not None:
+            body["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": self.response_format_cls.__name__, "schema": self.response_format_cls.model_json_schema()},
+            }
+        return {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}
+
+    def submit_batch(self, rows: List[Dict], retry: bool = False) -> int:
+        """Submit rows as batch jobs, skipping those already in a running job; returns how many were submitted.
+
+        `retry` marks a re-submission of failed items, which counts towards MAX_ATTEMPTS.
+        """
+        tracker = get_batch_tracker(self.batch_path)
+        ids = [self._response_key(row).hex() for row in rows]
+        pending = tracker.pending_ids(ids)
+        todo = {custom_id: row for custom_id, row in zip(ids, rows) if custom_id not in pending}
+        if not todo:
+            return 0
+        base_url, key_var, provider_model = endpoint_for(self.batch_model_name)
+        client = get_client(base_url, key_var)
+        items = list(todo.items())
+        for start in range(0, len(items), _settings["max_items"]):
+            chunk = items[start:start + _settings["max_items"]]
+            job_id = client.submit([self._batch_request(custom_id, row, provider_model) for custom_id, row in chunk])
+            tracker.add_job(job_id, self.batch_namespace, base_url, chunk, retry)
+            print(f"[{self.batch_model_name}] Submitted batch job {job_id} with {len(chunk)} requests")
+        return len(todo)
+
+    def wait_batches(self) -> List:
+        """Poll this LLM's running jobs (including ones from earlier runs) until they finish; returns the parsed results.
+
+        Failed items are submitted again, up to MAX_ATTEMPTS times in all; the ones still failing are
+        submitted anew (with a fresh count) once their papers come up in a later run.
+        """
+        tracker = get_batch_tracker(self.batch_path)
+        namespace = self.batch_namespace
+        results = []
+        jobs = tracker.active_jobs(namespace)
+        while jobs:
+            for job_id, base_url, created_at in jobs:
+                job = get_client(base_url, endpoint_for(self.batch_model_name)[1]).retrieve(job_id)
+                status = str(job.status).lower()
+                if status in TERMINAL_STATUSES:
+                    results.extend(self._finish_job(tracker, job_id, base_url, job, status, created_at))
+                else:
+                    tracker.set_status(job_id, status)
+            jobs = tracker.active_jobs(namespace)
+            if jobs:
+                print(f"[{self.batch_model_name}] {len(jobs)} batch job(s) running, checking again in {_settings['poll_interval']:g}s")
+                time.sleep(_settings["poll_interval"])
+        return results
+
+    def _finish_job(self, tracker: BatchTracker, job_id: str, base_url: str, job, status: str, created_at: float) -> List:
+        """Parse a finished job's output; items without a valid response are marked failed and re-submitted."""
+        client = get_client(base_url, endpoint_for(self.batch_model_name)[1])
+        items = tracker.job_items(job_id)
+        lines = client.download(getattr(job, "output_file_id", None)) if status == "completed" else []
+        results, done = [], set()
+        input_tokens = 0
+        for line in lines:
+            custom_id = line.get("custom_id")
+            response = line.get("response") or {}
+            if custom_id not in items or line.get("error") or response.get("status_code") != 200:
+                continue
+            body = response.get("body") or {}
+            usage = body.get("usage") or {}
+            input_tokens += usage.get("prompt_tokens") or 0
+            try:
+                content = body["choices"][0]["message"]["content"]
+                parsed = self.response_format_cls.model_validate_json(content) if self.response_format_cls is not None else content
+                results.extend(self.parse(items[custom_id][0], parsed))
+                done.add(custom_id)
+            except Exception as e:
+                print(f"Warning: Could not parse batch response {custom_id} of job {job_id}: {e}")
+        tracker.finish_job(job_id, status, done)
+        get_telemetry().record_request(
+            self.metrics_source, self.metrics_model, time.time() - created_at, requests=len(items),
+            # Output tokens are counted per response by parse() (record_outcome)
+            input_tokens=input_tokens, error=None if status == "completed" else status,
+        )
+        failed = [item for custom_id, item in items.items() if custom_id not in done]
+        print(f"[{self.batch_model_name}] Batch job {job_id} {status}: {len(done)} responses parsed{f', {len(failed)} failed' if failed else ''}")
+        retries = [row for row, attempts in failed if attempts < MAX_ATTEMPTS]
+        if retries:
+            self.submit_batch(retries, retry=True)
+        if len(retries) < len(failed):
+            print(f"[{self.batch_model_name}] Giving up on {len(failed) - len(retries)} item(s) after {MAX_ATTEMPTS} attempts; they are re-submitted when their papers come up again")
+        return results
+
+    def call_batch(self, rows: List[Dict]) -> List:
+        """Like `call_cached`, but the misses go through batch jobs (blocks until they finish)."""
+        hits, misses = self.split_cached(rows)
+        results = self.replay_cached(hits)
+        self.submit_batch(misses)
+        results.extend(self.wait_batches())
+        return results
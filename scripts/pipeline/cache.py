@@ -0,0 +1,231 @@
+"""
+Content-addressed on-disk cache of LLM responses.
+
+A response is keyed by a hash of everything that determines it: model name,
+Curator backend, the backend params that reach the provider, the
+response_format schema and the exact prompt bytes. Params that only affect
+pacing or authentication (rate limits, api keys, ...) are left out, so
+changing them keeps the cache warm. Re-running a script after changing
+`parse()` or the record layout replays the stored responses locally instead
+of paying for the generations again.
+
+Responses are stored zlib-compressed in a SQLite database under data/cache,
+separate from the checkpoint store since it can be deleted at any time. Once
+the stored size exceeds `max_bytes` the least recently used responses are
+evicted.
+
+`CachedResponsesMixin` adds the cache to a curator.LLM: `call_cached(rows)`
+answers cached rows through `parse()` directly and only sends the misses to
+Curator, whose `parse()` stores them via `remember_response`.
+"""
+
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.config import CACHE_DIR
+from pipeline.store import _Transaction
+
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+EVICT_TO = 0.9 # Evict down to this fraction of max_bytes, so eviction runs rarely
+
+# Backend params that don't change what the model answers
+UNCACHED_PARAMS = {
+    "api_key",
+    "max_requests_per_minute",
+    "max_tokens_per_minute",
+    "max_concurrent_requests",
+    "max_retries",
+    "request_timeout",
+    "require_all_responses",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key BLOB PRIMARY KEY,
+    namespace BLOB NOT NULL,
+    response BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+def request_namespace(model_name: str, backend: Optional[str], backend_params: Optional[Dict], response_format=None) -> bytes:
+    """Hash of the request settings shared by every prompt of one LLM."""
+    params = {k: v for k, v in (backend_params or {}).items() if k not in UNCACHED_PARAMS}
+    schema = response_format.model_json_schema() if response_format is not None else None
+    settings = json.dumps({"model": model_name, "backend": backend, "params": params, "schema": schema}, sort_keys=True, default=str)
+    return hashlib.blake2b(settings.encode("utf-8"), digest_size=16).digest()
+
+def response_key(namespace: bytes, prompt: str) -> bytes:
+    key = hashlib.blake2b(namespace, digest_size=16)
+    key.update(prompt.encode("utf-8"))
+    return key.digest()
+
+
+class ResponseCache:
+    """Size-bounded LRU response cache in SQLite."""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._size_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: bytes):
+        row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: bytes, namespace: bytes, response):
+        blob = zlib.compress(json.dumps(response).encode("utf-8"))
+        with _Transaction(self._conn) as conn:
+            previous = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, response, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, blob, len(blob), time.time())
+            )
+        with self._size_lock:
+            self._size += len(blob) - (previous[0] if previous else 0)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used responses until the cache is below EVICT_TO of max_bytes."""
+        target = int(self.max_bytes * EVICT_TO)
+        with _Transaction(self._conn) as conn:
+            size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = []
+            for key, row_size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if size <= target:
+                    break
+                evicted.append((key,))
+                size -= row_size
+            conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        with self._size_lock:
+            self._size = size
+        print(f"Response cache: evicted {len(evicted)} least recently used responses")
+
+
+# --- Process-wide caches ---
+_settings = {"enabled": True, "max_bytes": DEFAULT_MAX_BYTES}
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def configure_response_cache(enabled: Optional[bool] = None, max_bytes: Optional[int] = None):
+    """Enable/disable the response cache or change its size for caches opened afterwards."""
+    if enabled is not None:
+        _settings["enabled"] = enabled
+    if max_bytes is not None:
+        _settings["max_bytes"] = max_bytes
+
+def get_response_cache(path: str = RESPONSE_CACHE_PATH) -> Optional[ResponseCache]:
+    """Process-wide cache for `path`, or None if caching is disabled."""
+    if not _settings["enabled"]:
+        return None
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path, _settings["max_bytes"])
+        return _caches[path]
+
+
+# Set while cached responses are replayed through parse(), so they aren't stored again
+_replaying = threading.local()
+
+def replaying() -> bool:
+    """Whether the current thread is replaying cached responses through parse()."""
+    return getattr(_replaying, "active", False)
+
+
+class CachedResponsesMixin:
+    """Response caching for curator.LLM subclasses; call `init_response_cache` from `__init__`."""
+
+    def init_response_cache(self, model_name: str, backend: Optional[str], backend_params: Optional[Dict], response_format=None, cache_path: str = RESPONSE_CACHE_PATH):
+        self.response_format_cls = response_format
+        self.cache_path = cache_path
+        self.cache_namespace = request_namespace(model_name, backend, backend_params, response_format)
+
+    def _response_key(self, row: Dict) -> bytes:
+        return response_key(self.cache_namespace, self.prompt(row))
+
+    def split_cached(self, rows: List[Dict]) -> Tuple[List[Tuple[Dict, object]], List[Dict]]:
+        """Split rows into (row, cached response) hits and rows that need a request."""
+        cache = get_response_cache(self.cache_path)
+        if cache is None:
+            return [], list(rows)
+        hits, misses = [], []
+        for row in rows:
+            data = cache.get(self._response_key(row))
+            if data is None:
+                misses.append(row)
+            elif self.response_format_cls is not None and isinstance(data, dict):
+                hits.append((row, self.response_format_cls.model_validate(data)))
+            else:
+                hits.append((row, data))
+        return hits, misses
+
+    def replay_cached(self, hits: List[Tuple[Dict, object]]) -> List:
+        """Run parse() over cached responses, as Curator would for fresh ones."""
+        results = []
+        _replaying.active = True
+        try:
+            for row, response in hits:
+                results.extend(self.parse(row, response))
+        finally:
+            _replaying.active = False
+        return results
+
+    def call_cached(self, rows: List[Dict]) -> List:
+        """Like calling the LLM on `rows`, but only cache misses are sent to Curator."""
+        hits, misses = self.split_cached(rows)
+        results = self.replay_cached(hits)
+        if misses:
+            results.extend(self.send(misses))
+        return results
+
+    def send(self, rows: List[Dict]) -> List:
+        """Send rows to Curator (see `pipeline.telemetry.MeteredMixin` for the metered version)."""
+        return self(rows)
+
+    def remember_response(self, row: Dict, response):
+        """Store a fresh response for `row`.
+
+        Every parse() override has to call this itself, once it accepts the
+        response (responses it rejects should not be replayed). While cached
+        responses are replayed through parse() it is a no-op.
+        """
+        if replaying():
+            return
+        cache = get_response_cache(self.cache_path)
+        if cache is None:
+            return
+        data = response.model_dump() if hasattr(response, "model_dump") else response
+        try:
+            cache.put(self._response_key(row), self.cache_namespace, data)
+        except Exception as e:
+            print(f"Warning: Could not cache response. Error: {e}")
@@ -0,0 +1,196 @@
+"""
+Concurrency calibration for local OpenAI-compatible servers (Ollama, llama.cpp).
+
+How many requests a local server should get at once depends on the model,
+its quantization and the context length, so a fixed `max_concurrent_requests`
+is either too low (idle GPU) or too high (requests queue up and time out).
+`calibrate` ramps the concurrency (1, 2, 4, ...), sends a few rounds of
+requests with a synthetic prompt at every level, and measures the aggregate
+output tokens/sec and the p50/p95 latency. It stops at the knee of the
+curve: once doubling the concurrency gains less than MIN_GAIN throughput,
+requests fail, or the p95 latency grows past MAX_LATENCY_FACTOR times the
+single-request latency, and picks the last level that was still worth it.
+
+The chosen value and the measured curve are stored per server and model in
+data/cache/concurrency.json; `tuned_backend_params` applies them to a
+backend's Curator params in later runs (the response cache ignores
+`max_concurrent_requests`, so re-tuning keeps it warm).
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pipeline.config import CACHE_DIR
+from pipeline.limiter import estimate_tokens
+
+CONCURRENCY_PATH = os.path.join(CACHE_DIR, "concurrency.json")
+MAX_CONCURRENCY = 64
+ROUNDS_PER_LEVEL = 2 # Requests per level: this many times the concurrency
+MIN_GAIN = 1.1 # Doubling must bring at least 10% more tokens/sec
+MAX_LATENCY_FACTOR = 4.0 # p95 latency allowed, relative to one request at a time
+DEFAULT_PROMPT_TOKENS = 4000
+DEFAULT_MAX_TOKENS = 256
+REQUEST_TIMEOUT = 600
+# litellm provider prefixes the server doesn't know about
+LOCAL_PREFIXES = ("ollama/", "ollama_chat/", "openai/", "hosted_vllm/")
+
+_lock = threading.Lock()
+
+
+def server_model(model_name: str) -> str:
+    """Model name as the server knows it."""
+    for prefix in LOCAL_PREFIXES:
+        if model_name.startswith(prefix):
+            return model_name[len(prefix):]
+    return model_name
+
+def _key(model_name: str, base_url: str) -> str:
+    return f"{base_url.rstrip('/')} {server_model(model_name)}"
+
+def _load(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_calibration(model_name: str, base_url: str, path: str = CONCURRENCY_PATH) -> Optional[Dict]:
+    """Stored calibration of a model on a server, or None."""
+    with _lock:
+        return _load(path).get(_key(model_name, base_url))
+
+def save_calibration(model_name: str, base_url: str, calibration: Dict, path: str = CONCURRENCY_PATH):
+    with _lock:
+        calibrations = _load(path)
+        calibrations[_key(model_name, base_url)] = calibration
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.temp", "w") as f:
+            json.dump(calibrations, f, indent=2)
+        os.replace(f"{path}.temp", path)
+
+def tuned_backend_params(model_name: str, backend_params: Dict, path: str = CONCURRENCY_PATH) -> Dict:
+    """Backend params with the calibrated concurrency, for backends talking to a local server (unchanged if not calibrated)."""
+    if "base_url" not in backend_params:
+        return backend_params
+    calibration = load_calibration(model_name, backend_params["base_url"], path)
+    if calibration is None:
+        return backend_params
+    return {**backend_params, "max_concurrent_requests": calibration["max_concurrent_requests"]}
+
+
+# --- Measuring ---
+def _prompt(rng: random.Random, tokens: int) -> str:
+    """Random words, so the server can't answer from its prompt cache."""
+    words = [f"{rng.choice('bcdfghjklmnprstvz')}{rng.choice('aeiou')}{rng.choice('bcdfghjklmnprstvz')}" for _ in range(tokens)]
+    return "Summarize the following notes in a few paragraphs.\n\n" + " ".join(words)
+
+def _request(base_url: str, model: str, prompt: str, max_tokens: int) -> int:
+    """Send one chat completion and return the number of output tokens."""
+    body = json.dumps({
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+    }).encode("utf-8")
+    request = urllib.request.Request(
+        f"{base_url.rstrip('/')}/v1/chat/completions", data=body, headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        data = json.loads(response.read())
+    usage = data.get("usage") or {}
+    if usage.get("completion_tokens"):
+        return usage["completion_tokens"]
+    return estimate_tokens(len(data["choices"][0]["message"].get("content") or ""))
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(base_url: str, model: str, concurrency: int, prompt_tokens: int, max_tokens: int, seed: int = 0) -> Dict:
+    """Send ROUNDS_PER_LEVEL * concurrency requests, `concurrency` at a time, and measure them."""
+    rng = random.Random(seed)
+    prompts = [_prompt(rng, prompt_tokens) for _ in range(ROUNDS_PER_LEVEL * concurrency)]
+    latencies: List[float] = []
+    tokens, errors = [0], [0]
+    lock = threading.Lock()
+
+    def send(prompt: str):
+        started = time.monotonic()
+        try:
+            output = _request(base_url, model, prompt, max_tokens)
+        except Exception as e:
+            print(f"  Request failed at concurrency {concurrency}: {type(e).__name__}: {e}")
+            with lock:
+                errors[0] += 1
+            return
+        with lock:
+            latencies.append(time.monotonic() - started)
+            tokens[0] += output
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, prompts))
+    elapsed = time.monotonic() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(prompts),
+        "errors": errors[0],
+        "tokens_per_second": round(tokens[0] / elapsed, 2),
+        "p50_latency": round(_percentile(latencies, 0.5), 3) if latencies else None,
+        "p95_latency": round(_percentile(latencies, 0.95), 3) if latencies else None,
+    }
+
+
+def calibrate(
+    model_name: str,
+    base_url: str,
+    prompt_tokens: int = DEFAULT_PROMPT_TOKENS,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    max_concurrency: int = MAX_CONCURRENCY,
+    path: str = CONCURRENCY_PATH,
+) -> Dict:
+    """Find the knee of the throughput curve of a local model, store it and return the calibration."""
+    model = server_model(model_name)
+    print(f"Calibrating {model} on {base_url} ({prompt_tokens} prompt tokens, {max_tokens} output tokens per request)...")
+    # One untimed request loads the model, so the first level doesn't pay for it
+    _request(base_url, model, _prompt(random.Random(-1), 16), 1)
+
+    levels: List[Dict] = []
+    chosen = None
+    concurrency = 1
+    while concurrency <= max_concurrency:
+        level = measure(base_url, model, concurrency, prompt_tokens, max_tokens, seed=concurrency)
+        levels.append(level)
+        print(
+            f"  concurrency {concurrency}: {level['tokens_per_second']} tokens/s, "
+            f"p50 {level['p50_latency']}s, p95 {level['p95_latency']}s, {level['errors']} errors"
+        )
+        if level["errors"] or not level["p95_latency"]:
+            break
+        if chosen is not None:
+            if level["p95_latency"] > MAX_LATENCY_FACTOR * levels[0]["p95_latency"]:
+                break
+            if level["tokens_per_second"] < MIN_GAIN * chosen["tokens_per_second"]:
+                break
+        chosen = level
+        concurrency *= 2
+
+    if chosen is None:
+        raise RuntimeError(f"Calibration of {model} on {base_url} failed, see the errors above")
+    calibration = {
+        "max_concurrent_requests": chosen["concurrency"],
+        "tokens_per_second": chosen["tokens_per_second"],
+        "prompt_tokens": prompt_tokens,
+        "max_tokens": max_tokens,
+        "calibrated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "levels": levels,
+    }
+    save_calibration(model_name, base_url, calibration, path)
+    print(f"Chose max_concurrent_requests={chosen['concurrency']} for {model} ({chosen['tokens_per_second']} tokens/s), saved to {path}")
+    return calibration
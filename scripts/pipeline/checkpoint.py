@@ -0,0 +1,32 @@
+import os
+import json
+from typing import Dict, Iterable
+
+from pipeline.config import CHECKPOINT_DIR
+from pipeline.writer import close_writer, get_writer
+
+
+def legacy_checkpoint_path(entry_type: str, model_name: str) -> str:
+    """Path of the pre-store `.checkpoint_*` text file for an entry type and generator model."""
+    entry_slug = entry_type.replace("-", "_")
+    return os.path.join(CHECKPOINT_DIR, f".checkpoint_{entry_slug}_{model_name.replace('/', '_')}")
+
+def save_result(dataset_path: str, result: Dict):
+    """Queue a single result for the dataset file (group-committed, thread-safe)."""
+    try:
+        get_writer(dataset_path).write(result)
+    except Exception as e:
+        print(f"Error: Could not save result to {dataset_path}. Error: {e}\nResult: {result}")
+
+def rewrite_results(dataset_path: str, results: Iterable[Dict]) -> int:
+    """Atomically replace the dataset file with `results`."""
+    # Flush and drop any open writer, it would otherwise keep appending to the replaced file
+    close_writer(dataset_path)
+    temp_file = f"{dataset_path}.temp"
+    count = 0
+    with open(temp_file, "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+            count += 1
+    os.replace(temp_file, dataset_path)
+    return count
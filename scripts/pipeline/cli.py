@@ -0,0 +1,355 @@
+import os
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.backends import BACKENDS, get_backends
+from pipeline.batch import DEFAULT_MAX_ITEMS, DEFAULT_POLL_INTERVAL, check_batchable, configure_batch
+from pipeline.cache import configure_response_cache
+from pipeline.calibration import DEFAULT_MAX_TOKENS, DEFAULT_PROMPT_TOKENS, calibrate
+from pipeline.config import DATASET_PATH, DEFAULT_CHUNK_SIZE, ENTRY_TYPES, PROMPT_DIR, TOKENIZER_CACHE_PATH, ensure_dirs
+from pipeline.deadletter import DEFAULT_BACKOFF, DEFAULT_MAX_ATTEMPTS, configure_dead_letters, get_dead_letters, print_report
+from pipeline.dedup import DEFAULT_THRESHOLD, NEAR_DUPLICATE_MODES, NearDuplicateFilter
+from pipeline.mirror import get_mirror
+from pipeline.priority import DEFAULT_WINDOW, PRIORITY_MODES, YieldPrioritizer, default_window
+from pipeline.quality import DEFAULT_QUALITY_RETRIES
+from pipeline.selection import PaperSelection
+from pipeline.shards import Shard, merge_shards
+from pipeline.store import STORE_PATH
+from pipeline.telemetry import configure_telemetry, get_telemetry, serve_metrics
+from pipeline.writer import FSYNC_POLICIES, configure_writers, install_signal_handlers
+
+
+def output_paths(shard: Optional[Shard] = None) -> Tuple[str, str]:
+    """Dataset and checkpoint store paths of a run, or of one shard."""
+    if shard is None:
+        return DATASET_PATH, STORE_PATH
+    return shard.dataset_path(), shard.store_path()
+
+
+def generate_dataset(
+    backend_names: List[str],
+    limit: Optional[int] = 220,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    shuffle_buffer: Optional[int] = None,
+    seed: Optional[int] = None,
+    quotas: Optional[Dict[str, int]] = None,
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    shard: Optional[Shard] = None,
+    selection: Optional[PaperSelection] = None,
+    combined: bool = False,
+    near_duplicates: str = "off",
+    near_duplicate_threshold: float = DEFAULT_THRESHOLD,
+    priority: str = "stream",
+    priority_window: Optional[int] = None,
+):
+    """Generate dataset by processing papers with all given backends, saving incrementally."""
+    # Heavy imports (Curator, datasets, transformers) are only needed for an actual run
+    from pipeline.papers import DEFAULT_SHUFFLE_BUFFER, iter_papers
+    from pipeline.prompts import get_combined_prompt, get_prompts
+    from pipeline.scheduler import generate
+    from pipeline.store import get_store
+
+    ensure_dirs()
+    dataset_path, store_path = output_paths(shard)
+    if shard is not None:
+        # A shard only retries (and waits for) the dead letters of its own papers
+        configure_dead_letters(path=shard.dead_letters_path())
+    # Initialize empty dataset file if it doesn't exist
+    if not os.path.exists(dataset_path):
+        os.makedirs(os.path.dirname(dataset_path), exist_ok=True)
+        with open(dataset_path, "w") as _:
+            pass # Create empty file
+
+    backends = get_backends(backend_names)
+    prompts = get_prompts()
+    # Papers every open entry type is done for are dropped before their markdown is read
+    store = get_store(store_path)
+    models = [backend["name"] for backend in backends]
+    entry_types = [entry_type for entry_type in ENTRY_TYPES if (quotas or {}).get(entry_type) != 0]
+    selection = (selection or PaperSelection())._replace(
+        shard=shard, exclude=lambda arxiv_id: store.is_complete(arxiv_id, entry_types, models)
+    )
+    papers = iter_papers(limit=limit, buffer_size=shuffle_buffer or DEFAULT_SHUFFLE_BUFFER, seed=seed, selection=selection)
+    # Near-duplicates of earlier papers are dropped (or deferred) before any request is sent
+    near_duplicate_filter = NearDuplicateFilter(near_duplicates, near_duplicate_threshold)
+    papers = near_duplicate_filter(papers)
+    # With --priority yield, papers expected to give the most Suitable records per dollar (from past verification results) go first
+    templates = [get_combined_prompt()] if combined else [prompts[entry_type] for entry_type in entry_types]
+    window = priority_window or default_window(limit, chunk_size)
+    prioritizer = YieldPrioritizer(models, priority, templates, len(entry_types), window)
+    papers = prioritizer(papers)
+
+    workers = generate(
+        backends, papers, prompts, chunk_size=chunk_size, quotas=quotas, quality_retries=quality_retries,
+        dataset_path=dataset_path, store_path=store_path, combined=combined
+    )
+
+    print("\nDataset generation attempt complete.")
+    print(f"Results saved incrementally to {dataset_path}")
+    print(near_duplicate_filter.summary())
+    print(prioritizer.summary())
+    print_report(items=False)
+    for worker in workers:
+        print(f"Backend {worker.name}:")
+        for entry_type in worker.extractors:
+            print(f"  {entry_type}: expected {worker.expected[entry_type]}, Curator processed {worker.completed[entry_type]}, rejected by quality rules {worker.rejected[entry_type]}")
+    get_telemetry().print_summary()
+
+
+def reparse_output(workers: Optional[int] = None, shard: Optional[Shard] = None):
+    """Rebuild all journaled records with the current parse logic, without any API call."""
+    from pipeline.journal import reparse
+
+    ensure_dirs()
+    dataset_path, store_path = output_paths(shard)
+    reparse(dataset_path, store_path=store_path, workers=workers, shard=shard)
+
+
+def dry_run(backend_names: List[str], shard: Optional[Shard] = None):
+    """Show what a run would do without loading the tokenizer, prompts, Curator or the paper stream."""
+    from pipeline.prompts import PROMPT_FILES
+    from pipeline.store import get_store
+
+    backends = get_backends(backend_names)
+    for entry_type, filename in PROMPT_FILES.items():
+        path = os.path.join(PROMPT_DIR, filename)
+        status = f"{os.path.getsize(path)} bytes" if os.path.exists(path) else "MISSING"
+        print(f"Prompt {entry_type}: {path} ({status})")
+    print(f"Tokenizer cache: {TOKENIZER_CACHE_PATH} ({'present' if os.path.exists(TOKENIZER_CACHE_PATH) else 'not cached yet, will download'})")
+
+    mirror = get_mirror()
+    if mirror.exists:
+        print(f"Paper mirror: {mirror.synced} papers{' (the whole dataset)' if mirror.complete else ''} in {mirror.mirror_dir}")
+    else:
+        print("Paper mirror: none, papers will be streamed from the Hub")
+
+    _, store_path = output_paths(shard)
+    if shard is not None:
+        print(f"Shard {shard}: checkpoint store {store_path}")
+    store = get_store(store_path) if os.path.exists(store_path) else None
+    for backend in backends:
+        limits = {k: v for k, v in backend["backend_params"].items() if k != "api_key"}
+        print(f"Backend {backend['name']}: {backend['model_name']} via {backend['backend']} {limits}")
+        for entry_type in ENTRY_TYPES:
+            done = store.count_generated(entry_type, backend["name"]) if store else 0
+            print(f"  {entry_type}: {done} papers already generated")
+
+
+def calibrate_backends(backend_names: List[str], prompt_tokens: int = DEFAULT_PROMPT_TOKENS, max_tokens: int = DEFAULT_MAX_TOKENS):
+    """Calibrate the concurrency of every selected backend that runs on a local server."""
+    for backend in get_backends(backend_names):
+        base_url = backend["backend_params"].get("base_url")
+        if base_url is None:
+            print(f"Backend {backend['name']}: hosted API, paced by the rate limiter instead, skipping")
+            continue
+        calibrate(backend["model_name"], base_url, prompt_tokens, max_tokens)
+
+
+def rebuild_output(shard: Optional[Shard] = None):
+    """Rewrite zraw.jsonl from the checkpoint store, e.g. after a crash lost appended lines."""
+    from pipeline.checkpoint import rewrite_results
+    from pipeline.store import get_store
+
+    ensure_dirs()
+    dataset_path, store_path = output_paths(shard)
+    count = rewrite_results(dataset_path, get_store(store_path).iter_generations())
+    print(f"Rebuilt {dataset_path} with {count} records from the checkpoint store.")
+
+
+def parse_quota(value: str) -> Tuple[str, int]:
+    """argparse type for ENTRY_TYPE=N."""
+    entry_type, _, count = value.partition("=")
+    if entry_type not in ENTRY_TYPES or not count.isdigit():
+        raise argparse.ArgumentTypeError(f"expected ENTRY_TYPE=N with ENTRY_TYPE one of {ENTRY_TYPES}, got '{value}'")
+    return entry_type, int(count)
+
+def parse_shard(value: str) -> Shard:
+    """argparse type for i/n (0 <= i < n)."""
+    index, _, count = value.partition("/")
+    if not index.isdigit() or not count.isdigit() or not int(index) < int(count):
+        raise argparse.ArgumentTypeError(f"expected i/n with 0 <= i < n, got '{value}'")
+    return Shard(int(index), int(count))
+
+def add_selection_arguments(parser: argparse.ArgumentParser):
+    """Metadata filters applied before any paper markdown is read (see pipeline/selection.py)."""
+    parser.add_argument('--categories', nargs='+', default=None, metavar='CATEGORY',
+                        help='Only papers in any of these arXiv categories (e.g. cs.CL q-bio.NC)')
+    parser.add_argument('--published-after', default=None, metavar='DATE',
+                        help='Only papers published on or after this ISO date (e.g. 2024-01-01)')
+    parser.add_argument('--published-before', default=None, metavar='DATE',
+                        help='Only papers published before this ISO date')
+    parser.add_argument('--updated-after', default=None, metavar='DATE',
+                        help='Only papers updated on or after this ISO date')
+    parser.add_argument('--updated-before', default=None, metavar='DATE',
+                        help='Only papers updated before this ISO date')
+
+def selection_from_args(args: argparse.Namespace) -> PaperSelection:
+    return PaperSelection(
+        categories=tuple(args.categories or ()),
+        published_after=args.published_after,
+        published_before=args.published_before,
+        updated_after=args.updated_after,
+        updated_before=args.updated_before,
+    )
+
+def build_parser(description: str = "Generate reasoning chains with one or more backends.") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--backends', nargs='+', default=["gemini"], choices=sorted(BACKENDS),
+                        help='Backends to generate with; papers are shared between them')
+    parser.add_argument('--limit', type=int, default=220,
+                        help='Maximum number of papers to read from the stream, the filters below apply within them (<= 0 for no limit)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help=f'Papers handed to a backend per Curator call or batch job (default: {DEFAULT_CHUNK_SIZE}, or --batch-max-items with --batch)')
+    parser.add_argument('--quota', type=parse_quota, action='append', default=[], metavar='ENTRY_TYPE=N',
+                        help='Maximum papers to schedule for an entry type in this run (repeatable, 0 skips the type)')
+    parser.add_argument('--quality-retries', type=int, default=DEFAULT_QUALITY_RETRIES,
+                        help='Times a paper is sent again after its response fails the quality rules')
+    parser.add_argument('--combined', action='store_true',
+                        help='Request both entry types of a paper in one call, sending the paper text once')
+    parser.add_argument('--near-duplicates', choices=NEAR_DUPLICATE_MODES, default='off',
+                        help='What to do with papers nearly duplicating an earlier one (MinHash over the markdown): skip them, defer them to the end of the stream, or keep them (off, the default)')
+    parser.add_argument('--near-duplicate-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Estimated Jaccard similarity of word shingles from which papers are near-duplicates')
+    parser.add_argument('--priority', choices=PRIORITY_MODES, default='stream',
+                        help='Order of the papers: the shuffled stream order, or by expected Suitable records per dollar from data/jsonls/zverified.jsonl (yield)')
+    parser.add_argument('--priority-window', type=int, default=None,
+                        help=f'Papers held in memory to pick the highest-yield one from (default: a quarter of --limit, at most {DEFAULT_WINDOW})')
+    add_selection_arguments(parser)
+    parser.add_argument('--shuffle-buffer', type=int, default=None,
+                        help='Papers held in memory for shuffling the stream (default: 256)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the paper order (random if not given)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the backends, prompts and progress without generating anything')
+    parser.add_argument('--rebuild-output', action='store_true',
+                        help='Rewrite zraw.jsonl from the checkpoint store and exit')
+    parser.add_argument('--reparse', action='store_true',
+                        help='Re-parse the raw response journal into zraw.jsonl and exit (no API calls)')
+    parser.add_argument('--shard', type=parse_shard, default=None, metavar='I/N',
+                        help='Only process the papers whose arxiv_id hashes to shard I of N, with their own output files')
+    parser.add_argument('--sync-mirror', action='store_true',
+                        help='Download the first --limit papers (<= 0 for all) into the local mirror and exit')
+    parser.add_argument('--merge-shards', action='store_true',
+                        help='Merge the shard checkpoint stores into the main one, rebuild zraw.jsonl and exit')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes used by --reparse (default: all cores)')
+    parser.add_argument('--flush-records', type=int, default=None,
+                        help='Records buffered before zraw.jsonl is appended to (default: 64)')
+    parser.add_argument('--flush-interval', type=float, default=None,
+                        help='Maximum seconds a record stays buffered (default: 2)')
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help='Always send requests, neither replaying nor storing cached responses')
+    parser.add_argument('--response-cache-gb', type=float, default=None,
+                        help='Size of the response cache before old responses are evicted (default: 2)')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=None,
+                        help='When to fsync the output files (default: none)')
+    parser.add_argument('--batch', action='store_true',
+                        help="Send requests through the provider's batch API (cheaper, results within 24h) instead of Curator")
+    parser.add_argument('--batch-base-url', default=None, metavar='URL',
+                        help='Send batch jobs to this OpenAI-compatible server instead of the provider (e.g. a local fake server)')
+    parser.add_argument('--batch-max-items', type=int, default=DEFAULT_MAX_ITEMS,
+                        help='Requests per batch job')
+    parser.add_argument('--batch-poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between batch job status checks')
+    parser.add_argument('--dead-letter-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='Attempts before a paper that never gets a response is given up on')
+    parser.add_argument('--dead-letter-backoff', type=float, default=DEFAULT_BACKOFF,
+                        help='Seconds before a paper without response is sent again, doubled after every failure')
+    parser.add_argument('--dead-letter-report', action='store_true',
+                        help='Print the papers given up on per model (and the pending retries) and exit')
+    parser.add_argument('--retry-dead-letters', action='store_true',
+                        help='Give the papers given up on a fresh set of attempts in this run')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Find and store the best max_concurrent_requests of the local (base_url) backends and exit')
+    parser.add_argument('--calibration-prompt-tokens', type=int, default=DEFAULT_PROMPT_TOKENS,
+                        help='Prompt length of the calibration requests (use the context length you generate with)')
+    parser.add_argument('--calibration-max-tokens', type=int, default=DEFAULT_MAX_TOKENS,
+                        help='Output tokens per calibration request')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve request metrics in the Prometheus text format on this port')
+    parser.add_argument('--no-metrics-log', action='store_true',
+                        help='Do not write per-request events to data/metrics')
+    return parser
+
+def main(argv: Optional[List[str]] = None, default_backends: Optional[List[str]] = None):
+    """Parse command line arguments and run the generation."""
+    parser = build_parser()
+    if default_backends:
+        parser.set_defaults(backends=default_backends)
+    args = parser.parse_args(argv)
+
+    configure_writers(max_records=args.flush_records, max_delay=args.flush_interval, fsync=args.fsync)
+    configure_response_cache(
+        enabled=not args.no_response_cache,
+        max_bytes=int(args.response_cache_gb * 1024 ** 3) if args.response_cache_gb is not None else None
+    )
+    configure_telemetry(log_events=not args.no_metrics_log)
+    configure_batch(
+        enabled=args.batch, base_url=args.batch_base_url,
+        max_items=args.batch_max_items, poll_interval=args.batch_poll_interval
+    )
+    configure_dead_letters(
+        max_attempts=args.dead_letter_attempts, backoff=args.dead_letter_backoff,
+        path=args.shard.dead_letters_path() if args.shard else None
+    )
+    install_signal_handlers()
+
+    if args.dry_run:
+        dry_run(args.backends, args.shard)
+        return
+
+    if args.sync_mirror:
+        get_mirror().sync(args.limit if args.limit > 0 else None)
+        return
+
+    if args.calibrate:
+        calibrate_backends(args.backends, args.calibration_prompt_tokens, args.calibration_max_tokens)
+        return
+
+    if args.dead_letter_report:
+        print_report()
+        return
+
+    if args.merge_shards:
+        ensure_dirs()
+        merge_shards(DATASET_PATH, STORE_PATH)
+        return
+
+    if args.reparse:
+        reparse_output(args.workers, args.shard)
+        return
+
+    if args.rebuild_output:
+        rebuild_output(args.shard)
+        return
+
+    if args.batch:
+        try:
+            for backend in get_backends(args.backends):
+                check_batchable(backend["model_name"])
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.retry_dead_letters:
+        count = get_dead_letters().reset([backend["name"] for backend in get_backends(args.backends)])
+        print(f"Dead-letter queue: {count} given-up papers will be retried")
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    generate_dataset(
+        backend_names=args.backends,
+        limit=args.limit if args.limit > 0 else None,
+        chunk_size=args.chunk_size or (args.batch_max_items if args.batch else DEFAULT_CHUNK_SIZE),
+        shuffle_buffer=args.shuffle_buffer,
+        seed=args.seed,
+        quotas=dict(args.quota),
+        quality_retries=args.quality_retries,
+        shard=args.shard,
+        selection=selection_from_args(args),
+        combined=args.combined,
+        near_duplicates=args.near_duplicates,
+        near_duplicate_threshold=args.near_duplicate_threshold,
+        priority=args.priority,
+        priority_window=args.priority_window
+    )
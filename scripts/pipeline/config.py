@@ -0,0 +1,39 @@
+import os
+
+# --- Paths ---
+# All paths are relative to the repository root, which is where the scripts are run from.
+DATASET_DIR = "data/jsonls"
+DATASET_PATH = os.path.join(DATASET_DIR, "zraw.jsonl")
+# Merged verification results (see scripts/data_processing/merge_verifiers.py)
+VERIFIED_PATH = os.path.join(DATASET_DIR, "zverified.jsonl")
+CHECKPOINT_DIR = "data/checkpoints"
+CACHE_DIR = "data/cache"
+JOURNAL_DIR = "data/journal"
+METRICS_DIR = "data/metrics"
+# Local copy of the arxiv-markdown dataset (see pipeline/mirror.py)
+MIRROR_DIR = os.path.join(CACHE_DIR, "arxiv-markdown")
+# Metadata (with PDF URLs) of local papers that are not in arxiv-markdown, and where they are converted to
+LOCAL_METADATA_PATH = "data/arxiv_metadata_nlin.jsonl"
+LOCAL_PAPERS_DIR = os.path.join(CACHE_DIR, "local-papers") # Same layout as the mirror (see pipeline/conversion.py)
+PROMPT_DIR = "prompts"
+
+# --- Tokenizer used for the avg_thinking_tokens statistic ---
+TOKENIZER_NAME = "unsloth/gemma-3-27b-it"
+# Serialized fast tokenizer, written on first download so later runs load it offline
+TOKENIZER_CACHE_PATH = os.path.join(CACHE_DIR, "tokenizers", f"{TOKENIZER_NAME.replace('/', '_')}.json")
+
+# --- Entry types ---
+ENTRY_TYPES = ["multi-short", "single-long"]
+# Requests for both entry types at once (--combined), split into one record per type
+COMBINED_ENTRY_TYPE = "combined"
+# Field of the combined response holding each entry type's conversation
+COMBINED_FIELDS = {"multi-short": "multi_short", "single-long": "single_long"}
+
+# Number of papers handed to a backend per Curator call
+DEFAULT_CHUNK_SIZE = 16
+
+
+def ensure_dirs():
+    """Create the output and checkpoint directories if they don't exist."""
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
@@ -0,0 +1,255 @@
+"""
+Parallel, cached PDF-to-markdown conversion for papers outside arxiv-markdown.
+
+docling is by far the slowest CPU step of adding local papers, so
+`convert_to_store` runs it in a process pool (one converter per process,
+all cores by default) and writes the converted papers into a local paper
+store: a `PaperMirror` under data/cache/local-papers, in the same layout as
+the arxiv-markdown mirror, which `curator_ollama.py` reads from.
+`iter_converted_to_store` does the same but yields every paper as soon as its
+conversion finishes, so generation starts with the first converted PDF.
+
+Markdown is cached in data/cache/pdf-markdown.sqlite by the SHA-256 of the
+PDF bytes, so a PDF is never converted twice, even under another URL or
+arxiv_id; each source (URL or path) also remembers the hash of its content,
+so known sources aren't even downloaded again. Conversions are saved as they
+finish, so an interrupted run loses at most the PDFs being converted.
+"""
+
+import os
+import io
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import urllib.request
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pipeline.config import CACHE_DIR, LOCAL_PAPERS_DIR
+from pipeline.mirror import ROWS_PER_PART, PaperMirror, get_mirror
+from pipeline.store import _Transaction
+
+PDF_CACHE_PATH = os.path.join(CACHE_DIR, "pdf-markdown.sqlite")
+DOWNLOAD_TIMEOUT = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pdfs (
+    sha256 TEXT PRIMARY KEY,
+    markdown BLOB NOT NULL, -- zlib-compressed
+    seconds REAL NOT NULL, -- Conversion time
+    converted_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY, -- URL or path the PDF was read from
+    sha256 TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class ConversionCache:
+    """Converted markdown by PDF content hash, and the content hash of every source seen."""
+
+    def __init__(self, path: str = PDF_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def has(self, sha256: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM pdfs WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+    def get(self, sha256: str) -> Optional[str]:
+        row = self._conn.execute("SELECT markdown FROM pdfs WHERE sha256 = ?", (sha256,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def put(self, sha256: str, markdown: str, seconds: float):
+        with _Transaction(self._conn) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pdfs (sha256, markdown, seconds, converted_at) VALUES (?, ?, ?, ?)",
+                (sha256, zlib.compress(markdown.encode("utf-8")), seconds, time.time())
+            )
+
+    def source_hash(self, source: str) -> Optional[str]:
+        row = self._conn.execute("SELECT sha256 FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def remember_source(self, source: str, sha256: str):
+        with _Transaction(self._conn) as conn:
+            conn.execute("INSERT OR REPLACE INTO sources (source, sha256) VALUES (?, ?)", (source, sha256))
+
+
+def pdf_source(paper: Dict) -> str:
+    """Local path or URL of a paper's PDF (`pdf_path` wins over `pdf_url`)."""
+    return paper.get("pdf_path") or paper["pdf_url"]
+
+def read_pdf(source: str) -> bytes:
+    if os.path.exists(source):
+        with open(source, "rb") as f:
+            return f.read()
+    request = urllib.request.Request(source, headers={"User-Agent": "academic-chains"})
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+        return response.read()
+
+def item_from_metadata(paper: Dict, markdown: str) -> Dict:
+    """A local metadata row as a row of the paper store (the arxiv-markdown layout)."""
+    categories = paper.get("categories") or []
+    return {
+        "arxiv_id": paper.get("arxiv_id", ""),
+        "markdown": markdown,
+        "paper_doi": paper.get("doi") or None,
+        "paper_authors": [str(author) for author in paper.get("authors") or []],
+        "paper_published_date": paper.get("published_date") or None,
+        "paper_updated_date": paper.get("updated_date") or None,
+        "categories": categories.split() if isinstance(categories, str) else list(categories),
+    }
+
+def store_schema():
+    """Arrow schema of the local paper store, so parts agree even when a column is empty in the first one."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("arxiv_id", pa.string()),
+        ("markdown", pa.string()),
+        ("paper_doi", pa.string()),
+        ("paper_authors", pa.list_(pa.string())),
+        ("paper_published_date", pa.string()),
+        ("paper_updated_date", pa.string()),
+        ("categories", pa.list_(pa.string())),
+    ])
+
+
+# --- Worker processes ---
+_worker: Dict = {}
+
+def _init_worker(cache_path: str):
+    # The pool already spreads the PDFs over the cores, more threads per process would only contend
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    _worker["cache"] = ConversionCache(cache_path)
+
+def _converter():
+    """docling converter of this process, created on first use (it loads its layout models)."""
+    if "converter" not in _worker:
+        from docling.document_converter import DocumentConverter
+
+        _worker["converter"] = DocumentConverter()
+    return _worker["converter"]
+
+def _convert(source: str) -> Tuple[str, Optional[str], Optional[str], float, Optional[str]]:
+    """(source, sha256, markdown, seconds, error); markdown is None if the content was already converted."""
+    try:
+        from docling.datamodel.base_models import DocumentStream
+
+        data = read_pdf(source)
+        sha256 = hashlib.sha256(data).hexdigest()
+        if _worker["cache"].has(sha256):
+            return source, sha256, None, 0.0, None
+        started = time.monotonic()
+        result = _converter().convert(DocumentStream(name=f"{sha256}.pdf", stream=io.BytesIO(data)))
+        return source, sha256, result.document.export_to_markdown(), time.monotonic() - started, None
+    except Exception as e:
+        return source, None, None, 0.0, f"{type(e).__name__}: {e}"
+
+
+def convert_pdfs(papers: Iterable[Dict], workers: Optional[int] = None, cache_path: str = PDF_CACHE_PATH) -> Iterator[Tuple[Dict, str]]:
+    """Yield (paper, markdown) as PDFs are converted, cached ones first; papers whose PDF fails are skipped."""
+    cache = ConversionCache(cache_path)
+    pending: Dict[str, List[Dict]] = {}
+    for paper in papers:
+        source = pdf_source(paper)
+        sha256 = cache.source_hash(source)
+        markdown = cache.get(sha256) if sha256 else None
+        if markdown is not None:
+            yield paper, markdown
+        else:
+            # Papers sharing a source are converted once
+            pending.setdefault(source, []).append(paper)
+    if not pending:
+        return
+
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    print(f"Converting {len(pending)} PDFs with {workers} processes...")
+    converted, seconds = 0, 0.0
+    # Spawned workers: forking after torch or docling started threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(cache_path,)) as pool:
+        futures = [pool.submit(_convert, source) for source in pending]
+        try:
+            for future in as_completed(futures):
+                source, sha256, markdown, elapsed, error = future.result()
+                if error is not None:
+                    print(f"Error converting {source}: {error}")
+                    continue
+                if markdown is not None:
+                    cache.put(sha256, markdown, elapsed)
+                    converted += 1
+                    seconds += elapsed
+                else:
+                    markdown = cache.get(sha256)
+                cache.remember_source(source, sha256)
+                for paper in pending[source]:
+                    yield paper, markdown
+        finally:
+            # A caller that stops early (e.g. at its quota) only waits for the PDFs already being converted
+            for future in futures:
+                future.cancel()
+    if converted:
+        print(f"Converted {converted} PDFs ({seconds / converted:.1f}s each on average)")
+
+
+def get_local_papers(store_dir: str = LOCAL_PAPERS_DIR) -> PaperMirror:
+    """The local paper store converted papers are written to."""
+    return get_mirror(store_dir)
+
+def convert_to_store(
+    papers: Iterable[Dict],
+    workers: Optional[int] = None,
+    store: Optional[PaperMirror] = None,
+    cache_path: str = PDF_CACHE_PATH,
+) -> int:
+    """Convert the papers that aren't in the local paper store yet and add them to it; returns how many were added."""
+    return sum(1 for _ in iter_converted_to_store(papers, workers, store, cache_path))
+
+def iter_converted_to_store(
+    papers: Iterable[Dict],
+    workers: Optional[int] = None,
+    store: Optional[PaperMirror] = None,
+    cache_path: str = PDF_CACHE_PATH,
+) -> Iterator[Dict]:
+    """Convert the papers that aren't in the local paper store yet and yield their store rows as the conversions finish.
+
+    The rows are added to the store a part at a time, and the rest when the iteration ends or is stopped.
+    """
+    # An empty store is falsy (PaperMirror has a length)
+    store = store if store is not None else get_local_papers()
+    stored = store.arxiv_ids()
+    todo = [paper for paper in papers if paper.get("arxiv_id", "") not in stored]
+    if not todo:
+        print(f"All papers are already in the local paper store ({len(store)} papers).")
+        return
+    buffer, added = [], 0
+    try:
+        for paper, markdown in convert_pdfs(todo, workers, cache_path):
+            item = item_from_metadata(paper, markdown)
+            buffer.append(item)
+            if len(buffer) == ROWS_PER_PART:
+                added += store.append(buffer, store_schema())
+                buffer = []
+            yield item
+    finally:
+        added += store.append(buffer, store_schema())
+        print(f"Local paper store holds {len(store)} papers ({added} added) in {store.mirror_dir}.")
@@ -0,0 +1,199 @@
+"""
+Dead-letter queue for papers a backend never answered.
+
+Curator drops requests that keep failing (timeouts, server errors, invalid
+responses) without raising, and a failing call loses its whole batch; those
+papers used to be retried only by re-running the script over the whole
+stream. `BackendWorker` now records every paper (per entry type) that got
+neither an accepted nor a rejected response, with the error class, in
+data/checkpoints/dead_letters.sqlite, keeping the paper row itself so it can
+be sent again without the stream.
+
+Every failure schedules the next attempt with exponential backoff; after
+`max_attempts` failures the paper is given up on (status "failed") and shows
+up in the report. `pipeline.scheduler` retries due papers while a run is
+going and, before finishing, waits for the pending ones; papers still
+pending when a run is interrupted are retried at the start of the next one.
+A paper answered in any way is removed from the queue. Every shard (see
+`pipeline.shards`) has its own queue next to its store, so a shard only ever
+retries, or waits for, its own papers.
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from pipeline.config import CHECKPOINT_DIR
+from pipeline.store import _Transaction
+
+DEAD_LETTERS_PATH = os.path.join(CHECKPOINT_DIR, "dead_letters.sqlite")
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BACKOFF = 30.0 # Seconds before the first retry, doubled after every failure
+MAX_BACKOFF = 15 * 60.0
+DROPPED = "Dropped" # Error class of papers Curator returned no response for, without raising
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    arxiv_id TEXT NOT NULL,
+    entry_type TEXT NOT NULL,
+    model TEXT NOT NULL,
+    paper BLOB NOT NULL, -- zlib-compressed JSON of the paper row
+    error TEXT NOT NULL,
+    message TEXT,
+    attempts INTEGER NOT NULL,
+    status TEXT NOT NULL, -- pending or failed
+    next_attempt REAL NOT NULL,
+    first_failed_at REAL NOT NULL,
+    last_failed_at REAL NOT NULL,
+    PRIMARY KEY (arxiv_id, entry_type, model)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS dead_letters_due ON dead_letters (model, status, next_attempt);
+"""
+
+_settings = {"max_attempts": DEFAULT_MAX_ATTEMPTS, "backoff": DEFAULT_BACKOFF, "path": DEAD_LETTERS_PATH}
+
+def configure_dead_letters(max_attempts: Optional[int] = None, backoff: Optional[float] = None, path: Optional[str] = None):
+    """Change the attempt limit, the initial backoff or the queue used by default (e.g. a shard's)."""
+    if max_attempts is not None:
+        _settings["max_attempts"] = max_attempts
+    if backoff is not None:
+        _settings["backoff"] = backoff
+    if path is not None:
+        _settings["path"] = path
+
+def backoff_for(attempts: int) -> float:
+    """Delay before the next attempt after `attempts` failures."""
+    return min(MAX_BACKOFF, _settings["backoff"] * 2 ** (attempts - 1))
+
+
+class DeadLetterQueue:
+    """Failed (paper, entry type, model) items in SQLite, with their attempts and next retry time."""
+
+    def __init__(self, path: str = DEAD_LETTERS_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record_failures(self, model: str, failures: Iterable[Tuple[Dict, str]], error: str, message: Optional[str] = None) -> int:
+        """Record a failed attempt for every (paper, entry_type); returns how many were given up on."""
+        now = time.time()
+        given_up = 0
+        with _Transaction(self._conn) as conn:
+            for paper, entry_type in failures:
+                key = (paper["arxiv_id"], entry_type, model)
+                row = conn.execute(
+                    "SELECT attempts, first_failed_at FROM dead_letters WHERE arxiv_id = ? AND entry_type = ? AND model = ?", key
+                ).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                status = "failed" if attempts >= _settings["max_attempts"] else "pending"
+                given_up += status == "failed"
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters (arxiv_id, entry_type, model, paper, error, message, attempts, status, "
+                    "next_attempt, first_failed_at, last_failed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (
+                        zlib.compress(json.dumps(paper).encode("utf-8")), error, message, attempts, status,
+                        now + backoff_for(attempts), row[1] if row else now, now
+                    )
+                )
+        return given_up
+
+    def resolve(self, model: str, answered: Iterable[Tuple[str, str]]):
+        """Drop the (arxiv_id, entry_type) items that got a response."""
+        keys = [(arxiv_id, entry_type, model) for arxiv_id, entry_type in answered]
+        if keys:
+            with _Transaction(self._conn) as conn:
+                conn.executemany("DELETE FROM dead_letters WHERE arxiv_id = ? AND entry_type = ? AND model = ?", keys)
+
+    def due(self, model: str, limit: int, now: Optional[float] = None) -> List[Tuple[str, Dict]]:
+        """Up to `limit` pending (entry_type, paper) items of `model` whose retry time has come."""
+        rows = self._conn.execute(
+            "SELECT entry_type, paper FROM dead_letters WHERE model = ? AND status = 'pending' AND next_attempt <= ? "
+            "ORDER BY next_attempt LIMIT ?",
+            (model, time.time() if now is None else now, limit)
+        )
+        return [(entry_type, json.loads(zlib.decompress(paper))) for entry_type, paper in rows]
+
+    def next_attempt(self, model: str) -> Optional[float]:
+        """When the next pending item of `model` is due, or None if none is pending."""
+        return self._conn.execute(
+            "SELECT MIN(next_attempt) FROM dead_letters WHERE model = ? AND status = 'pending'", (model,)
+        ).fetchone()[0]
+
+    def open_for(self, arxiv_id: str) -> Set[Tuple[str, str]]:
+        """(entry_type, model) pairs of a paper that are pending or were given up on."""
+        return set(self._conn.execute("SELECT entry_type, model FROM dead_letters WHERE arxiv_id = ?", (arxiv_id,)))
+
+    def reset(self, models: Optional[List[str]] = None) -> int:
+        """Make given-up items pending again with a fresh attempt count; returns how many."""
+        query = "UPDATE dead_letters SET status = 'pending', attempts = 0, next_attempt = 0 WHERE status = 'failed'"
+        params: Tuple = ()
+        if models:
+            query += f" AND model IN ({', '.join('?' * len(models))})"
+            params = tuple(models)
+        with _Transaction(self._conn) as conn:
+            return conn.execute(query, params).rowcount
+
+    def report(self) -> Dict[str, Dict]:
+        """Per model: pending count, and the given-up items by error class."""
+        report: Dict[str, Dict] = {}
+        for model, status, error, count in self._conn.execute(
+            "SELECT model, status, error, COUNT(*) FROM dead_letters GROUP BY model, status, error ORDER BY model, error"
+        ):
+            entry = report.setdefault(model, {"pending": 0, "failed": {}, "items": []})
+            if status == "pending":
+                entry["pending"] += count
+            else:
+                entry["failed"][error] = count
+        for model, arxiv_id, entry_type, error, message, attempts in self._conn.execute(
+            "SELECT model, arxiv_id, entry_type, error, message, attempts FROM dead_letters WHERE status = 'failed' "
+            "ORDER BY model, last_failed_at"
+        ):
+            report[model]["items"].append({
+                "arxiv_id": arxiv_id, "entry_type": entry_type, "error": error, "message": message, "attempts": attempts
+            })
+        return report
+
+
+_queues: Dict[str, DeadLetterQueue] = {}
+_queues_lock = threading.Lock()
+
+def get_dead_letters(path: Optional[str] = None) -> DeadLetterQueue:
+    """Process-wide dead-letter queue for `path` (the configured one by default)."""
+    path = path or _settings["path"]
+    with _queues_lock:
+        if path not in _queues:
+            _queues[path] = DeadLetterQueue(path)
+        return _queues[path]
+
+
+def print_report(path: Optional[str] = None, items: bool = True):
+    """Print the permanent failures (and pending retries) per model."""
+    report = get_dead_letters(path).report()
+    if not report:
+        print("Dead-letter queue: empty")
+        return
+    print("Dead-letter queue:")
+    for model, entry in report.items():
+        given_up = sum(entry["failed"].values())
+        errors = ", ".join(f"{error} {count}" for error, count in entry["failed"].items())
+        print(f"  {model}: {entry['pending']} pending, {given_up} failed permanently{f' ({errors})' if errors else ''}")
+        if items:
+            for item in entry["items"]:
+                message = f": {item['message']}" if item["message"] else ""
+                print(f"    {item['arxiv_id']} {item['entry_type']} after {item['attempts']} attempts, {item['error']}{message}")
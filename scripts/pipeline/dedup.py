@@ -0,0 +1,258 @@
+"""
+Near-duplicate detection on paper markdown, before any request is sent.
+
+The paper stream can hold several versions of the same work, or heavily
+overlapping papers, which the arxiv_id checkpoints don't catch. Every paper
+gets a MinHash signature over its word shingles; signatures are split into
+LSH bands, and papers sharing a band bucket are compared on their estimated
+Jaccard similarity. A paper at or above the threshold with a paper indexed
+before it is a near-duplicate of that paper.
+
+The index lives in SQLite under data/checkpoints and grows incrementally:
+only papers that are not near-duplicates are added to the LSH buckets (so
+chains of small edits don't drift away from the original), and the verdict
+signature of every paper is stored, so later runs only compare it again
+(e.g. after a threshold change) instead of re-shingling the markdown.
+Signatures are computed with numpy, one paper at a time, on the thread
+reading the stream.
+
+`NearDuplicateFilter` wraps the paper stream in `generate_dataset()` when
+asked to (`--near-duplicates`): near-duplicates are skipped, or deferred to
+the end of the stream so they only use whatever quota distinct papers left.
+At most MAX_DEFERRED papers are held for the end, like the shuffle buffer;
+later ones are skipped. It is off by default because a paper is indexed when
+it is read, before its units are generated: if a run stops (or its requests
+fail) before then, its near-duplicates are still skipped in later runs.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pipeline.config import CHECKPOINT_DIR
+from pipeline.store import _Transaction
+
+NEAR_DUPLICATES_PATH = os.path.join(CHECKPOINT_DIR, "near_duplicates.sqlite")
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16 # 8 rows per band: pairs above ~0.7 similarity very likely share a bucket
+DEFAULT_THRESHOLD = 0.8
+MAX_DEFERRED = 256 # Near-duplicates held in memory until the end of the stream in "defer" mode
+SEED = 1
+SHINGLE_BLOCK = 4096 # Shingles hashed against all permutations at once, bounds memory on long papers
+NEAR_DUPLICATE_MODES = ("skip", "defer", "off")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS papers (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    arxiv_id TEXT NOT NULL UNIQUE,
+    signature BLOB NOT NULL,
+    duplicate_of TEXT,
+    similarity REAL
+);
+
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, seq)
+) WITHOUT ROWID;
+"""
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> List[str]:
+    """Overlapping `size`-word shingles of the lowercased text (the whole text if it is shorter)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class MinHasher:
+    """MinHash signatures with NUM_PERM universal hash permutations."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = SEED):
+        import numpy as np
+
+        self.np = np
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str):
+        np = self.np
+        hashes = np.fromiter(
+            {int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles(text)},
+            dtype=np.uint64
+        )
+        signature = np.full(len(self.a), _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), SHINGLE_BLOCK):
+            block = hashes[start:start + SHINGLE_BLOCK, None]
+            permuted = ((block * self.a + self.b) % np.uint64(_MERSENNE_PRIME)) & np.uint64(_MAX_HASH)
+            signature = np.minimum(signature, permuted.min(axis=0))
+        return signature.astype(np.uint32)
+
+    def similarity(self, left, right) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return float((left == right).mean())
+
+    def buckets(self, signature) -> List[int]:
+        """One bucket per band: a 64-bit hash of the band's rows (signed, to fit an SQLite INTEGER)."""
+        return [
+            int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), "little", signed=True)
+            for band in self.np.array_split(signature, BANDS)
+        ]
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash/LSH index of the papers seen so far."""
+
+    def __init__(self, path: str = NEAR_DUPLICATES_PATH, threshold: float = DEFAULT_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+        self._check_params()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _check_params(self):
+        """Signatures from other shingling/hashing settings can't be compared; start over if they changed."""
+        params = json.dumps({"shingle_words": SHINGLE_WORDS, "num_perm": NUM_PERM, "bands": BANDS, "seed": SEED})
+        with _Transaction(self._conn) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'params'").fetchone()
+            if row is not None and row[0] != params:
+                print(f"Near-duplicate index settings changed, clearing {self.path}")
+                conn.execute("DELETE FROM papers")
+                conn.execute("DELETE FROM buckets")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('params', ?)", (params,))
+
+    def check(self, arxiv_id: str, text: str) -> Tuple[Optional[str], float]:
+        """(arxiv_id of the paper this one nearly duplicates, similarity), or (None, 0.0); indexes the paper."""
+        np = self.hasher.np
+        row = self._conn.execute("SELECT seq, signature, duplicate_of FROM papers WHERE arxiv_id = ?", (arxiv_id,)).fetchone()
+        if row is not None:
+            # Known paper: no shingling needed, but compared again in case the threshold changed
+            signature = np.frombuffer(row[1], dtype=np.uint32)
+            duplicate_of, similarity = self._match(self._conn, signature, self.hasher.buckets(signature), before=row[0])
+            if duplicate_of != row[2]:
+                self._conn.execute(
+                    "UPDATE papers SET duplicate_of = ?, similarity = ? WHERE seq = ?",
+                    (duplicate_of, similarity if duplicate_of else None, row[0])
+                )
+            return duplicate_of, similarity
+        signature = self.hasher.signature(text)
+        buckets = self.hasher.buckets(signature)
+        with _Transaction(self._conn) as conn:
+            # Looked up again inside the write lock, another process may have indexed it meanwhile
+            row = conn.execute("SELECT seq FROM papers WHERE arxiv_id = ?", (arxiv_id,)).fetchone()
+            if row is not None:
+                return self._match(conn, signature, buckets, before=row[0])
+            duplicate_of, similarity = self._match(conn, signature, buckets)
+            seq = conn.execute(
+                "INSERT INTO papers (arxiv_id, signature, duplicate_of, similarity) VALUES (?, ?, ?, ?)",
+                (arxiv_id, signature.tobytes(), duplicate_of, similarity if duplicate_of else None)
+            ).lastrowid
+            if duplicate_of is None:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO buckets (band, bucket, seq) VALUES (?, ?, ?)",
+                    [(band, bucket, seq) for band, bucket in enumerate(buckets)]
+                )
+        return duplicate_of, similarity
+
+    def _match(self, conn: sqlite3.Connection, signature, buckets: List[int], before: Optional[int] = None) -> Tuple[Optional[str], float]:
+        """Most similar indexed paper (added before `before`, if given) at or above the threshold."""
+        np = self.hasher.np
+        candidates = set()
+        for band, bucket in enumerate(buckets):
+            candidates.update(seq for seq, in conn.execute("SELECT seq FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+        duplicate_of, best = None, 0.0
+        for seq in sorted(candidates):
+            if before is not None and seq >= before:
+                break
+            other_id, blob = conn.execute("SELECT arxiv_id, signature FROM papers WHERE seq = ?", (seq,)).fetchone()
+            similarity = self.hasher.similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if similarity >= self.threshold and similarity > best:
+                duplicate_of, best = other_id, similarity
+        return duplicate_of, best
+
+    def counts(self) -> Dict[str, int]:
+        indexed, duplicates = self._conn.execute("SELECT COUNT(*), COUNT(duplicate_of) FROM papers").fetchone()
+        return {"indexed": indexed, "near_duplicates": duplicates}
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_near_duplicate_index(path: str = NEAR_DUPLICATES_PATH, threshold: float = DEFAULT_THRESHOLD) -> NearDuplicateIndex:
+    """Process-wide index for `path`."""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = NearDuplicateIndex(path, threshold)
+        _indexes[path].threshold = threshold
+        return _indexes[path]
+
+
+class NearDuplicateFilter:
+    """Skips (or defers to the end of the stream) papers that nearly duplicate an earlier one."""
+
+    def __init__(self, mode: str = "off", threshold: float = DEFAULT_THRESHOLD, path: str = NEAR_DUPLICATES_PATH):
+        if mode not in NEAR_DUPLICATE_MODES:
+            raise ValueError(f"Unknown near-duplicate mode {mode!r} (expected one of {', '.join(NEAR_DUPLICATE_MODES)})")
+        self.mode = mode
+        self.index = get_near_duplicate_index(path, threshold) if mode != "off" else None
+        self.skipped = 0
+        self.deferred = 0
+
+    def __call__(self, papers: Iterable[Dict]) -> Iterator[Dict]:
+        if self.index is None:
+            yield from papers
+            return
+        deferred = []
+        for paper in papers:
+            duplicate_of, similarity = self.index.check(paper["arxiv_id"], paper.get("paper_md") or "")
+            if duplicate_of is None:
+                yield paper
+                continue
+            defer = self.mode == "defer" and len(deferred) < MAX_DEFERRED
+            if self.mode == "defer" and not defer and not self.skipped:
+                print(f"Warning: {MAX_DEFERRED} near-duplicates are already deferred, skipping the next ones")
+            print(f"  {paper['arxiv_id']} nearly duplicates {duplicate_of} (similarity {similarity:.2f}), {'deferred' if defer else 'skipped'}")
+            if defer:
+                deferred.append(paper)
+            else:
+                self.skipped += 1
+        self.deferred = len(deferred)
+        yield from deferred
+
+    def summary(self) -> str:
+        if self.index is None:
+            return "Near-duplicate detection disabled"
+        counts = self.index.counts()
+        action = f"{self.skipped} skipped"
+        if self.mode == "defer":
+            action = f"{self.deferred} deferred to the end of the stream" + (f", {action} over the limit of {MAX_DEFERRED}" if self.skipped else "")
+        return f"Near-duplicates: {action} ({counts['indexed']} papers indexed, {counts['near_duplicates']} near-duplicates found so far)"
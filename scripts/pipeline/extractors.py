@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+# Import Curator
+from bespokelabs import curator
+
+from pipeline.batch import BatchMixin
+from pipeline.cache import CachedResponsesMixin, replaying
+from pipeline.checkpoint import save_result
+from pipeline.config import COMBINED_ENTRY_TYPE, DATASET_PATH, ENTRY_TYPES
+from pipeline.journal import record_response
+from pipeline.limiter import estimate_tokens, limiter_for_backend
+from pipeline.prompts import PromptTemplate, build_prompt
+from pipeline.quality import failed_rules
+from pipeline.schemas import Conversation, CombinedConversations, record_from_response, split_response
+from pipeline.store import STORE_PATH, get_store
+from pipeline.telemetry import MeteredMixin
+from pipeline.tokens import get_counter
+
+
+# (entry_type, paper) of the responses that failed the quality rules, per (model, extractor entry_type),
+# until the scheduler takes them after the call. Kept outside the extractors because Curator hashes them
+# by pickling. Every extractor has its own list, so a call only ever takes the rejections of its own
+# extractor, which the scheduler never calls concurrently.
+_rejected: Dict[Tuple[str, str], List[Tuple[str, Dict]]] = {}
+_rejected_lock = threading.Lock()
+
+
+# Define custom LLM classes using Curator
+class BaseExtractor(BatchMixin, MeteredMixin, CachedResponsesMixin, curator.LLM):
+    """Base class for common logic and initialization."""
+    entry_type = None
+
+    def __init__(self, model: str, template: PromptTemplate, dataset_path: str = DATASET_PATH, store_path: str = STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.init_response_cache(kwargs.get("model_name"), kwargs.get("backend"), kwargs.get("backend_params"), kwargs.get("response_format"))
+        self.init_metrics("curator", model)
+        self.init_batch(kwargs.get("model_name"))
+        self.model = model
+        self.template = template
+        self.dataset_path = dataset_path
+        self.store_path = store_path
+        print(f"Initialized {self.__class__.__name__} ({model}) to save to:")
+        print(f"  Dataset: {self.dataset_path}")
+        print(f"  Checkpoint store: {self.store_path}")
+
+    def prompt(self, paper_data: Dict) -> str:
+        return build_prompt(self.template, paper_data)
+
+    @property
+    def entry_types(self) -> List[str]:
+        """Entry types of the records one response is split into."""
+        return [self.entry_type]
+
+    def estimate_input_tokens(self, paper_data: Dict) -> int:
+        return estimate_tokens(sum(map(len, self.template.segments)) + len(paper_data.get("paper_md", "")))
+
+    def parse(self, paper_data: Dict, response: Conversation) -> List[Dict]:
+        """Parses the response and hands its records to the token counter, which saves them once counted."""
+        if not replaying():
+            # Keep the raw response before parsing, so records can be rebuilt offline (see pipeline.journal)
+            record_response(paper_data, self.entry_type, self.model, response)
+        results = []
+        for entry_type, conversation in split_response(self.entry_type, response).items():
+            result = record_from_response(paper_data, entry_type, self.model, conversation)
+
+            # Rejected responses are not saved, checkpointed or cached, so the paper can be tried again
+            failed = failed_rules(result)
+            self.record_outcome(paper_data, conversation, accepted=not failed)
+            if failed:
+                print(f"[{self.model}] {entry_type} response for {result['arxiv_id']} failed quality rules: {', '.join(failed)}")
+                # Half of a combined response is retried alone, by the extractor of its entry type
+                with _rejected_lock:
+                    _rejected.setdefault((self.model, self.entry_type), []).append((entry_type, paper_data))
+                continue
+            results.append(result)
+
+            if result["arxiv_id"] != "UNKNOWN_ID":
+                # Thinking tokens are counted off-thread; the record is saved from the counter's callback
+                future = get_counter().submit(result["conversations"])
+                future.add_done_callback(lambda f, result=result: self._save(result, f))
+            else:
+                print(f"Warning: Skipping save for entry with missing arxiv_id. Data: {paper_data}")
+        if len(results) == len(self.entry_types):
+            self.remember_response(paper_data, response)
+
+        # Return the result list as expected by Curator
+        return results
+
+    def take_rejected(self) -> List[Tuple[str, Dict]]:
+        """(entry_type, paper) of the responses of this extractor rejected by the quality rules since the last call."""
+        with _rejected_lock:
+            return _rejected.pop((self.model, self.entry_type), [])
+
+    def _save(self, result: Dict, token_count: Future):
+        """Fill in avg_thinking_tokens, then save result and checkpoint."""
+        try:
+            result["avg_thinking_tokens"] = token_count.result()
+        except Exception as e:
+            print(f"Warning: Could not count thinking tokens for {result['arxiv_id']}: {e}")
+
+        # --- Incremental Saving ---
+        # The store commits record and checkpoint together; zraw.jsonl can be rebuilt from it
+        if get_store(self.store_path).save_generation(result):
+            save_result(self.dataset_path, result)
+
+class MultiShortExtractor(BaseExtractor):
+    entry_type = "multi-short"
+
+class SingleLongExtractor(BaseExtractor):
+    entry_type = "single-long"
+
+class CombinedExtractor(BaseExtractor):
+    """Both entry types from one request per paper (see `pipeline.prompts.load_combined_prompt`)."""
+    entry_type = COMBINED_ENTRY_TYPE
+
+    @property
+    def entry_types(self) -> List[str]:
+        return list(ENTRY_TYPES)
+
+EXTRACTORS = {
+    "multi-short": MultiShortExtractor,
+    "single-long": SingleLongExtractor,
+}
+
+
+def _build_extractor(extractor_cls, backend: Dict, template: PromptTemplate, response_format, dataset_path: str, store_path: str) -> BaseExtractor:
+    backend_params = dict(backend["backend_params"])
+    limiter = limiter_for_backend(backend)
+    if limiter is not None:
+        backend_params.update(limiter.curator_params())
+    return extractor_cls(
+        model=backend["name"],
+        template=template,
+        dataset_path=dataset_path,
+        store_path=store_path,
+        model_name=backend["model_name"],
+        backend=backend.get("backend", "litellm"),
+        backend_params=backend_params,
+        response_format=response_format,
+        batch=False # Keep batch=False if processing with rate limits, otherwise you will get an error (--batch uses pipeline.batch instead)
+    )
+
+def build_extractors(
+    backend: Dict,
+    prompts: Dict[str, PromptTemplate],
+    dataset_path: str = DATASET_PATH,
+    store_path: str = STORE_PATH,
+) -> Dict[str, BaseExtractor]:
+    """Create one extractor per entry type for a backend config from `pipeline.backends`."""
+    return {
+        entry_type: _build_extractor(extractor_cls, backend, prompts[entry_type], Conversation, dataset_path, store_path)
+        for entry_type, extractor_cls in EXTRACTORS.items()
+    }
+
+def build_combined_extractor(
+    backend: Dict,
+    template: PromptTemplate,
+    dataset_path: str = DATASET_PATH,
+    store_path: str = STORE_PATH,
+) -> CombinedExtractor:
+    """Create the extractor requesting both entry types at once for a backend config."""
+    return _build_extractor(CombinedExtractor, backend, template, CombinedConversations, dataset_path, store_path)
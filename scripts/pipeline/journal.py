@@ -0,0 +1,135 @@
+"""
+Journal of raw generation responses, and offline re-parsing.
+
+Every fresh response is appended to a gzip JSONL journal under data/journal
+before `parse()` turns it into a record, together with the paper metadata it
+was generated for (without the markdown). Each process writes its own
+journal file through the group-commit writer.
+
+`reparse()` rebuilds the records from the journals with the current parse and
+thinking-token logic, spread over a process pool and without any API call,
+updates them in the checkpoint store and rewrites zraw.jsonl from the store.
+Records without journal entries (generated before the journal existed) are
+kept as they are.
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pipeline.config import DATASET_PATH, JOURNAL_DIR
+from pipeline.shards import Shard
+from pipeline.store import STORE_PATH, get_store
+from pipeline.writer import get_writer
+
+# Keys of the paper dict not worth journaling, the response is enough to re-parse
+UNJOURNALED_PAPER_KEYS = ("paper_md",)
+
+_journal_path: Optional[str] = None
+
+def journal_path(journal_dir: str = JOURNAL_DIR) -> str:
+    """This process's journal file."""
+    global _journal_path
+    if _journal_path is None:
+        _journal_path = os.path.join(journal_dir, f"responses-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+    return _journal_path
+
+def record_response(paper_data: Dict, entry_type: str, model: str, response):
+    """Append a raw response to the journal."""
+    try:
+        get_writer(journal_path()).write({
+            "ts": time.time(),
+            "entry_type": entry_type,
+            "model": model,
+            "paper": {k: v for k, v in paper_data.items() if k not in UNJOURNALED_PAPER_KEYS},
+            "response": response.model_dump() if hasattr(response, "model_dump") else response,
+        })
+    except Exception as e:
+        print(f"Warning: Could not journal response for {paper_data.get('arxiv_id')}. Error: {e}")
+
+def iter_journal(path: str) -> Iterator[Dict]:
+    """Entries of one journal file; a truncated last member (after a crash) ends the stream."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+            print(f"Warning: Stopped reading {path} at a damaged entry: {e}")
+
+
+# --- Re-parsing ---
+def _reparse_part(path: str, part: int, parts: int, store_path: str, shard: Optional[Shard]) -> List[Tuple[float, Dict]]:
+    """Re-parse every `parts`-th entry of a journal file, starting at `part` (runs in a worker process)."""
+    from pipeline.quality import failed_rules
+    from pipeline.schemas import record_from_response, response_format_for, split_response
+    from pipeline.tokens import average_thinking_tokens_many
+
+    stamped = []
+    for index, entry in enumerate(iter_journal(path)):
+        if index % parts != part:
+            continue
+        if shard is not None and not shard.contains(entry["paper"].get("arxiv_id", "")):
+            continue
+        try:
+            response = response_format_for(entry["entry_type"]).model_validate(entry["response"])
+            # A combined response holds one record per entry type
+            records = [
+                record_from_response(entry["paper"], entry_type, entry["model"], conversation)
+                for entry_type, conversation in split_response(entry["entry_type"], response).items()
+            ]
+        except Exception as e:
+            print(f"Warning: Could not re-parse entry {index} of {path}: {e}")
+            continue
+        # Rejected responses are journaled too, but the run never kept them
+        for record in records:
+            if record["arxiv_id"] != "UNKNOWN_ID" and not failed_rules(record):
+                stamped.append((entry["ts"], record))
+
+    averages = average_thinking_tokens_many([record["conversations"] for _, record in stamped], store_path)
+    for (_, record), average in zip(stamped, averages):
+        record["avg_thinking_tokens"] = average
+    return stamped
+
+def reparse(
+    dataset_path: str = DATASET_PATH,
+    journal_dir: str = JOURNAL_DIR,
+    store_path: str = STORE_PATH,
+    workers: Optional[int] = None,
+    shard: Optional[Shard] = None,
+) -> int:
+    """Rebuild records from the journals in parallel; returns the number of re-parsed records.
+
+    With a `shard`, only its papers are re-parsed (journals are per process, not per shard).
+    """
+    from pipeline.checkpoint import rewrite_results
+
+    paths = sorted(glob.glob(os.path.join(journal_dir, "*.jsonl.gz")))
+    if not paths:
+        print(f"No journal files found in {journal_dir}.")
+        return 0
+    workers = workers or os.cpu_count() or 1
+    # Split files into interleaved parts so a single big journal still uses every worker
+    parts = max(1, workers // len(paths))
+    tasks = [(path, part, parts, store_path, shard) for path in paths for part in range(parts)]
+    print(f"Re-parsing {len(paths)} journal file(s) with {workers} worker(s)...")
+
+    latest: Dict[Tuple[str, str, str], Tuple[float, Dict]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for stamped in pool.map(_reparse_part, *zip(*tasks)):
+            for ts, record in stamped:
+                key = (record["arxiv_id"], record["entry_type"], record["model"])
+                # The first accepted response for a key is the one the run kept, as the store does
+                if key not in latest or ts < latest[key][0]:
+                    latest[key] = (ts, record)
+
+    records = [record for _, record in sorted(latest.values(), key=lambda item: item[0])]
+    store = get_store(store_path)
+    store.replace_generations(records)
+    count = rewrite_results(dataset_path, store.iter_generations())
+    print(f"Re-parsed {len(records)} records; rebuilt {dataset_path} with {count} records.")
+    return len(records)
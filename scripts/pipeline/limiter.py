@@ -0,0 +1,169 @@
+"""
+Adaptive (AIMD) rate limiting shared across extractors.
+
+The rate limits in `backend_params` used to be hand-tuned constants applied
+separately by every Curator LLM, so the multi-short and single-long
+extractors of a backend each assumed the whole budget. Now there is one
+limiter per provider key (see `rate_limit_key` in `pipeline.backends`),
+shared by every extractor and backend that draws on the same quota.
+
+Each limiter holds two token buckets, requests and estimated input tokens,
+refilled continuously at the current per-minute rates. Work is dispatched in
+small batches that have to acquire their share first: about `BURST_SECONDS`
+of the current request rate, but never fewer than `min_batch_size` papers
+(the backend's `max_concurrent_requests` if it sets one), so slow quotas
+still get a few concurrent requests per Curator call. A batch larger than
+the bucket puts it into debt, which the following batches wait out, so the
+average rate holds either way. A batch that fails
+with a 429/quota error halves the rates (multiplicative decrease); every
+clean batch after a cool-down adds a small step back (additive increase), up
+to `ceiling` times the configured limits. Rates therefore settle just below
+what the provider actually allows instead of at a conservative guess.
+
+Curator still paces requests within a batch, so extractors are given the
+ceiling rates (`curator_params`) and never slow down below the limiter.
+"""
+
+import re
+import time
+import threading
+from typing import Dict, Optional
+
+CHARS_PER_TOKEN = 4 # Rough estimate for input token accounting
+
+DEFAULT_CEILING = 2.0          # Rates may probe up to this multiple of the configured limits
+DEFAULT_FLOOR = 0.1            # ...and back off down to this fraction of them
+INCREASE_STEP = 0.05           # Fraction of the configured rate added per clean batch
+DECREASE_FACTOR = 0.5
+COOLDOWN = 60.0                # Seconds after a throttle before rates increase again
+BURST_SECONDS = 10.0           # A dispatched batch holds about this much of the request budget...
+MIN_BATCH_SIZE = 4             # ...but at least this many requests, unless the backend sets max_concurrent_requests
+
+THROTTLE_PATTERN = re.compile(r"\b429\b|rate.?limit|quota|resource.?exhausted|too many requests", re.IGNORECASE)
+
+
+def estimate_tokens(chars: int) -> int:
+    return chars // CHARS_PER_TOKEN + 1
+
+def is_throttle_error(error: BaseException) -> bool:
+    """Whether an exception looks like the provider rejecting us for rate or quota reasons."""
+    return bool(THROTTLE_PATTERN.search(f"{type(error).__name__}: {error}"))
+
+
+class _Bucket:
+    """Token bucket holding up to one minute of budget; may go into debt for large acquisitions."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.level = rate
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.rate, self.level + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # Acquisitions larger than the bucket only need a full bucket, the rest becomes debt
+        missing = min(amount, self.rate) - self.level
+        return max(0.0, missing * 60 / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def set_rate(self, rate: float):
+        self.rate = rate
+        self.level = min(self.level, rate)
+
+
+class AdaptiveRateLimiter:
+    """Thread-safe AIMD request and token limiter for one provider key."""
+
+    def __init__(
+        self,
+        key: str,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        ceiling: float = DEFAULT_CEILING,
+        floor: float = DEFAULT_FLOOR,
+        min_batch_size: int = MIN_BATCH_SIZE,
+    ):
+        self.key = key
+        self.configured = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.ceiling = ceiling
+        self.floor = floor
+        self.min_batch_size = max(1, min_batch_size)
+        self._buckets = {name: _Bucket(rate) for name, rate in self.configured.items() if rate}
+        self._lock = threading.Lock()
+        self._last_throttle = float("-inf")
+
+    @property
+    def rates(self) -> Dict[str, float]:
+        with self._lock:
+            return {name: bucket.rate for name, bucket in self._buckets.items()}
+
+    def batch_size(self) -> int:
+        """Requests to dispatch at once at the current rate, at least `min_batch_size`."""
+        with self._lock:
+            return max(self.min_batch_size, int(self._buckets["requests"].rate * BURST_SECONDS / 60))
+
+    def curator_params(self) -> Dict[str, int]:
+        """Curator backend params that leave the pacing to this limiter."""
+        params = {"max_requests_per_minute": int(self.configured["requests"] * self.ceiling)}
+        if self.configured["tokens"]:
+            params["max_tokens_per_minute"] = int(self.configured["tokens"] * self.ceiling)
+        return params
+
+    def acquire(self, requests: int, tokens: int = 0):
+        """Block until `requests` requests with `tokens` estimated input tokens may be sent."""
+        amounts = {"requests": requests, "tokens": tokens}
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                for name, bucket in self._buckets.items():
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_time(amounts[name]))
+                if wait <= 0:
+                    for name, bucket in self._buckets.items():
+                        bucket.take(amounts[name])
+                    return
+            time.sleep(wait)
+
+    def record_success(self):
+        """Additive increase, once the last throttle is a cool-down ago."""
+        with self._lock:
+            if time.monotonic() - self._last_throttle < COOLDOWN:
+                return
+            for name, bucket in self._buckets.items():
+                configured = self.configured[name]
+                bucket.set_rate(min(configured * self.ceiling, bucket.rate + configured * INCREASE_STEP))
+
+    def record_throttle(self):
+        """Multiplicative decrease, and drop whatever budget is left."""
+        with self._lock:
+            self._last_throttle = time.monotonic()
+            for name, bucket in self._buckets.items():
+                bucket.set_rate(max(self.configured[name] * self.floor, bucket.rate * DECREASE_FACTOR))
+                bucket.level = min(bucket.level, 0.0)
+            rates = {name: round(bucket.rate) for name, bucket in self._buckets.items()}
+        print(f"[{self.key}] Throttled by the provider, backing off to {rates} per minute")
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for_backend(backend: Dict) -> Optional[AdaptiveRateLimiter]:
+    """Shared limiter for the backend's provider key, or None for backends without rate limits."""
+    params = backend.get("backend_params", {})
+    if not params.get("max_requests_per_minute"):
+        return None
+    key = backend.get("rate_limit_key", backend["model_name"])
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdaptiveRateLimiter(
+                key,
+                params["max_requests_per_minute"],
+                params.get("max_tokens_per_minute"),
+                min_batch_size=params.get("max_concurrent_requests", MIN_BATCH_SIZE),
+            )
+        return _limiters[key]
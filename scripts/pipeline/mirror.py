@@ -0,0 +1,270 @@
+"""
+Local columnar mirror of the arxiv-markdown dataset.
+
+`PaperMirror.sync()` streams the dataset from the Hub once and writes it to
+Arrow IPC files under data/cache/arxiv-markdown (`part-00000.arrow`, ...),
+in stream order, together with a SQLite index of the metadata: arxiv_id,
+dates and categories, with the part and row of every paper. Syncing is
+resumable and incremental: a later sync with a higher limit only downloads
+the papers after the last synced one.
+
+`PaperMirror` opens the parts memory-mapped, so opening the mirror costs
+nothing, no markdown is held in Python strings until a paper is actually
+yielded, and runs work offline. `pipeline.papers.iter_papers` reads from the
+mirror whenever it covers the requested papers.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pipeline.config import MIRROR_DIR
+from pipeline.selection import PaperSelection, _text, item_categories
+from pipeline.store import _Transaction
+
+ROWS_PER_PART = 2000 # ~100 MB of markdown per part
+BATCH_ROWS = 64 # Rows converted to Python at once when iterating
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    position INTEGER PRIMARY KEY, -- Row in stream order
+    arxiv_id TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    published TEXT,
+    updated TEXT,
+    categories TEXT -- JSON list
+);
+
+CREATE INDEX IF NOT EXISTS papers_arxiv_id ON papers (arxiv_id);
+
+CREATE TABLE IF NOT EXISTS paper_categories (
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (category, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def part_path(mirror_dir: str, part: int) -> str:
+    return os.path.join(mirror_dir, f"part-{part:05d}.arrow")
+
+
+
+class PaperMirror:
+    """Memory-mapped, indexed local copy of arxiv-markdown."""
+
+    def __init__(self, mirror_dir: str = MIRROR_DIR):
+        self.mirror_dir = mirror_dir
+        self.index_path = os.path.join(mirror_dir, "index.sqlite")
+        self._local = threading.local()
+        self._tables = {}
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.mirror_dir, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @property
+    def synced(self) -> int:
+        """Number of papers in the mirror (the first `synced` papers of the stream)."""
+        return self._meta("synced", 0)
+
+    @property
+    def complete(self) -> bool:
+        """Whether the whole dataset has been synced."""
+        return self._meta("complete", False)
+
+    def covers(self, limit: Optional[int]) -> bool:
+        """Whether the first `limit` papers (all of them if None) are in the mirror."""
+        return self.exists and (self.complete or (limit is not None and self.synced >= limit))
+
+    def __len__(self) -> int:
+        return self.synced
+
+    # --- Reading ---
+    def _table(self, part: int):
+        """One part as an Arrow table backed by a memory map (nothing is read until used)."""
+        import pyarrow as pa
+
+        if part not in self._tables:
+            source = pa.memory_map(part_path(self.mirror_dir, part), "r")
+            self._tables[part] = pa.ipc.open_file(source).read_all()
+        return self._tables[part]
+
+    def iter_items(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Yield the first `limit` rows in stream order, in the dataset's own layout."""
+        remaining = self.synced if limit is None else min(limit, self.synced)
+        part = 0
+        while remaining > 0:
+            table = self._table(part).slice(0, remaining)
+            for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+                yield from batch.to_pylist()
+            remaining -= table.num_rows
+            part += 1
+
+    def iter_positions(self, positions: Iterable[int]) -> Iterator[Dict]:
+        """Yield the rows at the given stream positions, in the given order; only those rows are read."""
+        positions = list(positions)
+        for start in range(0, len(positions), BATCH_ROWS):
+            chunk = positions[start:start + BATCH_ROWS]
+            placeholders = ",".join("?" * len(chunk))
+            by_part: Dict[int, List[Tuple[int, int]]] = {}
+            for position, part, row in self._conn.execute(
+                f"SELECT position, part, row FROM papers WHERE position IN ({placeholders})", chunk
+            ):
+                by_part.setdefault(part, []).append((position, row))
+            rows = {}
+            for part, located in by_part.items():
+                taken = self._table(part).take([row for _, row in located]).to_pylist()
+                rows.update((position, item) for (position, _), item in zip(located, taken))
+            for position in chunk:
+                if position in rows:
+                    yield rows[position]
+
+    def get(self, arxiv_id: str) -> Optional[Dict]:
+        """Row of one paper by arxiv_id, or None if it isn't mirrored."""
+        row = self._conn.execute("SELECT position FROM papers WHERE arxiv_id = ? ORDER BY position LIMIT 1", (arxiv_id,)).fetchone()
+        return next(self.iter_positions([row[0]]), None) if row else None
+
+    def positions(self, arxiv_ids: Iterable[str]) -> Dict[str, int]:
+        """Stream position of every given arxiv_id that is mirrored (its first one), from the index alone."""
+        ids = list(arxiv_ids)
+        positions: Dict[str, int] = {}
+        for start in range(0, len(ids), BATCH_ROWS):
+            chunk = ids[start:start + BATCH_ROWS]
+            placeholders = ",".join("?" * len(chunk))
+            positions.update(self._conn.execute(
+                f"SELECT arxiv_id, MIN(position) FROM papers WHERE arxiv_id IN ({placeholders}) GROUP BY arxiv_id", chunk
+            ))
+        return positions
+
+    def select(self, selection: PaperSelection, limit: Optional[int] = None) -> List[int]:
+        """Positions among the first `limit` papers that pass `selection`, from the index alone."""
+        conditions, params = ["position < ?"], [self.synced if limit is None else limit]
+        if selection.categories:
+            placeholders = ",".join("?" * len(selection.categories))
+            conditions.append(f"position IN (SELECT position FROM paper_categories WHERE category IN ({placeholders}))")
+            params.extend(selection.categories)
+        for field, operator, bound in selection.date_conditions():
+            conditions.append(f"{field} {operator} ?")
+            params.append(bound)
+        rows = self._conn.execute(
+            f"SELECT position, arxiv_id FROM papers WHERE {' AND '.join(conditions)} ORDER BY position", params
+        )
+        return [position for position, arxiv_id in rows if selection.matches_id(arxiv_id)]
+
+    # --- Writing ---
+    def _write_part(self, part: int, start: int, items: List[Dict], schema):
+        """Write one part file holding stream positions `start`..., then index it.
+
+        The index only ever refers to complete part files, so an interrupted sync resumes cleanly.
+        """
+        import pyarrow as pa
+
+        table = pa.Table.from_pylist(items, schema=schema)
+        path = part_path(self.mirror_dir, part)
+        with pa.OSFile(f"{path}.temp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        self._tables.pop(part, None)
+        os.replace(f"{path}.temp", path)
+
+        papers, categories = [], []
+        for row, item in enumerate(items):
+            position = start + row
+            paper_categories = item_categories(item)
+            papers.append((
+                position, item["arxiv_id"], part, row,
+                _text(item.get("paper_published_date")), _text(item.get("paper_updated_date")), json.dumps(paper_categories),
+            ))
+            categories.extend((category, position) for category in paper_categories)
+        with _Transaction(self._conn) as conn:
+            conn.executemany("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?, ?)", papers)
+            conn.executemany("INSERT OR IGNORE INTO paper_categories VALUES (?, ?)", categories)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('synced', ?)", (json.dumps(start + len(items)),))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('parts', ?)", (json.dumps(part + 1),))
+        return table.schema
+
+    def append(self, items: Iterable[Dict], schema=None) -> int:
+        """Add rows after the ones already mirrored, in order; returns how many were added.
+
+        `schema` is only used for the first part, later parts keep the schema of the existing ones.
+        """
+        part = self._meta("parts", 0)
+        if part:
+            schema = self._table(0).schema
+        buffer = []
+        # Parts are written whole: a short last part is rewritten together with the new rows
+        if part and self._table(part - 1).num_rows < ROWS_PER_PART:
+            part -= 1
+            buffer = self._table(part).to_pylist()
+        start = self.synced - len(buffer)
+
+        added = 0
+        for item in items:
+            buffer.append(item)
+            added += 1
+            if len(buffer) == ROWS_PER_PART:
+                schema = self._write_part(part, start, buffer, schema)
+                part += 1
+                start += len(buffer)
+                buffer = []
+                print(f"  Mirrored {start} papers...")
+        if buffer and added:
+            self._write_part(part, start, buffer, schema)
+        return added
+
+    def arxiv_ids(self) -> Set[str]:
+        """arxiv_ids of the mirrored papers, from the index."""
+        return {arxiv_id for arxiv_id, in self._conn.execute("SELECT arxiv_id FROM papers")}
+
+    def sync(self, limit: Optional[int] = None) -> int:
+        """Download the first `limit` papers (all if None) that aren't mirrored yet; returns how many were added."""
+        from pipeline.papers import PAPERS_DATASET
+        from datasets import load_dataset
+
+        if self.covers(limit):
+            print(f"Mirror already holds the first {self.synced} papers in {self.mirror_dir}.")
+            return 0
+        synced = self.synced
+
+        dataset = load_dataset(PAPERS_DATASET, split='train', streaming=True)
+        schema = dataset.features.arrow_schema if dataset.features is not None else None
+        if synced:
+            dataset = dataset.skip(synced)
+        if limit is not None:
+            dataset = dataset.take(limit - synced)
+        print(f"Syncing papers {synced} to {limit if limit is not None else 'the end'} into {self.mirror_dir}...")
+
+        added = self.append(dataset, schema)
+        if limit is None or synced + added < limit:
+            # The stream ended before the limit
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('complete', 'true')")
+        print(f"Mirror holds {self.synced} papers{' (the whole dataset)' if self.complete else ''}.")
+        return added
+
+
+def get_mirror(mirror_dir: str = MIRROR_DIR) -> PaperMirror:
+    return PaperMirror(mirror_dir)
@@ -0,0 +1,98 @@
+import random
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional
+
+from pipeline.mirror import get_mirror
+from pipeline.selection import PaperSelection
+
+PAPERS_DATASET = "marcodsn/arxiv-markdown"
+
+# Papers held in memory at once for shuffling. Memory is bounded by this, not by --limit.
+DEFAULT_SHUFFLE_BUFFER = 256
+
+
+def paper_from_item(item: Dict) -> Dict:
+    """Map an arxiv-markdown row to the paper dict the extractors expect."""
+    return {
+        "arxiv_id": item["arxiv_id"],
+        "paper_md": item["markdown"],
+        "paper_doi": item.get("paper_doi"),
+        "paper_authors": item.get("paper_authors"),
+        "paper_published_date": item.get("paper_published_date"),
+        "paper_updated_date": item.get("paper_updated_date"),
+        "categories": item.get("categories")
+    }
+
+
+def shuffle_buffer(items: Iterable, buffer_size: int = DEFAULT_SHUFFLE_BUFFER, seed: Optional[int] = None) -> Iterator:
+    """
+    Lazily shuffle a stream using a fixed-size buffer.
+
+    Once the buffer is full every new item replaces a randomly chosen buffered
+    one, which is yielded. The order is a pure function of the input order and
+    `seed`, so a seeded run is reproducible.
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        idx = rng.randrange(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+def _log_progress(papers: Iterable[Dict], limit: Optional[int]) -> Iterator[Dict]:
+    count = 0
+    for paper in papers:
+        count += 1
+        if count % 1000 == 0:
+            print(f"  Loaded {count} papers...")
+        yield paper
+    if limit is not None and count >= limit:
+        print(f"  Reached paper limit ({limit}). Stopping loading.")
+    print(f"Finished loading {count} papers.")
+
+
+# Streaming papers from the HuggingFace dataset
+def iter_papers(
+    limit: Optional[int] = None,
+    buffer_size: int = DEFAULT_SHUFFLE_BUFFER,
+    seed: Optional[int] = None,
+    selection: Optional[PaperSelection] = None,
+) -> Iterator[Dict]:
+    """
+    Yield the first `limit` papers of arxiv-markdown in shuffled order.
+
+    Papers are read lazily, from the local mirror if it holds them (see
+    pipeline/mirror.py) and from the Hub stream otherwise, so at most
+    `buffer_size` papers (plus the chunks queued by the scheduler) are held in
+    memory. With a `selection`, only those of the `limit` papers matching it
+    are yielded; it is checked on metadata before any markdown is read.
+    """
+    if selection is not None:
+        print(f"Selecting papers: {selection.describe()}")
+    mirror = get_mirror()
+    if mirror.covers(limit):
+        print(f"Reading papers from the local mirror ({len(mirror)} papers)...")
+        if selection is None:
+            items = mirror.iter_items(limit)
+        else:
+            positions = mirror.select(selection, limit)
+            print(f"  {len(positions)} papers match in the mirror index")
+            items = mirror.iter_positions(positions)
+    else:
+        from datasets import load_dataset
+
+        dataset = load_dataset(PAPERS_DATASET, split='train', streaming=True)
+        print("Streaming papers from the Hub (run generate.py --sync-mirror to keep a local copy)...")
+        items = iter(dataset)
+        if limit is not None:
+            items = islice(items, limit)
+        if selection is not None:
+            # Filtered after the limit, so e.g. the shards of one run split the same papers
+            items = (item for item in items if selection.matches(item))
+    papers = (paper_from_item(item) for item in items)
+    yield from shuffle_buffer(_log_progress(papers, limit), buffer_size, seed)
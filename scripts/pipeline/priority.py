@@ -0,0 +1,316 @@
+"""
+Yield-aware ordering of the paper stream.
+
+Verification shows Suitable rates that differ a lot by category, paper
+length and generator model, while the stream is only shuffled. `YieldStats`
+reads the merged verification results (data/jsonls/zverified.jsonl) and
+counts Suitable records per (model, primary category, length bucket). Rates
+are shrunk towards the (model, category), model and overall rates, so a
+group with a handful of records doesn't swing the order.
+
+A paper's expected cost for a model comes from the prompt and paper length,
+the model's typical response length and its price in
+`pipeline.telemetry.PRICES` (free or unpriced models count tokens instead).
+Its priority is the expected Suitable records per dollar, relative to an
+average paper for that model and averaged over the models of the run.
+
+`YieldPrioritizer` wraps the paper stream in `generate_dataset()` with
+`--priority yield` (the default, `stream`, keeps the shuffled order). It is a
+priority buffer: it holds `window` papers and always hands out the best one,
+so quotas fill up with high-yield papers and a run stopped at its budget
+leaves the low-yield ones. Like the shuffle buffer, memory is bounded by the
+window, which by default is a fraction of `--limit` (see `default_window`) so
+the first units go out long before the whole stream is read.
+
+zverified.jsonl doesn't hold paper lengths, so the length of every paper seen
+is kept in data/checkpoints/paper_lengths.sqlite. Verified papers not seen
+yet are looked up in the local mirror and paper store, and the ones neither
+holds are remembered until the stores change.
+"""
+
+import os
+import json
+import bisect
+import heapq
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from pipeline.config import CHECKPOINT_DIR, ENTRY_TYPES, LOCAL_PAPERS_DIR, MIRROR_DIR, VERIFIED_PATH
+from pipeline.limiter import estimate_tokens
+from pipeline.mirror import get_mirror
+from pipeline.prompts import PromptTemplate
+from pipeline.selection import item_categories
+from pipeline.store import _Transaction
+from pipeline.telemetry import PRICES
+
+PAPER_LENGTHS_PATH = os.path.join(CHECKPOINT_DIR, "paper_lengths.sqlite")
+LENGTH_BUCKETS = (16_000, 32_000, 64_000, 128_000) # Markdown characters at the bucket boundaries
+PRIOR_WEIGHT = 20.0 # Records after which a group's own rate weighs as much as its parent group's
+REFERENCE_CHARS = 40_000 # Paper length the per-model scores are relative to
+DEFAULT_OUTPUT_CHARS = 8_000 # Response characters per record of models without verified records
+UNPRICED = (1.0, 1.0) # Stand-in USD per million tokens, so free models still favour cheaper papers
+DEFAULT_WINDOW = 256 # Most papers held at once, as in the shuffle buffer
+PRIORITY_MODES = ("stream", "yield")
+LENGTHS_FLUSH = 256 # Paper lengths saved at once
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_lengths (
+    arxiv_id TEXT PRIMARY KEY,
+    chars INTEGER NOT NULL -- Markdown characters
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS unknown_lengths (
+    arxiv_id TEXT PRIMARY KEY,
+    sources TEXT NOT NULL -- JSON [directory, papers] of the stores that didn't hold the paper
+) WITHOUT ROWID;
+"""
+
+
+def length_bucket(chars: int) -> int:
+    return bisect.bisect_right(LENGTH_BUCKETS, chars)
+
+def primary_category(categories) -> str:
+    """First listed category (arXiv's primary one), or "" if there is none."""
+    categories = item_categories({"categories": categories})
+    return categories[0] if categories else ""
+
+def template_chars(template: PromptTemplate) -> int:
+    return sum(map(len, template.segments))
+
+def default_window(limit: Optional[int], chunk_size: int) -> int:
+    """Papers to pick from: a quarter of a capped stream (at least two units' worth), at most DEFAULT_WINDOW."""
+    if limit is None:
+        return DEFAULT_WINDOW
+    return min(DEFAULT_WINDOW, max(2 * chunk_size, limit // 4))
+
+
+class PaperLengths:
+    """Markdown length of every paper the prioritizer has seen, by arxiv_id."""
+
+    def __init__(self, path: str = PAPER_LENGTHS_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _select(self, query: str, arxiv_ids: Iterable[str], *params) -> Iterator[Tuple]:
+        """Rows of `query` over `arxiv_ids`, 500 ids (its `{ids}` placeholders) at a time."""
+        ids = list(arxiv_ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            yield from self._conn.execute(query.format(ids=", ".join("?" * len(chunk))), (*chunk, *params))
+
+    def get(self, arxiv_ids: Iterable[str]) -> Dict[str, int]:
+        return dict(self._select("SELECT arxiv_id, chars FROM paper_lengths WHERE arxiv_id IN ({ids})", arxiv_ids))
+
+    def save(self, lengths: Dict[str, int]):
+        if lengths:
+            with _Transaction(self._conn) as conn:
+                conn.executemany("INSERT OR REPLACE INTO paper_lengths (arxiv_id, chars) VALUES (?, ?)", lengths.items())
+
+    def unknown(self, arxiv_ids: Iterable[str], sources: str) -> Set[str]:
+        """Those of the papers that the stores described by `sources` didn't hold when last looked up."""
+        return {arxiv_id for arxiv_id, in self._select(
+            "SELECT arxiv_id FROM unknown_lengths WHERE arxiv_id IN ({ids}) AND sources = ?", arxiv_ids, sources
+        )}
+
+    def save_unknown(self, arxiv_ids: Iterable[str], sources: str):
+        """Remember papers none of the stores holds; forgotten as soon as a store changes."""
+        with _Transaction(self._conn) as conn:
+            conn.execute("DELETE FROM unknown_lengths WHERE sources != ?", (sources,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO unknown_lengths (arxiv_id, sources) VALUES (?, ?)", [(arxiv_id, sources) for arxiv_id in arxiv_ids]
+            )
+
+
+def lookup_lengths(arxiv_ids: Iterable[str], lengths: PaperLengths) -> Dict[str, int]:
+    """Lengths of the given papers, reading those never seen from the local mirror and paper store."""
+    arxiv_ids = set(arxiv_ids)
+    known = lengths.get(arxiv_ids)
+    stores = [store for store in map(get_mirror, (MIRROR_DIR, LOCAL_PAPERS_DIR)) if store.exists]
+    # Papers missing from every store are only looked up again once a store changed
+    sources = json.dumps([[store.mirror_dir, store.synced] for store in stores])
+    missing = arxiv_ids - known.keys()
+    missing -= lengths.unknown(missing, sources)
+    for store in stores:
+        if not missing:
+            break
+        found = {
+            item["arxiv_id"]: len(item["markdown"] or "")
+            for item in store.iter_positions(store.positions(missing).values())
+        }
+        lengths.save(found)
+        known.update(found)
+        missing -= found.keys()
+    if missing:
+        lengths.save_unknown(missing, sources)
+    return known
+
+
+class YieldStats:
+    """Suitable and total verified records per (model, category, length bucket) and their parent groups."""
+
+    def __init__(self):
+        self.counts: Dict[Tuple, List[int]] = {} # Group -> [suitable, records]
+        self._output: Dict[str, List[int]] = {} # Model -> [response characters, records]
+
+    @property
+    def records(self) -> int:
+        return self.counts.get((), [0, 0])[1]
+
+    def add(self, model: str, category: str, bucket: Optional[int], suitable: bool, output_chars: int):
+        """Count one verified record; records of papers of unknown length only count up to their category."""
+        groups = [(), (model,), (model, category)] + ([(model, category, bucket)] if bucket is not None else [])
+        for group in groups:
+            counts = self.counts.setdefault(group, [0, 0])
+            counts[0] += suitable
+            counts[1] += 1
+        output = self._output.setdefault(model, [0, 0])
+        output[0] += output_chars
+        output[1] += 1
+
+    def rate(self, model: str, category: Optional[str] = None, bucket: Optional[int] = None) -> float:
+        """Expected share of Suitable records, each group shrunk towards its parent."""
+        suitable, records = self.counts.get((), [0, 0])
+        rate = (suitable + 1) / (records + 2)
+        groups = [(model,)]
+        if category is not None:
+            groups.append((model, category))
+            if bucket is not None:
+                groups.append((model, category, bucket))
+        for group in groups:
+            suitable, records = self.counts.get(group, [0, 0])
+            rate = (suitable + PRIOR_WEIGHT * rate) / (records + PRIOR_WEIGHT)
+        return rate
+
+    def output_chars(self, model: str) -> float:
+        """Average response characters per record of a model."""
+        chars, records = self._output.get(model, [0, 0])
+        return chars / records if records else DEFAULT_OUTPUT_CHARS
+
+    @classmethod
+    def load(cls, path: str = VERIFIED_PATH, lengths: Optional[PaperLengths] = None) -> "YieldStats":
+        """Statistics of the merged verification results at `path` (empty if there are none yet)."""
+        stats = cls()
+        if not os.path.exists(path):
+            return stats
+        records = []
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("suitability") not in ("Suitable", "Unsuitable"):
+                    continue
+                records.append((
+                    record.get("arxiv_id"), record.get("model"), primary_category(record.get("categories")),
+                    record["suitability"] == "Suitable",
+                    sum(len(turn.get("content") or "") for turn in record.get("conversations") or []),
+                ))
+        known = lookup_lengths({record[0] for record in records}, lengths or PaperLengths())
+        for arxiv_id, model, category, suitable, output_chars in records:
+            bucket = length_bucket(known[arxiv_id]) if arxiv_id in known else None
+            stats.add(model, category, bucket, suitable, output_chars)
+        return stats
+
+
+class YieldPrioritizer:
+    """Hands out the papers of a stream by expected Suitable records per dollar, within a window of papers."""
+
+    def __init__(
+        self,
+        models: List[str],
+        mode: str = "yield",
+        templates: Sequence[PromptTemplate] = (),
+        records_per_paper: int = len(ENTRY_TYPES),
+        window: int = DEFAULT_WINDOW,
+        verified_path: str = VERIFIED_PATH,
+        lengths_path: str = PAPER_LENGTHS_PATH,
+    ):
+        if mode not in PRIORITY_MODES:
+            raise ValueError(f"Unknown priority mode {mode!r} (expected one of {', '.join(PRIORITY_MODES)})")
+        self.models = models
+        self.mode = mode
+        # One request per template, each holding the whole paper
+        self.template_chars = [template_chars(template) for template in templates]
+        self.records_per_paper = records_per_paper
+        self.window = window
+        self.verified_path = verified_path
+        self.lengths = PaperLengths(lengths_path) if mode == "yield" else None
+        self.stats = YieldStats.load(verified_path, self.lengths) if mode == "yield" else None
+        self.ordered = 0
+        if self.stats is not None and self.stats.records:
+            print(f"Prioritizing papers by yield, from {self.stats.records} verified records:")
+            for model in models:
+                records = self.stats.counts.get((model,), [0, 0])[1]
+                cost = (
+                    f"~${self.expected_cost(model, REFERENCE_CHARS):.4f} per {REFERENCE_CHARS // 1000}k-character paper"
+                    if any(PRICES.get(model, ())) else "free or unpriced, ordered by tokens"
+                )
+                print(f"  {model}: {self.stats.rate(model):.0%} Suitable over {records} records, {cost}")
+
+    def expected_cost(self, model: str, paper_chars: int) -> float:
+        """Estimated USD to generate all records of a paper with `model` (in stand-in prices if it is free)."""
+        input_price, output_price = PRICES[model] if any(PRICES.get(model, ())) else UNPRICED
+        input_tokens = sum(estimate_tokens(chars + paper_chars) for chars in self.template_chars or [0])
+        output_tokens = estimate_tokens(int(self.stats.output_chars(model) * self.records_per_paper))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def score(self, paper: Dict) -> float:
+        """Expected Suitable records per dollar, relative to an average paper and averaged over the models."""
+        chars = len(paper.get("paper_md") or "")
+        category, bucket = primary_category(paper.get("categories")), length_bucket(chars)
+        scores = []
+        for model in self.models:
+            paper_yield = self.stats.rate(model, category, bucket) / self.expected_cost(model, chars)
+            # Relative, so models priced in different units (or not at all) weigh the same
+            reference_yield = self.stats.rate(model) / self.expected_cost(model, REFERENCE_CHARS)
+            scores.append(paper_yield / reference_yield)
+        return sum(scores) / len(scores)
+
+    def __call__(self, papers: Iterable[Dict]) -> Iterator[Dict]:
+        if self.stats is None:
+            yield from papers
+            return
+        heap: List[Tuple[float, int, Dict]] = []
+        seen: Dict[str, int] = {}
+        try:
+            for sequence, paper in enumerate(papers):
+                # Lengths are kept even without verification results yet, for the statistics of later runs
+                if paper.get("arxiv_id"):
+                    seen[paper["arxiv_id"]] = len(paper.get("paper_md") or "")
+                    if len(seen) >= LENGTHS_FLUSH:
+                        self.lengths.save(seen)
+                        seen = {}
+                if not self.stats.records:
+                    yield paper
+                    continue
+                # Ties (e.g. papers of the same group and length) keep their stream order
+                heapq.heappush(heap, (-self.score(paper), sequence, paper))
+                if len(heap) > self.window:
+                    self.ordered += 1
+                    yield heapq.heappop(heap)[2]
+            while heap:
+                self.ordered += 1
+                yield heapq.heappop(heap)[2]
+        finally:
+            self.lengths.save(seen)
+
+    def summary(self) -> str:
+        if self.stats is None:
+            return "Yield priority off, papers in stream order"
+        if not self.stats.records:
+            return f"Yield priority: no verification results in {self.verified_path} yet, stream order kept"
+        return f"Yield priority: {self.ordered} papers handed out by expected Suitable records per dollar (window of {self.window})"
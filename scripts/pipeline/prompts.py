@@ -0,0 +1,171 @@
+"""
+Extraction prompt templates.
+
+Templates are compiled once, at load time, into immutable text segments around
+the `{paper_4}` slot: everything before the first slot is a static prefix
+holding the instructions and the few-shot papers, and rendering a prompt is a
+single join with the paper markdown, with no rescanning of the ~100 KB
+template. The prefix is byte-identical for every paper, so provider-side
+context caching and llama.cpp/Ollama prompt-cache reuse can hit on it.
+
+The combined prompt (`--combined`) asks for both entry types in one request:
+the instructions of both templates, the few-shot papers once (the second task
+refers back to them) and the paper once, so a paper's markdown is sent and
+billed a single time instead of once per entry type.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, Tuple
+
+from pipeline.config import COMBINED_FIELDS, PROMPT_DIR
+
+# Placeholder the paper to extract from is substituted into
+PAPER_PLACEHOLDER = "{paper_4}"
+
+PROMPT_FILES = {
+    "multi-short": "extraction_examples.txt",
+    "single-long": "long_extraction_examples.txt",
+}
+
+# Few-shot example papers, substituted into both templates
+EXAMPLE_PAPERS = ["paper_1", "paper_2", "paper_3"]
+
+# --- Combined prompt ---
+COMBINED_INTRO = (
+    "You will do two tasks on the same text. Both are described below, each with its own examples; "
+    "the text itself is given once, at the very end of this prompt, and the output format for both tasks "
+    "together is given right before it."
+)
+COMBINED_TASK_HEADER = "=== TASK {number}: {entry_type} ==="
+# Stands in for an example paper already included in the first task
+COMBINED_EXAMPLE_REFERENCE = "[Example paper {number}: the same text as in the examples of task 1 above]"
+COMBINED_OUTPUT = """=== OUTPUT FOR BOTH TASKS ===
+Do both tasks on the text below. Instead of the separate output formats given in the tasks, your final output **MUST** be a single valid JSON object with one key per task, each holding that task's list of conversation entries:
+{{ {fields} }}
+
+The text:
+"""
+
+
+class PromptTemplate:
+    """A template split once around its placeholder; rendering is a join."""
+
+    __slots__ = ("placeholder", "segments")
+
+    def __init__(self, text: str, placeholder: str = PAPER_PLACEHOLDER):
+        self.placeholder = placeholder
+        self.segments: Tuple[str, ...] = tuple(text.split(placeholder))
+
+    @property
+    def has_slot(self) -> bool:
+        return len(self.segments) > 1
+
+    @property
+    def prefix(self) -> str:
+        """Static text before the first slot, identical for every rendered prompt."""
+        return self.segments[0]
+
+    @property
+    def text(self) -> str:
+        """The template with its placeholder(s) in place."""
+        return self.placeholder.join(self.segments)
+
+    def render(self, value: str) -> str:
+        return value.join(self.segments)
+
+    def __getstate__(self):
+        return {"placeholder": self.placeholder, "segments": self.segments}
+
+    def __setstate__(self, state):
+        self.placeholder = state["placeholder"]
+        self.segments = state["segments"]
+
+    def __eq__(self, other):
+        return isinstance(other, PromptTemplate) and (self.placeholder, self.segments) == (other.placeholder, other.segments)
+
+    def __hash__(self):
+        return hash((self.placeholder, self.segments))
+
+
+def _fill_examples(text: str, examples: Dict[str, str]) -> str:
+    """Substitute every example paper placeholder in one pass over the template."""
+    if not examples:
+        return text
+    pattern = re.compile("|".join(re.escape("{" + paper + "}") for paper in examples))
+    return pattern.sub(lambda match: examples[match.group(0)[1:-1]], text)
+
+def _load_examples(prompt_dir: str) -> Dict[str, str]:
+    examples = {}
+    for paper in EXAMPLE_PAPERS:
+        paper_path = os.path.join(prompt_dir, "example_papers", f"{paper}.md")
+        if not os.path.exists(paper_path):
+            print(f"Warning: Example paper not found at {paper_path}")
+            continue
+        with open(paper_path, "r") as f:
+            examples[paper] = f.read()
+    return examples
+
+def load_prompts(prompt_dir: str = PROMPT_DIR) -> Dict[str, PromptTemplate]:
+    """Load and compile the extraction templates with the few-shot example papers filled in."""
+    prompts = {}
+    try:
+        examples = _load_examples(prompt_dir)
+        for entry_type, filename in PROMPT_FILES.items():
+            with open(os.path.join(prompt_dir, filename), "r") as f:
+                prompts[entry_type] = PromptTemplate(_fill_examples(f.read(), examples))
+            if not prompts[entry_type].has_slot:
+                print(f"Warning: Placeholder '{PAPER_PLACEHOLDER}' not found in {filename}.")
+
+    except FileNotFoundError as e:
+        print(f"Error loading prompts: {e}. Make sure the 'prompts' directory and files exist.")
+        raise # Prompts are essential
+    return prompts
+
+
+def load_combined_prompt(prompt_dir: str = PROMPT_DIR) -> PromptTemplate:
+    """Compile one template asking for every entry type, with the example papers and the paper included once."""
+    examples = _load_examples(prompt_dir)
+    references = {
+        paper: COMBINED_EXAMPLE_REFERENCE.format(number=number)
+        for number, paper in enumerate(EXAMPLE_PAPERS, 1) if paper in examples
+    }
+    parts = [COMBINED_INTRO]
+    for number, (entry_type, filename) in enumerate(PROMPT_FILES.items(), 1):
+        with open(os.path.join(prompt_dir, filename), "r") as f:
+            text = _fill_examples(f.read(), examples if number == 1 else references)
+        # Each task's instructions end where its template would take the paper
+        parts.append(f"{COMBINED_TASK_HEADER.format(number=number, entry_type=entry_type)}\n\n{text.split(PAPER_PLACEHOLDER)[0].rstrip()}")
+    fields = ", ".join(f'"{COMBINED_FIELDS[entry_type]}": [entries of task {number}]' for number, entry_type in enumerate(PROMPT_FILES, 1))
+    parts.append(COMBINED_OUTPUT.format(fields=fields))
+    return PromptTemplate("\n\n".join(parts) + "\n" + PAPER_PLACEHOLDER + "\n")
+
+
+_prompts: Dict[str, Dict[str, PromptTemplate]] = {}
+_combined_prompts: Dict[str, PromptTemplate] = {}
+_prompts_lock = threading.Lock()
+
+def get_prompts(prompt_dir: str = PROMPT_DIR) -> Dict[str, PromptTemplate]:
+    """Load the prompts on first use and reuse them afterwards."""
+    with _prompts_lock:
+        if prompt_dir not in _prompts:
+            _prompts[prompt_dir] = load_prompts(prompt_dir)
+        return _prompts[prompt_dir]
+
+def get_combined_prompt(prompt_dir: str = PROMPT_DIR) -> PromptTemplate:
+    with _prompts_lock:
+        if prompt_dir not in _combined_prompts:
+            _combined_prompts[prompt_dir] = load_combined_prompt(prompt_dir)
+        return _combined_prompts[prompt_dir]
+
+
+def build_prompt(template: PromptTemplate, paper_data: Dict) -> str:
+    """Substitute the paper markdown into a compiled extraction template."""
+    paper_md = paper_data.get("paper_md", "") # Use .get for safety
+    if not template.has_slot:
+        return template.text
+    if not paper_md:
+        print(f"Warning: Empty paper_md for arxiv_id {paper_data.get('arxiv_id')}")
+        return template.render("[PAPER MARKDOWN MISSING]")
+    return template.render(paper_md)
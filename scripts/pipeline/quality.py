@@ -0,0 +1,76 @@
+"""
+Quality rules for generated records.
+
+These used to exist only as filters in data_processing/process.py, which ran
+after the paper had already been checkpointed, so a rejected generation was
+paid for and never redone. The same rules now run inside `parse()`: a
+response failing any of them is neither saved, checkpointed nor cached, and
+the paper is sent again up to a retry budget. process.py applies the same
+rules to what is already on disk.
+
+Every rule takes a record (dict, or pandas row) and returns True if it passes.
+"""
+
+import re
+from typing import Callable, Dict, List
+
+from pipeline.tokens import thinking_texts
+
+# Retries per paper and entry type after a response fails the rules
+DEFAULT_QUALITY_RETRIES = 2
+
+# Message layout the prompts ask for: user and assistant alternating, every answer opening with its reasoning
+ROLES = ("user", "assistant")
+THINK_TAG = "<think>"
+
+# The model should talk about the research, not about "the paper" it was given
+SOURCE_REFERENCE_PATTERN = re.compile(r"the text|the paper|the doc|The text|The paper|The doc")
+
+
+def alternating_roles(record: Dict) -> bool:
+    """Messages alternate between user and assistant, starting with the user."""
+    return all(entry.get("role") == ROLES[index % 2] for index, entry in enumerate(record["conversations"]))
+
+def opens_with_thinking(record: Dict) -> bool:
+    """Every assistant message starts with <think>."""
+    return all(
+        entry.get("content", "").lstrip().startswith(THINK_TAG) for entry in record["conversations"] if entry.get("role") == "assistant"
+    )
+
+def has_thinking(record: Dict) -> bool:
+    """At least one assistant message has a non-empty <think> section (avg_thinking_tokens != 0)."""
+    return any(thinking_texts(record["conversations"]))
+
+def no_source_references(record: Dict) -> bool:
+    """No message mentions "the text", "the paper" or "the doc"."""
+    return not any(SOURCE_REFERENCE_PATTERN.search(entry.get("content", "")) for entry in record["conversations"])
+
+def ends_with_period(record: Dict) -> bool:
+    """The last assistant message ends with a period."""
+    assistant_msgs = [msg for msg in record["conversations"] if msg.get("role") == "assistant"]
+    if not assistant_msgs:
+        return False
+    last_msg = assistant_msgs[-1].get("content", "").strip()
+    return len(last_msg) > 0 and last_msg[-1] == "."
+
+
+RULES: Dict[str, Callable[[Dict], bool]] = {
+    "alternating_roles": alternating_roles,
+    "opens_with_thinking": opens_with_thinking,
+    "has_thinking": has_thinking,
+    "no_source_references": no_source_references,
+    "ends_with_period": ends_with_period,
+}
+
+
+def failed_rules(record: Dict) -> List[str]:
+    """Names of the rules a record fails (empty if it passes all of them)."""
+    failed = []
+    for name, rule in RULES.items():
+        try:
+            if not rule(record):
+                failed.append(name)
+        except Exception as e:
+            print(f"Warning: Quality rule {name} raised {e}, treating as failed.")
+            failed.append(name)
+    return failed
@@ -0,0 +1,374 @@
+"""
+Asyncio scheduler driving several backends from one paper stream.
+
+Papers are read once and turned into work units, a chunk of papers for one
+entry type, on a single shared queue. Multi-short and single-long units are
+interleaved over the same stream, so both entry types are generated at the
+same time instead of in two passes, and optional per-type quotas cap how many
+papers each type is scheduled for. Every backend pulls the next unit as soon
+as one of its slots is idle, so a fast or generously rate-limited provider
+simply takes more units and the overall throughput is the sum of what the
+selected providers allow.
+
+Curator calls are blocking (Curator runs its own event loop), so each one is
+run in a worker thread with `asyncio.to_thread`. Each backend keeps one
+Curator call in flight per entry type, and splits its units into batches that
+are paced by the adaptive limiter of its provider (see `pipeline.limiter`),
+which both entry types share.
+
+With `combined`, papers that need both entry types go into combined units,
+answered by one request per paper (see `CombinedExtractor`); papers missing
+a single type, and the rejected halves of combined responses, still go
+through that type's own extractor.
+
+Papers a backend got no response for at all (dropped by Curator, or lost to
+a failing call) go to the dead-letter queue (see `pipeline.deadletter`); a
+task per backend sends them again as their backoff expires, and the run only
+ends once none of them is pending.
+
+In batch mode (see `pipeline.batch`) units are submitted as batch jobs
+instead, without pacing, and once the stream is exhausted every backend waits
+for its jobs and submits the rejected papers again until none are left.
+Failed batch items are retried by the batch tracker, not the dead-letter queue.
+"""
+
+import time
+import asyncio
+import threading
+import traceback
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pipeline.batch import batch_enabled, get_batch_tracker
+from pipeline.checkpoint import legacy_checkpoint_path
+from pipeline.config import COMBINED_ENTRY_TYPE, DATASET_PATH, DEFAULT_CHUNK_SIZE, ENTRY_TYPES
+from pipeline.deadletter import DROPPED, get_dead_letters
+from pipeline.extractors import build_combined_extractor, build_extractors
+from pipeline.limiter import is_throttle_error, limiter_for_backend
+from pipeline.prompts import PromptTemplate, get_combined_prompt
+from pipeline.quality import DEFAULT_QUALITY_RETRIES
+from pipeline.store import STORE_PATH, CheckpointStore, get_store
+from pipeline.tokens import close_counter
+from pipeline.writer import close_all
+
+# Sentinel value to signal the end of the paper stream
+END_SENTINEL = None
+# Seconds between checks for due dead letters while the stream is still being processed
+DEAD_LETTER_POLL = 5.0
+
+
+class BackendWorker:
+    """Extractors, checkpoints and counters for one backend."""
+
+    def __init__(
+        self,
+        backend: Dict,
+        prompts: Dict[str, PromptTemplate],
+        dataset_path: str = DATASET_PATH,
+        store_path: str = STORE_PATH,
+        quality_retries: int = DEFAULT_QUALITY_RETRIES,
+        combined_prompt: Optional[PromptTemplate] = None,
+    ):
+        self.name = backend["name"]
+        self.quality_retries = quality_retries
+        self.extractors = build_extractors(backend, prompts, dataset_path, store_path)
+        self.combined = build_combined_extractor(backend, combined_prompt, dataset_path, store_path) if combined_prompt else None
+        self.limiter = limiter_for_backend(backend)
+        self.expected = {entry_type: 0 for entry_type in ENTRY_TYPES}
+        self.completed = {entry_type: 0 for entry_type in ENTRY_TYPES}
+        self.rejected = {entry_type: 0 for entry_type in ENTRY_TYPES}
+        # Curator LLMs are not meant to be called concurrently, keep one call per extractor
+        self._busy = {kind: threading.Lock() for kind in self.kinds}
+        self._counts_lock = threading.Lock()
+
+        store = get_store(store_path)
+        for entry_type in self.extractors:
+            store.import_legacy_generation_checkpoint(legacy_checkpoint_path(entry_type, self.name), entry_type, self.name)
+            print(f"Found {store.count_generated(entry_type, self.name)} papers already processed by {self.name} ({entry_type})")
+
+    @property
+    def kinds(self) -> List[str]:
+        """Kinds of units this backend takes: the entry types, and combined units if enabled."""
+        return list(self.extractors) + ([COMBINED_ENTRY_TYPE] if self.combined else [])
+
+    def extractor_for(self, kind: str):
+        return self.combined if kind == COMBINED_ENTRY_TYPE else self.extractors[kind]
+
+    def process_unit(self, kind: str, papers: List[Dict]):
+        """Run one entry type's (or the combined) extractor over a unit (blocking, called from a worker thread)."""
+        extractor = self.extractor_for(kind)
+        halves: Dict[str, List[Dict]] = {}
+        with self._busy[kind]:
+            # Rejected papers are retried in rounds, so all rows of a Curator call have the same keys
+            while papers:
+                rejected = []
+                while papers:
+                    batch_size = self.limiter.batch_size() if self.limiter else len(papers)
+                    batch, papers = papers[:batch_size], papers[batch_size:]
+                    for entry_type, paper in self._process_batch(kind, extractor, batch):
+                        (rejected if entry_type == kind else halves.setdefault(entry_type, [])).append(paper)
+                papers = self._retries(kind, rejected)
+        # Rejected halves of combined responses are retried with their own entry type's extractor
+        for entry_type, rejected in halves.items():
+            retries = self._retries(entry_type, rejected)
+            if retries:
+                self.process_unit(entry_type, retries)
+
+    def _retries(self, entry_type: str, rejected: List[Dict]) -> List[Dict]:
+        """Papers whose response failed the quality rules and still have retries left."""
+        retries = []
+        for paper in rejected:
+            with self._counts_lock:
+                self.rejected[entry_type] += 1
+            # The attempt number also makes the retried rows differ from the originals for Curator's cache
+            attempt = paper.get("quality_attempt", 0) + 1
+            if attempt <= self.quality_retries:
+                retries.append(dict(paper, quality_attempt=attempt))
+            else:
+                print(f"[{self.name}] Giving up on {entry_type} for {paper.get('arxiv_id')} after {attempt} rejected responses")
+        return retries
+
+    def finish_batches(self):
+        """Wait for the batch jobs of every extractor (blocking), re-submitting rejected papers."""
+        while True:
+            rejected: Dict[str, List[Dict]] = {}
+            for kind in self.kinds:
+                extractor = self.extractor_for(kind)
+                results = extractor.wait_batches()
+                self._count_completed(results)
+                print(f"[{self.name}] {kind}: {len(results)} batch responses processed")
+                for entry_type, paper in extractor.take_rejected():
+                    rejected.setdefault(entry_type, []).append(paper)
+            resubmitted = 0
+            for entry_type, papers in rejected.items():
+                retries = self._retries(entry_type, papers)
+                if retries:
+                    with self._counts_lock:
+                        self.expected[entry_type] += len(retries)
+                    resubmitted += self.extractors[entry_type].submit_batch(retries)
+            if not resubmitted:
+                break
+
+    def _count_completed(self, results: List[Dict]):
+        with self._counts_lock:
+            for result in results:
+                self.completed[result["entry_type"]] += 1
+
+    def _process_batch(self, kind: str, extractor, papers: List[Dict]) -> List[Tuple[str, Dict]]:
+        """Send one batch; returns the (entry_type, paper) of the responses the quality rules rejected."""
+        with self._counts_lock:
+            for entry_type in extractor.entry_types:
+                self.expected[entry_type] += len(papers)
+        results, error = [], None
+        try:
+            # Cached responses are replayed through parse() without a request or any rate budget
+            hits, misses = extractor.split_cached(papers)
+            results = extractor.replay_cached(hits)
+            if misses and batch_enabled():
+                # Parsed in finish_batches() once the jobs are done
+                extractor.submit_batch(misses)
+            elif misses:
+                if self.limiter:
+                    self.limiter.acquire(len(misses), sum(extractor.estimate_input_tokens(paper) for paper in misses))
+                # The results are saved *during* this call by the parse method
+                results.extend(extractor.send(misses))
+            self._count_completed(results)
+            cached = f" ({len(hits)} from the response cache)" if hits else ""
+            submitted = f", {len(misses)} submitted as batch jobs" if misses and batch_enabled() else ""
+            expected = len(papers) * len(extractor.entry_types)
+            print(f"[{self.name}] {kind}: expected {expected}, Curator processed {len(results)}{cached}{submitted}")
+            if self.limiter and misses and not batch_enabled() and len(results) == expected:
+                self.limiter.record_success()
+        except Exception as e:
+            if self.limiter and is_throttle_error(e):
+                self.limiter.record_throttle()
+            print(f"Error during {kind} extraction with {self.name}: {e}")
+            traceback.print_exc()
+            error = e
+        # Only this call parsed responses with this extractor since the last take (see _busy)
+        rejected = extractor.take_rejected()
+        if not batch_enabled():
+            # Submitted batch items aren't answered yet, the batch tracker retries the ones that fail
+            self._record_dead_letters(extractor, papers, results, rejected, error)
+        return rejected
+
+    def _record_dead_letters(
+        self, extractor, papers: List[Dict], results: List[Dict], rejected: List[Tuple[str, Dict]], error: Optional[Exception]
+    ):
+        """Queue the papers that got no response at all, and clear the ones that did."""
+        # Rejected responses were answered too; the quality retries take care of them
+        answered = {(result["arxiv_id"], result["entry_type"]) for result in results}
+        answered |= {(paper["arxiv_id"], entry_type) for entry_type, paper in rejected}
+        items = [(paper, entry_type) for paper in papers for entry_type in extractor.entry_types]
+        letters = get_dead_letters()
+        letters.resolve(self.name, [(paper["arxiv_id"], entry_type) for paper, entry_type in items if (paper["arxiv_id"], entry_type) in answered])
+        failures = [(paper, entry_type) for paper, entry_type in items if (paper["arxiv_id"], entry_type) not in answered]
+        if failures:
+            error_class = type(error).__name__ if error is not None else DROPPED
+            given_up = letters.record_failures(self.name, failures, error_class, str(error)[:500] if error is not None else None)
+            retried = f", {len(failures) - given_up} will be retried" if len(failures) > given_up else ""
+            print(f"[{self.name}] {len(failures)} requests got no response ({error_class}){retried}, {given_up} given up on")
+
+
+def pending_entry_types(arxiv_id: str, workers: List[BackendWorker], store: CheckpointStore, entry_types: Iterable[str] = ENTRY_TYPES) -> List[str]:
+    """Entry types no active backend has generated (or has in a running batch job) for this paper yet."""
+    generated = store.generated_for(arxiv_id)
+    submitted = get_batch_tracker().pending_namespaces(arxiv_id) if batch_enabled() else set()
+    dead_letters = get_dead_letters().open_for(arxiv_id)
+    return [
+        entry_type for entry_type in entry_types
+        if not any(
+            (entry_type, worker.name) in generated
+            or worker.extractors[entry_type].batch_namespace in submitted
+            or (worker.combined is not None and worker.combined.batch_namespace in submitted)
+            # Pending dead letters are retried by the backend they failed with, given-up ones wait for a reset
+            or (entry_type, worker.name) in dead_letters
+            for worker in workers
+        )
+    ]
+
+
+async def _produce(
+    papers: Iterable[Dict],
+    workers: List[BackendWorker],
+    queue: asyncio.Queue,
+    chunk_size: int,
+    store: CheckpointStore,
+    quotas: Dict[str, Optional[int]],
+    consumers: int,
+    combined: bool = False,
+) -> Dict[str, int]:
+    """Read the paper stream, drop finished papers and enqueue interleaved per-type (or combined) units."""
+    iterator = iter(papers)
+    pending = {kind: [] for kind in ENTRY_TYPES + ([COMBINED_ENTRY_TYPE] if combined else [])}
+    scheduled = {entry_type: 0 for entry_type in ENTRY_TYPES}
+
+    async def add(kind: str, paper: Dict):
+        pending[kind].append(paper)
+        if len(pending[kind]) >= chunk_size:
+            await queue.put((kind, pending[kind]))
+            pending[kind] = []
+
+    def open_types() -> List[str]:
+        return [t for t in ENTRY_TYPES if quotas.get(t) is None or scheduled[t] < quotas[t]]
+
+    while open_types():
+        # Reading the stream may block on the network, keep the event loop free
+        paper = await asyncio.to_thread(next, iterator, END_SENTINEL)
+        if paper is END_SENTINEL:
+            break
+        arxiv_id = paper.get("arxiv_id")
+        if not arxiv_id:
+            print("Warning: Skipping paper with missing arxiv_id.")
+            continue
+        entry_types = pending_entry_types(arxiv_id, workers, store, open_types())
+        for entry_type in entry_types:
+            scheduled[entry_type] += 1
+        if combined and len(entry_types) == len(ENTRY_TYPES):
+            await add(COMBINED_ENTRY_TYPE, paper)
+        else:
+            for entry_type in entry_types:
+                await add(entry_type, paper)
+    for kind, unit in pending.items():
+        if unit:
+            await queue.put((kind, unit))
+    for _ in range(consumers):
+        await queue.put(END_SENTINEL)
+    return scheduled
+
+async def _consume(worker: BackendWorker, queue: asyncio.Queue):
+    """Pull units until the stream is exhausted."""
+    while True:
+        unit = await queue.get()
+        if unit is END_SENTINEL:
+            break
+        kind, papers = unit
+        await asyncio.to_thread(worker.process_unit, kind, papers)
+
+async def _retry_dead_letters(worker: BackendWorker, chunk_size: int, stream_done: asyncio.Event):
+    """Send a backend's dead letters again as they come due, until the stream is done and none is pending."""
+    letters = get_dead_letters()
+    while True:
+        due = letters.due(worker.name, chunk_size)
+        if due:
+            units: Dict[str, List[Dict]] = {}
+            for entry_type, paper in due:
+                units.setdefault(entry_type, []).append(paper)
+            for entry_type, papers in units.items():
+                print(f"[{worker.name}] Retrying {len(papers)} {entry_type} papers from the dead-letter queue")
+                await asyncio.to_thread(worker.process_unit, entry_type, papers)
+            continue
+        next_attempt = letters.next_attempt(worker.name)
+        if stream_done.is_set():
+            if next_attempt is None:
+                return
+            await asyncio.sleep(max(0.0, next_attempt - time.time()))
+            continue
+        delay = DEAD_LETTER_POLL if next_attempt is None else min(DEAD_LETTER_POLL, max(0.0, next_attempt - time.time()))
+        try:
+            await asyncio.wait_for(stream_done.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_generation(
+    backends: List[Dict],
+    papers: Iterable[Dict],
+    prompts: Dict[str, PromptTemplate],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    dataset_path: str = DATASET_PATH,
+    store_path: str = STORE_PATH,
+    quotas: Optional[Dict[str, Optional[int]]] = None,
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    combined: bool = False,
+) -> List[BackendWorker]:
+    """Generate entries for `papers` with every backend in `backends` concurrently.
+
+    `quotas` maps entry types to the maximum number of papers to schedule for them
+    in this run (missing or None means no limit, 0 skips the type). Papers whose
+    response fails the quality rules are sent again up to `quality_retries` times.
+    With `combined`, both entry types of a paper are requested at once.
+    """
+    combined_prompt = get_combined_prompt() if combined else None
+    workers = [BackendWorker(backend, prompts, dataset_path, store_path, quality_retries, combined_prompt) for backend in backends]
+    # One Curator call in flight per kind of unit and backend; the provider limiter is shared
+    consumers = [worker for worker in workers for _ in worker.kinds]
+    # One unit of prefetch per consumer keeps memory bounded while no consumer waits on the stream
+    queue = asyncio.Queue(maxsize=len(consumers))
+
+    producer = asyncio.create_task(_produce(
+        papers, workers, queue, chunk_size, get_store(store_path), quotas or {}, len(consumers), combined
+    ))
+    stream_done = asyncio.Event()
+    # Includes dead letters left pending by an earlier run, which need no paper from the stream
+    retriers = [] if batch_enabled() else [asyncio.create_task(_retry_dead_letters(worker, chunk_size, stream_done)) for worker in workers]
+    await asyncio.gather(producer, *(_consume(worker, queue) for worker in consumers))
+    stream_done.set()
+    await asyncio.gather(*retriers)
+    if batch_enabled():
+        await asyncio.gather(*(asyncio.to_thread(worker.finish_batches) for worker in workers))
+    scheduled = ", ".join(f"{count} {entry_type}" for entry_type, count in producer.result().items())
+    print(f"Scheduled {scheduled} papers across {len(workers)} backend(s).")
+    return workers
+
+
+def generate(
+    backends: List[Dict],
+    papers: Iterable[Dict],
+    prompts: Dict[str, PromptTemplate],
+    chunk_size: Optional[int] = None,
+    quotas: Optional[Dict[str, Optional[int]]] = None,
+    quality_retries: int = DEFAULT_QUALITY_RETRIES,
+    dataset_path: str = DATASET_PATH,
+    store_path: str = STORE_PATH,
+    combined: bool = False,
+) -> List[BackendWorker]:
+    """Blocking wrapper around `run_generation`."""
+    try:
+        return asyncio.run(run_generation(
+            backends, papers, prompts, chunk_size or DEFAULT_CHUNK_SIZE, dataset_path, store_path,
+            quotas=quotas, quality_retries=quality_retries, combined=combined
+        ))
+    finally:
+        # Records are saved once their tokens are counted, so drain the counter before the writers
+        close_counter()
+        close_all()
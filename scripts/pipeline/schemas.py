@@ -0,0 +1,49 @@
+from typing import Dict, List
+from pydantic import BaseModel, Field
+
+from pipeline.config import COMBINED_ENTRY_TYPE, COMBINED_FIELDS
+
+
+# Define Pydantic models for structured output
+class ConversationEntry(BaseModel):
+    role: str = Field(description="The role of the participant in the conversation (user or assistant)")
+    content: str = Field(description="The content of the message")
+
+class Conversation(BaseModel):
+    conversations: List[ConversationEntry] = Field(description="List of conversation entries")
+
+class CombinedConversations(BaseModel):
+    multi_short: List[ConversationEntry] = Field(description="Conversation entries of the multi-short task (several question/answer turns)")
+    single_long: List[ConversationEntry] = Field(description="Conversation entries of the single-long task (one question and one long answer)")
+
+
+def response_format_for(entry_type: str):
+    return CombinedConversations if entry_type == COMBINED_ENTRY_TYPE else Conversation
+
+def split_response(entry_type: str, response) -> Dict[str, Conversation]:
+    """The conversation of every entry type in a response: one, or both for a combined response."""
+    if entry_type != COMBINED_ENTRY_TYPE:
+        return {entry_type: response}
+    return {t: Conversation(conversations=getattr(response, field)) for t, field in COMBINED_FIELDS.items()}
+
+
+def record_from_response(paper_data: Dict, entry_type: str, model: str, response: Conversation) -> Dict:
+    """Turn a structured response into a zraw.jsonl record (avg_thinking_tokens still to be filled in)."""
+    conversations = [{"role": entry.role, "content": entry.content} for entry in response.conversations]
+    return build_record(paper_data, entry_type, model, conversations)
+
+
+def build_record(paper_data: Dict, entry_type: str, model: str, conversations: List[Dict], avg_thinking_tokens: float = 0.0) -> Dict:
+    """Build the zraw.jsonl record for one generated conversation."""
+    return {
+        "arxiv_id": paper_data.get("arxiv_id", "UNKNOWN_ID"),
+        "paper_doi": paper_data.get("paper_doi", ""),
+        "paper_authors": paper_data.get("paper_authors", []),
+        "paper_published_date": paper_data.get("paper_published_date", ""),
+        "paper_updated_date": paper_data.get("paper_updated_date", ""),
+        "conversations": conversations,
+        "entry_type": entry_type,
+        "categories": paper_data.get("categories", []),
+        "avg_thinking_tokens": avg_thinking_tokens,
+        "model": model
+    }
@@ -0,0 +1,76 @@
+"""
+Deterministic sharding of the paper stream across processes and hosts.
+
+`--shard i/n` keeps only the papers whose arxiv_id hashes to shard i of n.
+The hash is blake2b of the id, so every host computes the same assignment
+without any coordination. The shards of one `--limit` are disjoint and
+together cover exactly the papers an unsharded run would read.
+
+Each shard writes its own output, checkpoint store and dead-letter queue
+(under `shards/` next to the regular ones), so hosts never share a file. To combine them, copy the
+shard stores from every host into data/checkpoints/shards/ and run
+`generate.py --merge-shards`: the generations are merged into the main store
+(first record per paper, entry type and model wins, as in a single run) and
+zraw.jsonl is rebuilt from it.
+"""
+
+import os
+import glob
+import hashlib
+from typing import NamedTuple, Optional
+
+from pipeline.config import CHECKPOINT_DIR, DATASET_DIR, DATASET_PATH
+
+SHARD_DATASET_DIR = os.path.join(DATASET_DIR, "shards")
+SHARD_STORE_DIR = os.path.join(CHECKPOINT_DIR, "shards")
+
+
+def shard_of(arxiv_id: str, count: int) -> int:
+    """Shard (0 to count - 1) a paper belongs to; stable across processes, hosts and Python versions."""
+    digest = hashlib.blake2b(arxiv_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    @property
+    def name(self) -> str:
+        return f"shard-{self.index}-of-{self.count}"
+
+    def contains(self, arxiv_id: str) -> bool:
+        return shard_of(arxiv_id, self.count) == self.index
+
+    def dataset_path(self) -> str:
+        root, ext = os.path.splitext(os.path.basename(DATASET_PATH))
+        return os.path.join(SHARD_DATASET_DIR, f"{root}.{self.name}{ext}")
+
+    def store_path(self) -> str:
+        return os.path.join(SHARD_STORE_DIR, f"store.{self.name}.sqlite")
+
+    def dead_letters_path(self) -> str:
+        return os.path.join(SHARD_STORE_DIR, f"dead_letters.{self.name}.sqlite")
+
+
+def merge_shards(dataset_path: str = DATASET_PATH, store_path: Optional[str] = None, shard_dir: str = SHARD_STORE_DIR) -> int:
+    """Merge every shard store in `shard_dir` into the main store and rebuild `dataset_path`."""
+    from pipeline.checkpoint import rewrite_results
+    from pipeline.store import STORE_PATH, get_store
+
+    paths = sorted(glob.glob(os.path.join(shard_dir, "store.shard-*.sqlite")))
+    if not paths:
+        print(f"No shard stores found in {shard_dir}.")
+        return 0
+    store = get_store(store_path or STORE_PATH)
+    merged = 0
+    for path in paths:
+        added = store.merge_from(path)
+        merged += added
+        print(f"  {os.path.basename(path)}: {added} new records")
+    count = rewrite_results(dataset_path, store.iter_generations())
+    print(f"Merged {merged} records from {len(paths)} shard(s); rebuilt {dataset_path} with {count} records.")
+    return merged
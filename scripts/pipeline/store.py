@@ -0,0 +1,276 @@
+"""
+SQLite checkpoint store shared by generation and verification.
+
+A generated record is stored as one row keyed by (arxiv_id, entry_type, model)
+and a verification as one row keyed by (content_id, verifier), so writing the
+result *is* writing the checkpoint: both happen in the same transaction and a
+crash can never record one without the other. Lookups go through the primary
+key index instead of loading the whole history into a set.
+
+The database runs in WAL mode, so several threads and processes can write to it
+concurrently while readers are never blocked.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from pipeline.config import CHECKPOINT_DIR
+
+STORE_PATH = os.path.join(CHECKPOINT_DIR, "store.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    arxiv_id TEXT NOT NULL,
+    entry_type TEXT NOT NULL,
+    model TEXT NOT NULL,
+    record TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (arxiv_id, entry_type, model)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS verifications (
+    content_id TEXT NOT NULL,
+    verifier TEXT NOT NULL,
+    arxiv_id TEXT,
+    record TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (content_id, verifier)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS token_counts (
+    hash BLOB PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+
+class CheckpointStore:
+    """Results and checkpoints of generation and verification runs."""
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn.executescript(SCHEMA)
+
+    # The store is referenced from Curator's parse methods, which Curator hashes by pickling.
+    # Only the path is state worth carrying over; connections are reopened lazily.
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._local = threading.local()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    # --- Generation ---
+    def is_generated(self, arxiv_id: str, entry_type: str, model: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM generations WHERE arxiv_id = ? AND entry_type = ? AND model = ?",
+            (arxiv_id, entry_type, model)
+        ).fetchone()
+        return row is not None
+
+    def generated_for(self, arxiv_id: str) -> Set[Tuple[str, str]]:
+        """(entry_type, model) pairs already generated for a paper."""
+        rows = self._conn.execute(
+            "SELECT entry_type, model FROM generations WHERE arxiv_id = ?", (arxiv_id,)
+        ).fetchall()
+        return set(rows)
+
+    def is_complete(self, arxiv_id: str, entry_types: Iterable[str], models: Iterable[str]) -> bool:
+        """Whether every entry type was generated for a paper by at least one of `models`."""
+        generated = self.generated_for(arxiv_id)
+        return all(any((entry_type, model) in generated for model in models) for entry_type in entry_types)
+
+    def save_generation(self, record: Dict) -> bool:
+        """Store a record and its checkpoint atomically. Returns False if it was already stored."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO generations (arxiv_id, entry_type, model, record, created_at) VALUES (?, ?, ?, ?, ?)",
+                (record["arxiv_id"], record["entry_type"], record["model"], json.dumps(record), time.time())
+            )
+        return cursor.rowcount > 0
+
+    def count_generated(self, entry_type: str, model: str) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM generations WHERE entry_type = ? AND model = ?", (entry_type, model)
+        ).fetchone()[0]
+
+    def replace_generations(self, records: Iterable[Dict]) -> int:
+        """Overwrite stored records (e.g. after re-parsing), keeping their original insertion time."""
+        now = time.time()
+        rows = [(r["arxiv_id"], r["entry_type"], r["model"], json.dumps(r), now) for r in records]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO generations (arxiv_id, entry_type, model, record, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (arxiv_id, entry_type, model) DO UPDATE SET record = excluded.record",
+                rows
+            )
+        return len(rows)
+
+    def merge_from(self, path: str) -> int:
+        """Copy the generations and token counts of another store (e.g. a shard) that aren't here yet.
+
+        A record also replaces a legacy checkpoint (a row without record) for the same paper, entry type and model.
+        """
+        # ATTACH must run outside of a transaction
+        self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            with self._transaction() as conn:
+                # "WHERE true" keeps SQLite from reading ON CONFLICT as part of the SELECT's join
+                cursor = conn.execute(
+                    "INSERT INTO generations (arxiv_id, entry_type, model, record, created_at) "
+                    "SELECT arxiv_id, entry_type, model, record, created_at FROM other.generations WHERE true "
+                    "ON CONFLICT (arxiv_id, entry_type, model) DO UPDATE SET record = excluded.record, created_at = excluded.created_at "
+                    "WHERE generations.record IS NULL AND excluded.record IS NOT NULL"
+                )
+                conn.execute("INSERT OR IGNORE INTO token_counts SELECT * FROM other.token_counts")
+        finally:
+            self._conn.execute("DETACH DATABASE other")
+        return cursor.rowcount
+
+    def iter_generations(self) -> Iterator[Dict]:
+        """Yield every stored record in insertion order (legacy checkpoints have no record)."""
+        cursor = self._conn.execute(
+            "SELECT record FROM generations WHERE record IS NOT NULL ORDER BY created_at"
+        )
+        for (record,) in cursor:
+            yield json.loads(record)
+
+    # --- Verification ---
+    def is_verified(self, content_id: str, verifier: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM verifications WHERE content_id = ? AND verifier = ?", (content_id, verifier)
+        ).fetchone()
+        return row is not None
+
+    def save_verification(self, content_id: str, verifier: str, record: Dict) -> bool:
+        """Store a verification result and its checkpoint atomically."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO verifications (content_id, verifier, arxiv_id, record, created_at) VALUES (?, ?, ?, ?, ?)",
+                (content_id, verifier, record.get("arxiv_id"), json.dumps(record), time.time())
+            )
+        return cursor.rowcount > 0
+
+    # --- Thinking token counts, keyed by content hash ---
+    def get_token_counts(self, hashes: Iterable[bytes]) -> Dict[bytes, int]:
+        hashes = list(hashes)
+        counts = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            placeholders = ", ".join("?" for _ in part)
+            rows = self._conn.execute(
+                f"SELECT hash, count FROM token_counts WHERE hash IN ({placeholders})", part
+            ).fetchall()
+            counts.update(rows)
+        return counts
+
+    def save_token_counts(self, counts: Dict[bytes, int]):
+        if not counts:
+            return
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO token_counts (hash, count) VALUES (?, ?)", counts.items())
+
+    # --- Migration of the old .checkpoint_* text files ---
+    def _legacy_file_changed(self, conn: sqlite3.Connection, path: str) -> Optional[int]:
+        """Size of a legacy file if it exists and wasn't imported at that size yet."""
+        if not os.path.exists(path):
+            return None
+        size = os.path.getsize(path)
+        row = conn.execute("SELECT size FROM legacy_imports WHERE path = ?", (path,)).fetchone()
+        return None if row is not None and row[0] == size else size
+
+    def import_legacy_generation_checkpoint(self, path: str, entry_type: str, model: str) -> int:
+        """Import an old one-arxiv_id-per-line checkpoint file (only once per file version)."""
+        with self._transaction() as conn:
+            size = self._legacy_file_changed(conn, path)
+            if size is None:
+                return 0
+            now = time.time()
+            with open(path, "r") as f:
+                rows = [(line.strip(), entry_type, model, now) for line in f if line.strip()]
+            conn.executemany(
+                "INSERT OR IGNORE INTO generations (arxiv_id, entry_type, model, record, created_at) VALUES (?, ?, ?, NULL, ?)",
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO legacy_imports (path, size) VALUES (?, ?)", (path, size))
+        print(f"Imported {len(rows)} checkpoint entries from {path}")
+        return len(rows)
+
+    def import_legacy_verifier_checkpoint(self, path: str, verifier: str) -> int:
+        """Import an old verifier checkpoint file with one `arxiv_id_content_id` key per line."""
+        with self._transaction() as conn:
+            size = self._legacy_file_changed(conn, path)
+            if size is None:
+                return 0
+            now = time.time()
+            rows = []
+            with open(path, "r") as f:
+                for line in f:
+                    composite_key = line.strip()
+                    # content_id is a 36 character UUID, arxiv_ids may themselves contain '_'
+                    if len(composite_key) > 37:
+                        rows.append((composite_key[-36:], verifier, composite_key[:-37], now))
+            conn.executemany(
+                "INSERT OR IGNORE INTO verifications (content_id, verifier, arxiv_id, record, created_at) VALUES (?, ?, ?, NULL, ?)",
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO legacy_imports (path, size) VALUES (?, ?)", (path, size))
+        print(f"Imported {len(rows)} verifier checkpoint entries from {path}")
+        return len(rows)
+
+
+class _Transaction:
+    """`with` block running in a BEGIN IMMEDIATE ... COMMIT transaction."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        # IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout
+        # instead of failing with "database is locked" when upgrading a read transaction.
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+_stores: Dict[str, CheckpointStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(path: str = STORE_PATH) -> CheckpointStore:
+    """Process-wide store for `path`."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = CheckpointStore(path)
+        return _stores[path]
@@ -0,0 +1,191 @@
+"""
+Incremental checking of streamed `Conversation` responses.
+
+`ConversationStream` is fed the response text chunk by chunk as it is
+streamed and scans the JSON as it arrives, without waiting for the document
+to be complete. It stops at the first violated hard rule, so the client can
+cancel the request instead of paying for the rest of a response that would
+be rejected anyway. The hard rules are the rules of `pipeline.quality.RULES`
+that can be decided on part of a response (STREAMED_RULES), reported under
+the same names, plus the output budget:
+
+- alternating_roles: a role other than user/assistant, or messages that don't
+  alternate starting with the user;
+- opens_with_thinking: an assistant message that doesn't open with <think>;
+- no_source_references: checked on the message text while it is being written;
+- max_output_tokens: the response grew past the output budget (runaway output).
+
+Only the direct Together AI client streams; Curator doesn't expose the
+response stream, so the Curator scripts keep checking complete responses
+(see pipeline/quality.py, whose rules still run on every finished response).
+"""
+
+import json
+from typing import Dict, List, Optional
+
+from pipeline.limiter import estimate_tokens
+from pipeline.quality import ROLES, SOURCE_REFERENCE_PATTERN, THINK_TAG
+
+DEFAULT_MAX_OUTPUT_TOKENS = 32_000
+# Quality rules checked while streaming; the others (e.g. ends_with_period) need the complete response
+STREAMED_RULES = ("alternating_roles", "opens_with_thinking", "no_source_references")
+# Characters of already scanned text searched again, so matches spanning two chunks are found
+PATTERN_OVERLAP = 16
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class StreamAborted(Exception):
+    """A streamed response violated a hard rule and was cancelled."""
+
+    def __init__(self, rule: str, text: str):
+        super().__init__(f"response violated {rule}")
+        self.rule = rule
+        self.text = text # What had been received when it was cancelled
+
+
+class ConversationStream:
+    """Scans a streamed `Conversation` JSON document and reports the first rule violation."""
+
+    def __init__(self, max_output_tokens: Optional[int] = DEFAULT_MAX_OUTPUT_TOKENS):
+        self.max_output_tokens = max_output_tokens
+        self.chunks: List[str] = []
+        self.length = 0
+        self.violation: Optional[str] = None
+        self.messages = 0 # Roles seen so far
+        # JSON scanner state
+        self._stack: List[Dict] = [] # One frame per open object or array
+        self._in_string = False
+        self._escape: Optional[str] = None # "\\" after a backslash, "u..." inside a \u escape
+        self._string: List[str] = []
+        self._string_role: Optional[str] = None # "key", "role", "content" or None for other strings
+        self._scanned = 0 # Characters of the current content string already searched
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Scan the next piece of the response; returns the violated rule, if any."""
+        if self.violation is not None or not chunk:
+            return self.violation
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        if self.max_output_tokens is not None and estimate_tokens(self.length) > self.max_output_tokens:
+            return self._fail("max_output_tokens")
+        for char in chunk:
+            if self._in_string:
+                self._string_char(char)
+            else:
+                self._structural_char(char)
+            if self.violation is not None:
+                return self.violation
+        if self._in_string and self._string_role == "content":
+            self._check_content(final=False)
+        return self.violation
+
+    def _fail(self, rule: str) -> str:
+        if self.violation is None:
+            self.violation = rule
+        return self.violation
+
+    # --- Scanner ---
+    def _structural_char(self, char: str):
+        frame = self._stack[-1] if self._stack else None
+        if char == '"':
+            self._in_string = True
+            self._string = []
+            self._scanned = 0
+            if frame is not None and frame["type"] == "object" and frame["expect_key"]:
+                self._string_role = "key"
+            elif frame is not None and frame["type"] == "object" and frame["key"] in ("role", "content"):
+                self._string_role = frame["key"]
+            else:
+                self._string_role = None
+        elif char == "{":
+            self._stack.append({"type": "object", "expect_key": True, "key": None, "role": None, "content": None, "opening_checked": False})
+        elif char == "[":
+            self._stack.append({"type": "array"})
+        elif char in "}]":
+            if self._stack:
+                closed = self._stack.pop()
+                if closed["type"] == "object" and closed["content"] is not None:
+                    self._end_message(closed)
+        elif char == ":" and frame is not None and frame["type"] == "object":
+            frame["expect_key"] = False
+        elif char == "," and frame is not None and frame["type"] == "object":
+            frame["expect_key"] = True
+            frame["key"] = None
+
+    def _string_char(self, char: str):
+        if self._escape is not None:
+            if self._escape.startswith("u"):
+                self._escape += char
+                if len(self._escape) == 5:
+                    try:
+                        self._string.append(chr(int(self._escape[1:], 16)))
+                    except ValueError:
+                        pass
+                    self._escape = None
+            elif char == "u":
+                self._escape = "u"
+            else:
+                self._string.append(_ESCAPES.get(char, char))
+                self._escape = None
+        elif char == "\\":
+            self._escape = "\\"
+        elif char == '"':
+            self._in_string = False
+            self._end_string()
+        elif self._string_role is not None:
+            self._string.append(char)
+
+    def _end_string(self):
+        frame = self._stack[-1] if self._stack else None
+        value = "".join(self._string)
+        if self._string_role == "key" and frame is not None:
+            frame["key"] = value
+        elif self._string_role == "role":
+            frame["role"] = value
+            self._check_role(value)
+            if frame["content"] is not None:
+                self._check_thinking(frame["role"], frame["content"])
+        elif self._string_role == "content":
+            self._check_content(final=True)
+            frame["content"] = value
+            self._check_thinking(frame["role"], value)
+        self._string_role = None
+
+    def _end_message(self, frame: Dict):
+        if frame["role"] is None:
+            self._fail("alternating_roles")
+
+    # --- Rules ---
+    def _check_role(self, role: str):
+        expected = ROLES[self.messages % 2]
+        self.messages += 1
+        if role != expected:
+            self._fail("alternating_roles")
+
+    def _check_content(self, final: bool):
+        """Source references in the content written so far; the opening <think> once it can be decided."""
+        # Only the new characters (and a little overlap) are searched, so long messages stay linear
+        tail = "".join(self._string[max(0, self._scanned - PATTERN_OVERLAP):])
+        if SOURCE_REFERENCE_PATTERN.search(tail):
+            self._fail("no_source_references")
+            return
+        self._scanned = len(self._string)
+        frame = self._stack[-1]
+        if not final and not frame["opening_checked"]:
+            opening = "".join(self._string[:len(THINK_TAG) + PATTERN_OVERLAP]).lstrip()
+            if len(opening) >= len(THINK_TAG):
+                frame["opening_checked"] = True
+                self._check_thinking(frame["role"], opening)
+
+    def _check_thinking(self, role: Optional[str], content: str):
+        if role == "assistant" and not content.lstrip().startswith(THINK_TAG):
+            self._fail("opens_with_thinking")
+
+    def finish(self) -> Dict:
+        """Parse the complete response (raises json.JSONDecodeError if it isn't valid JSON)."""
+        return json.loads(self.text)
@@ -0,0 +1,306 @@
+"""
+Per-request telemetry: latency, tokens, retries, errors and cost per model.
+
+Every request and every parsed response is recorded in a process-wide
+registry and appended as an event to a JSONL log under data/metrics (one
+file per process, through the group-commit writer). The registry keeps
+counters and a window of recent latencies per (source, model), from which
+`summary()` derives p50/p95/p99 latency, output tokens per second of request
+time and dollars per accepted record. `serve_metrics(port)` exposes the same
+numbers in the Prometheus text format.
+
+Curator doesn't report per-request timings or usage to `parse()`, so for the
+Curator scripts a "request" is one Curator call (its latency is the wall time
+of the whole batch) and tokens are estimated from the character counts.
+The direct Together AI client records every HTTP attempt with the usage the
+API returns.
+"""
+
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from pipeline.cache import replaying
+from pipeline.config import METRICS_DIR
+from pipeline.limiter import estimate_tokens
+from pipeline.writer import get_writer
+
+LATENCY_WINDOW = 10_000 # Latencies kept per model for the percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "academic_chains"
+
+# USD per million (input, output) tokens, list prices when the models were used.
+# Models missing here are reported without cost.
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-flash-preview-04-17": (0.15, 0.60),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-pro-exp-03-25": (0.0, 0.0), # Free experimental model
+    "deepseek-ai/DeepSeek-V3": (1.25, 1.25),
+    "meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8": (0.27, 0.85),
+    "meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo": (0.88, 0.88),
+    "command-a-03-2025": (2.50, 10.00),
+    "qwen-rdc-7b": (0.0, 0.0), # Local (Ollama)
+}
+# Price multipliers by source suffix: provider batch APIs bill half the list price
+PRICE_FACTORS = {"-batch": 0.5}
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q * len(sorted_values))
+    return sorted_values[max(0, rank - 1)]
+
+
+class ModelStats:
+    """Counters of one (source, model) pair."""
+
+    __slots__ = ("requests", "errors", "retries", "accepted", "rejected", "input_tokens", "output_tokens", "request_seconds", "latencies")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.request_seconds = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def cost(self, model: str, source: str = "") -> Optional[float]:
+        if model not in PRICES:
+            return None
+        input_price, output_price = PRICES[model]
+        factor = next((f for suffix, f in PRICE_FACTORS.items() if source.endswith(suffix)), 1.0)
+        return factor * (self.input_tokens * input_price + self.output_tokens * output_price) / 1_000_000
+
+
+class Telemetry:
+    """Thread-safe metrics registry with an optional JSONL event log."""
+
+    def __init__(self, event_path: Optional[str] = None):
+        self.event_path = event_path
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, source: str, model: str) -> ModelStats:
+        key = (source, model)
+        if key not in self._stats:
+            self._stats[key] = ModelStats()
+        return self._stats[key]
+
+    def _log(self, event: Dict):
+        if self.event_path is None:
+            return
+        try:
+            get_writer(self.event_path).write(event)
+        except Exception as e:
+            print(f"Warning: Could not log telemetry event. Error: {e}")
+
+    def record_request(
+        self,
+        source: str,
+        model: str,
+        latency: float,
+        requests: int = 1,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        retries: int = 0,
+        error: Optional[str] = None,
+    ):
+        """Record one request (or one Curator call covering `requests` requests)."""
+        with self._lock:
+            stats = self._entry(source, model)
+            stats.requests += requests
+            stats.retries += retries
+            stats.errors += 1 if error else 0
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+            stats.request_seconds += latency
+            stats.latencies.append(latency)
+        self._log({
+            "ts": time.time(), "event": "request", "source": source, "model": model,
+            "latency": round(latency, 4), "requests": requests, "input_tokens": input_tokens,
+            "output_tokens": output_tokens, "retries": retries, "error": error,
+        })
+
+    def record_outcome(self, source: str, model: str, accepted: bool, output_tokens: int = 0, arxiv_id: Optional[str] = None):
+        """Record a parsed response, accepted (saved) or rejected."""
+        with self._lock:
+            stats = self._entry(source, model)
+            if accepted:
+                stats.accepted += 1
+            else:
+                stats.rejected += 1
+            stats.output_tokens += output_tokens
+        self._log({
+            "ts": time.time(), "event": "outcome", "source": source, "model": model,
+            "accepted": accepted, "output_tokens": output_tokens, "arxiv_id": arxiv_id,
+        })
+
+    def summary(self) -> Dict[Tuple[str, str], Dict]:
+        """Derived metrics per (source, model)."""
+        with self._lock:
+            items = [(key, stats, sorted(stats.latencies)) for key, stats in self._stats.items()]
+        summary = {}
+        for (source, model), stats, latencies in items:
+            cost = stats.cost(model, source)
+            summary[(source, model)] = {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "retries": stats.retries,
+                "accepted": stats.accepted,
+                "rejected": stats.rejected,
+                "input_tokens": stats.input_tokens,
+                "output_tokens": stats.output_tokens,
+                **{f"p{int(q * 100)}": percentile(latencies, q) for q in QUANTILES},
+                "tokens_per_second": stats.output_tokens / stats.request_seconds if stats.request_seconds else None,
+                "cost": cost,
+                "cost_per_accepted": cost / stats.accepted if cost is not None and stats.accepted else None,
+            }
+        return summary
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n--- Request metrics ---")
+        for (source, model), m in sorted(summary.items()):
+            latency = ", ".join(f"p{int(q * 100)} {_format(m[f'p{int(q * 100)}'], '.1f')}s" for q in QUANTILES)
+            print(f"{source} / {model}:")
+            print(f"  requests {m['requests']} (errors {m['errors']}, retries {m['retries']}), records accepted {m['accepted']}, rejected {m['rejected']}")
+            print(f"  latency {latency}; tokens in {m['input_tokens']}, out {m['output_tokens']} ({_format(m['tokens_per_second'], '.1f')} tok/s)")
+            print(f"  cost ${_format(m['cost'], '.4f')}, ${_format(m['cost_per_accepted'], '.5f')} per accepted record")
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            items = [(key, stats, sorted(stats.latencies)) for key, stats in self._stats.items()]
+        counters = {
+            "requests_total": ("Requests sent", lambda s, key: s.requests),
+            "errors_total": ("Requests that failed", lambda s, key: s.errors),
+            "retries_total": ("Requests that were retries", lambda s, key: s.retries),
+            "records_accepted_total": ("Parsed responses that were saved", lambda s, key: s.accepted),
+            "records_rejected_total": ("Parsed responses rejected by the quality rules", lambda s, key: s.rejected),
+            "input_tokens_total": ("Input tokens (estimated for Curator)", lambda s, key: s.input_tokens),
+            "output_tokens_total": ("Output tokens (estimated for Curator)", lambda s, key: s.output_tokens),
+            "cost_usd_total": ("Estimated cost in USD", lambda s, key: s.cost(key[1], key[0])),
+        }
+        lines = []
+        for name, (help_text, value) in counters.items():
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for (source, model), stats, _ in items:
+                v = value(stats, (source, model))
+                if v is not None:
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{_labels(source, model)}}} {v}")
+        name = f"{METRIC_PREFIX}_request_latency_seconds"
+        lines.append(f"# HELP {name} Request latency (whole batch for Curator calls)")
+        lines.append(f"# TYPE {name} summary")
+        for (source, model), stats, latencies in items:
+            labels = _labels(source, model)
+            for q in QUANTILES:
+                v = percentile(latencies, q)
+                if v is not None:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {v}')
+            lines.append(f"{name}_sum{{{labels}}} {stats.request_seconds}")
+            lines.append(f"{name}_count{{{labels}}} {len(stats.latencies)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format(value: Optional[float], spec: str) -> str:
+    return "n/a" if value is None else format(value, spec)
+
+def _labels(source: str, model: str) -> str:
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'source="{escape(source)}",model="{escape(model)}"'
+
+
+# --- Process-wide registry ---
+_settings = {"log_events": True, "events_dir": METRICS_DIR}
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+def configure_telemetry(log_events: Optional[bool] = None, events_dir: Optional[str] = None):
+    """Enable/disable the JSONL event log, before the registry is first used."""
+    if log_events is not None:
+        _settings["log_events"] = log_events
+    if events_dir is not None:
+        _settings["events_dir"] = events_dir
+
+def get_telemetry() -> Telemetry:
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            event_path = None
+            if _settings["log_events"]:
+                event_path = os.path.join(_settings["events_dir"], f"events-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+            _telemetry = Telemetry(event_path)
+        return _telemetry
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve the registry in the Prometheus text format from a background thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = get_telemetry().prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes would drown the generation logs
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class MeteredMixin:
+    """Request metrics for curator.LLM subclasses; call `init_metrics` from `__init__`.
+
+    `send(rows)` replaces `self(rows)` for uncached rows, parse() reports each
+    response through `record_outcome`.
+    """
+
+    def init_metrics(self, source: str, model: str):
+        self.metrics_source = source
+        self.metrics_model = model
+
+    def estimate_input_tokens(self, row: Dict) -> int:
+        return estimate_tokens(len(self.prompt(row)))
+
+    def send(self, rows: List[Dict]) -> List:
+        """Call Curator on `rows`, recording the call as one request per row."""
+        input_tokens = sum(self.estimate_input_tokens(row) for row in rows)
+        start = time.monotonic()
+        error = None
+        try:
+            return self(rows)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            get_telemetry().record_request(
+                self.metrics_source, self.metrics_model, time.monotonic() - start,
+                requests=len(rows), input_tokens=input_tokens, error=error,
+            )
+
+    def record_outcome(self, row: Dict, response, accepted: bool):
+        """Record a fresh response (replayed cache hits cost nothing and aren't counted)."""
+        if replaying():
+            return
+        data = response.model_dump() if hasattr(response, "model_dump") else response
+        output_tokens = estimate_tokens(len(json.dumps(data, ensure_ascii=False)))
+        get_telemetry().record_outcome(self.metrics_source, self.metrics_model, accepted, output_tokens, row.get("arxiv_id"))
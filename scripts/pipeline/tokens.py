@@ -0,0 +1,285 @@
+"""
+Thinking token counting for the avg_thinking_tokens statistic.
+
+Counting used to call `tokenizer.tokenize()` once per assistant message inside
+`parse()`. `ThinkingTokenCounter` instead takes the conversations, returns a
+Future right away and counts in the background: a dispatcher thread groups
+pending texts into batches that go through one fast-tokenizer call on a small
+worker pool. Counts are memoized by a hash of the tokenizer name and the text,
+in memory and in the checkpoint store, so the same thinking section is never
+tokenized twice, across re-parses and re-runs.
+
+The tokenizer itself is loaded on first use from a local tokenizer.json (see
+`TOKENIZER_CACHE_PATH`), so importing this module costs nothing and runs after
+the first one need neither transformers nor the Hub.
+"""
+
+import os
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from pipeline.config import TOKENIZER_CACHE_PATH, TOKENIZER_NAME
+from pipeline.store import STORE_PATH, get_store
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.05 # Seconds the dispatcher waits to fill a batch
+DEFAULT_WORKERS = 2
+DEFAULT_CACHE_SIZE = 100_000
+
+_STOP = object()
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer():
+    """The `tokenizers.Tokenizer` used for counting, loaded on first use."""
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            _tokenizer = _load_tokenizer()
+        return _tokenizer
+
+def _load_tokenizer(cache_path: str = TOKENIZER_CACHE_PATH):
+    from tokenizers import Tokenizer
+
+    if os.path.exists(cache_path):
+        return Tokenizer.from_file(cache_path)
+
+    # First run: fetch from the Hub once and keep the serialized fast tokenizer
+    from transformers import AutoTokenizer
+    print(f"Tokenizer cache {cache_path} not found, loading {TOKENIZER_NAME} from the Hub...")
+    tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME).backend_tokenizer
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tokenizer.save(cache_path)
+    return tokenizer
+
+
+def extract_thinking(content: str) -> str:
+    """Return the text between <think> and </think>, or "" if there is none."""
+    # Ensure robust splitting even if tags are missing/malformed
+    parts = content.split("<think>", 1)
+    if len(parts) > 1:
+        return parts[1].split("</think>", 1)[0].strip()
+    return ""
+
+def thinking_texts(conversations: List[Dict]) -> List[str]:
+    """Thinking section of every assistant message (empty if it has none)."""
+    return [extract_thinking(entry.get("content", "")) for entry in conversations if entry.get("role") == "assistant"]
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(f"{TOKENIZER_NAME}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+class _Job:
+    """Token counts of one conversation, resolved once every text is counted."""
+
+    def __init__(self, counts: List[Optional[int]], future: Future):
+        self.counts = counts
+        self.future = future
+        self.remaining = sum(count is None for count in counts)
+        self.lock = threading.Lock()
+
+    def resolve(self, index: int, count: int):
+        with self.lock:
+            self.counts[index] = count
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done:
+            self.future.set_result(sum(self.counts) / len(self.counts))
+
+
+class ThinkingTokenCounter:
+    """Batched, off-thread, memoized thinking token counter."""
+
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        workers: int = DEFAULT_WORKERS,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        store_path: str = STORE_PATH,
+    ):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.store_path = store_path
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="token-count")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="token-count-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, conversations: List[Dict]) -> Future:
+        """Future resolving to the average thinking tokens per assistant message."""
+        future = Future()
+        texts = thinking_texts(conversations)
+        if not texts:
+            future.set_result(0.0)
+            return future
+
+        hashes = [content_hash(text) if text else None for text in texts]
+        known = self._lookup([h for h in hashes if h is not None])
+        counts = [0 if h is None else known.get(h) for h in hashes]
+        job = _Job(counts, future)
+        if job.remaining == 0:
+            future.set_result(sum(counts) / len(counts))
+            return future
+
+        for index, (text_hash, text) in enumerate(zip(hashes, texts)):
+            if counts[index] is None:
+                self._queue.put((job, index, text_hash, text))
+        return future
+
+    def count_avg(self, conversations: List[Dict]) -> float:
+        """Blocking variant of `submit`."""
+        return self.submit(conversations).result()
+
+    def close(self):
+        """Count everything still pending, then stop the worker threads."""
+        self._queue.put(_STOP)
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+    # --- Cache ---
+    def _lookup(self, hashes: List[bytes]) -> Dict[bytes, int]:
+        found = {}
+        with self._cache_lock:
+            for text_hash in hashes:
+                if text_hash in self._cache:
+                    self._cache.move_to_end(text_hash)
+                    found[text_hash] = self._cache[text_hash]
+        missing = [h for h in hashes if h not in found]
+        if missing:
+            stored = get_store(self.store_path).get_token_counts(missing)
+            self._remember(stored)
+            found.update(stored)
+        return found
+
+    def _remember(self, counts: Dict[bytes, int]):
+        with self._cache_lock:
+            for text_hash, count in counts.items():
+                self._cache[text_hash] = count
+                self._cache.move_to_end(text_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- Workers ---
+    def _dispatch(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._pool.submit(self._count_batch, batch)
+
+    def _count_batch(self, batch):
+        # Every job must be resolved, or its record is never saved (saving runs from the future's callback)
+        try:
+            counts = self._counts_for(batch)
+        except Exception as e:
+            print(f"Warning: Could not count thinking tokens of {len(batch)} texts ({type(e).__name__}: {e}), counting them as 0.")
+            counts = {}
+        for job, index, text_hash, _ in batch:
+            job.resolve(index, counts.get(text_hash, 0))
+
+    def _counts_for(self, batch) -> Dict[bytes, int]:
+        """Token counts of the batch's texts, from the cache or the tokenizer (loaded on first use)."""
+        texts = {}
+        for _, _, text_hash, text in batch:
+            texts.setdefault(text_hash, text)
+
+        # A concurrent batch may already have counted some of these
+        counts = self._lookup(list(texts))
+        to_count = [(h, t) for h, t in texts.items() if h not in counts]
+        if to_count:
+            new_counts = _tokenize_counts([t for _, t in to_count])
+            new_counts = {h: n for (h, _), n in zip(to_count, new_counts)}
+            self._remember(new_counts)
+            try:
+                get_store(self.store_path).save_token_counts(new_counts)
+            except Exception as e:
+                print(f"Warning: Could not persist token counts. Error: {e}")
+            counts.update(new_counts)
+        return counts
+
+
+def _tokenize_counts(texts: List[str]) -> List[int]:
+    """Token count of each text in one batched tokenizer call."""
+    tokenizer = get_tokenizer()
+    try:
+        return [len(encoding.ids) for encoding in tokenizer.encode_batch(texts, add_special_tokens=False)]
+    except Exception as e:
+        print(f"Warning: Batched tokenization failed ({e}), counting texts one by one.")
+    counts = []
+    for text in texts:
+        try:
+            counts.append(len(tokenizer.encode(text, add_special_tokens=False).ids))
+        except Exception as e: # Catch potential errors during tokenizing
+            print(f"Warning: Error tokenizing <think> content: {e} in content: {text[:100]}...")
+            counts.append(0)
+    return counts
+
+
+_counter: Optional[ThinkingTokenCounter] = None
+_counter_lock = threading.Lock()
+
+def get_counter() -> ThinkingTokenCounter:
+    """Process-wide token counter."""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = ThinkingTokenCounter()
+        return _counter
+
+def close_counter():
+    """Drain and stop the process-wide counter, if it was started."""
+    global _counter
+    with _counter_lock:
+        counter, _counter = _counter, None
+    if counter is not None:
+        counter.close()
+
+def calculate_avg_thinking_tokens(conversations: List[Dict]) -> float:
+    """Helper to calculate average thinking tokens from a conversation list (blocking)."""
+    return get_counter().count_avg(conversations)
+
+def average_thinking_tokens_many(conversation_lists: List[List[Dict]], store_path: str = STORE_PATH) -> List[float]:
+    """Average thinking tokens of many conversations at once, in the calling thread.
+
+    For offline jobs such as re-parsing: no background threads, one store lookup and
+    one batched tokenizer call for everything that isn't cached yet.
+    """
+    texts_per_conversation = [thinking_texts(conversations) for conversations in conversation_lists]
+    texts = {content_hash(text): text for texts in texts_per_conversation for text in texts if text}
+    store = get_store(store_path)
+    counts = store.get_token_counts(list(texts))
+    missing = [h for h in texts if h not in counts]
+    if missing:
+        new_counts = dict(zip(missing, _tokenize_counts([texts[h] for h in missing])))
+        store.save_token_counts(new_counts)
+        counts.update(new_counts)
+    return [
+        sum(counts[content_hash(text)] if text else 0 for text in texts) / len(texts) if texts else 0.0
+        for texts in texts_per_conversation
+    ]
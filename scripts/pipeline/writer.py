@@ -0,0 +1,181 @@
+"""
+Group-commit JSONL writer.
+
+Instead of reopening the output file for every record, records are buffered
+and appended in one write once `max_records` are pending or `max_delay`
+seconds have passed, whichever comes first. Each file has one shared writer
+per process (see `get_writer`), which opens the file on its first record and
+keeps the handle open.
+
+Paths ending in .gz are written as gzip: every group commit is appended as
+its own gzip member, which gzip readers treat as one continuous stream.
+
+fsync policies:
+    "none"  - leave durability to the OS page cache (fastest)
+    "flush" - fsync after every group commit
+    "close" - fsync once when the writer is closed
+
+All writers are flushed and closed at interpreter exit, and on SIGTERM once
+`install_signal_handlers()` has been called from the main thread.
+"""
+
+import os
+import sys
+import gzip
+import json
+import atexit
+import signal
+import threading
+from typing import Dict, List, Optional
+
+FSYNC_POLICIES = ("none", "flush", "close")
+
+# Defaults for writers created by get_writer, see configure_writers
+DEFAULT_MAX_RECORDS = 64
+DEFAULT_MAX_DELAY = 2.0
+DEFAULT_FSYNC = "none"
+
+_defaults = {"max_records": DEFAULT_MAX_RECORDS, "max_delay": DEFAULT_MAX_DELAY, "fsync": DEFAULT_FSYNC}
+
+
+class GroupCommitWriter:
+    """Buffered, thread-safe JSONL appender for one file."""
+
+    def __init__(self, path: str, max_records: int = DEFAULT_MAX_RECORDS, max_delay: float = DEFAULT_MAX_DELAY, fsync: str = DEFAULT_FSYNC):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.path = path
+        self.max_records = max_records
+        self.max_delay = max_delay
+        self.fsync = fsync
+
+        self.compress = path.endswith(".gz")
+        # The file and the periodic flusher are only opened by the first write, so unpickled copies cost nothing
+        self._file = None
+        self._flusher: Optional[threading.Thread] = None
+        self._buffer: List[str] = []
+        self._buffer_lock = threading.Lock() # Guards the buffer only, so writers never wait on I/O
+        self._io_lock = threading.Lock()     # Serializes appends to the file
+        self._closed = False
+        self._stop = threading.Event()
+
+    # Writers are referenced from Curator's parse methods, which Curator hashes by pickling
+    def __getstate__(self):
+        return {"path": self.path, "max_records": self.max_records, "max_delay": self.max_delay, "fsync": self.fsync}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _open(self):
+        """Open the file for appending and start the periodic flusher, once."""
+        with self._io_lock:
+            if self._file is not None or self._closed:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab") if self.compress else open(self.path, "a", encoding="utf-8")
+            self._flusher = threading.Thread(target=self._flush_periodically, name=f"writer:{self.path}", daemon=True)
+            self._flusher.start()
+
+    def write(self, record: Dict):
+        """Queue a record; flushes in the calling thread once the batch is full."""
+        line = json.dumps(record) + "\n"
+        if self._file is None:
+            self._open()
+        with self._buffer_lock:
+            if self._closed:
+                raise ValueError(f"Writer for {self.path} is closed")
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.max_records
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Append all pending records in a single write."""
+        with self._io_lock:
+            with self._buffer_lock:
+                lines, self._buffer = self._buffer, []
+            if not lines or self._file is None or self._file.closed:
+                return
+            data = "".join(lines)
+            self._file.write(gzip.compress(data.encode("utf-8")) if self.compress else data)
+            self._file.flush()
+            if self.fsync == "flush":
+                os.fsync(self._file.fileno())
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.max_delay):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error: Could not flush records to {self.path}. Error: {e}")
+
+    def close(self):
+        """Flush pending records and close the file."""
+        with self._buffer_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+        with self._io_lock:
+            if self._file is None:
+                return
+            if self.fsync in ("flush", "close"):
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+
+_writers: Dict[str, GroupCommitWriter] = {}
+_writers_lock = threading.Lock()
+
+def configure_writers(max_records: Optional[int] = None, max_delay: Optional[float] = None, fsync: Optional[str] = None):
+    """Set the batching and fsync policy for writers created afterwards."""
+    if fsync is not None and fsync not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+    for key, value in (("max_records", max_records), ("max_delay", max_delay), ("fsync", fsync)):
+        if value is not None:
+            _defaults[key] = value
+
+def get_writer(path: str) -> GroupCommitWriter:
+    """Process-wide writer for `path`."""
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None or writer._closed:
+            writer = _writers[path] = GroupCommitWriter(path, **_defaults)
+        return writer
+
+def close_writer(path: str):
+    with _writers_lock:
+        writer = _writers.pop(path, None)
+    if writer is not None:
+        writer.close()
+
+def close_all():
+    """Flush and close every open writer."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception as e:
+            print(f"Error: Could not close writer for {writer.path}. Error: {e}")
+
+atexit.register(close_all)
+
+
+def install_signal_handlers(signums=(signal.SIGTERM,)):
+    """Flush all writers before the process dies on `signums` (SIGINT already unwinds through atexit)."""
+    def handler(signum, frame):
+        previous = previous_handlers.get(signum)
+        if callable(previous):
+            previous(signum, frame)
+        # Only unwind: the handler runs on the main thread, which may be holding a writer's lock in
+        # write() or flush(), so flushing here could deadlock. atexit's close_all flushes afterwards.
+        sys.exit(128 + signum)
+
+    previous_handlers = {}
+    for signum in signums:
+        previous_handlers[signum] = signal.signal(signum, handler)
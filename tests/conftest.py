@@ -0,0 +1,79 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The pipeline package lives in scripts/, which the scripts run from
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in the test's directory, so the pipeline's relative data/ paths point into it."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """Checkpoint stores in the test's directory, by name."""
+    from pipeline.store import CheckpointStore
+
+    return lambda name="store": CheckpointStore(str(tmp_path / f"{name}.sqlite"))
+
+
+@pytest.fixture
+def store(make_store):
+    return make_store()
+
+
+@pytest.fixture
+def dead_letters(workdir, monkeypatch):
+    """The process-wide dead-letter queue, in the test's directory."""
+    from pipeline import deadletter
+
+    monkeypatch.setattr(deadletter, "_queues", {})
+    return deadletter.get_dead_letters()
+
+
+class FakeStream:
+    """Streaming split of the fake Hub's rows `start` to `stop`."""
+
+    features = None
+
+    def __init__(self, hub, start=0, stop=None):
+        self.hub, self.start, self.stop = hub, start, stop
+
+    def skip(self, count):
+        return FakeStream(self.hub, self.start + count, self.stop)
+
+    def take(self, count):
+        return FakeStream(self.hub, self.start, self.start + count if self.stop is None else min(self.stop, self.start + count))
+
+    def __iter__(self):
+        for index in range(self.start, len(self.hub.rows) if self.stop is None else min(self.stop, len(self.hub.rows))):
+            if index == self.hub.fail_at:
+                raise ConnectionError("stream interrupted")
+            self.hub.read.append(index)
+            yield self.hub.rows[index]
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    """arxiv-markdown on the Hub, as a fake `datasets` module streaming `hub.rows`; `hub.read` lists the rows read."""
+    hub = SimpleNamespace(read=[], fail_at=None, rows=[
+        {
+            "arxiv_id": str(i), "markdown": f"paper {i}", "paper_doi": None, "paper_authors": None,
+            "paper_published_date": f"2024-{i % 12 + 1:02d}-01", "paper_updated_date": None,
+            "categories": "cs.CL" if i % 2 else "math.AG cs.LG",
+        }
+        for i in range(1000)
+    ])
+
+    def load_dataset(name, split, streaming):
+        assert (name, split, streaming) == ("marcodsn/arxiv-markdown", "train", True)
+        return FakeStream(hub)
+
+    monkeypatch.setitem(sys.modules, "datasets", SimpleNamespace(load_dataset=load_dataset))
+    return hub
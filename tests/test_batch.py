@@ -0,0 +1,200 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+
+from pydantic import BaseModel
+
+from pipeline import batch, telemetry
+from pipeline.batch import MAX_ATTEMPTS, BatchMixin, get_batch_tracker
+from pipeline.cache import CachedResponsesMixin
+from pipeline.telemetry import MeteredMixin, Telemetry
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    def _send(self, body):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            if self.path.endswith("/files"):
+                boundary = self.headers["Content-Type"].split("boundary=")[1].encode("utf-8")
+                part = next(part for part in body.split(b"--" + boundary) if b'name="file"' in part)
+                return self._send({"id": server.add_file(part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]), "object": "file"})
+            request = json.loads(body)
+            requests = [json.loads(line) for line in server.files[request["input_file_id"]].splitlines()]
+            job_id = f"batch-{len(server.jobs)}"
+            server.jobs[job_id] = {"id": job_id, "object": "batch", "status": "validating", "requests": requests}
+            return self._send(server.job(job_id))
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            if self.path.endswith("/content"):
+                return self._send(server.files[self.path.split("/")[-2]])
+            job_id = self.path.rsplit("/", 1)[1]
+            server.polls += 1
+            job = server.jobs[job_id]
+            if job["status"] == "validating":
+                job["status"] = "in_progress"
+            elif job["status"] == "in_progress":
+                job["output_file_id"] = server.add_file("\n".join(json.dumps(server.answer(request)) for request in job["requests"]).encode("utf-8"))
+                job["status"] = "completed"
+            return self._send(server.job(job_id))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBatchServer(ThreadingHTTPServer):
+    """OpenAI-compatible files and batches endpoints; a job completes on its second status check.
+
+    Prompts containing "fail" get an error line, and those containing "invalid" a response that isn't
+    an Answer, on their first `failures` submissions.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeBatchHandler)
+        self.lock = threading.Lock()
+        self.files, self.jobs = {}, {}
+        self.submissions = {}
+        self.polls = 0
+        self.failures = 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def submitted(self):
+        """Prompts of every job, in order of submission."""
+        return [sorted(request["body"]["messages"][0]["content"] for request in job["requests"]) for job in self.jobs.values()]
+
+    def add_file(self, data):
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = data
+        return file_id
+
+    def job(self, job_id):
+        return {key: value for key, value in self.jobs[job_id].items() if key != "requests"}
+
+    def answer(self, request):
+        prompt = request["body"]["messages"][0]["content"]
+        self.submissions[prompt] = self.submissions.get(prompt, 0) + 1
+        failing = self.submissions[prompt] <= self.failures
+        if failing and "fail" in prompt:
+            return {"custom_id": request["custom_id"], "response": None, "error": {"code": "server_error", "message": "overloaded"}}
+        content = "not an answer" if failing and "invalid" in prompt else json.dumps({"text": prompt.upper()})
+        body = {"choices": [{"message": {"role": "assistant", "content": content}}], "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+        return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+
+
+class EchoLLM(CachedResponsesMixin, MeteredMixin, BatchMixin):
+    """An extractor without Curator: the prompt is the paper's markdown."""
+
+    def __init__(self, tmp_path):
+        self.init_response_cache("gemini/gemini-2.0-flash", None, None, Answer, cache_path=str(tmp_path / "responses.sqlite"))
+        self.init_metrics("curator", "gemini-2.0-flash")
+        self.init_batch("gemini/gemini-2.0-flash", batch_path=str(tmp_path / "batches.sqlite"))
+
+    def prompt(self, row):
+        return row["paper_md"]
+
+    def parse(self, row, response):
+        self.remember_response(row, response)
+        self.record_outcome(row, response, accepted=True)
+        return [{"arxiv_id": row["arxiv_id"], "text": response.text}]
+
+    def __call__(self, rows):
+        raise AssertionError("Batch mode never calls Curator")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeBatchServer()
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    monkeypatch.setitem(batch._settings, "enabled", True)
+    monkeypatch.setitem(batch._settings, "base_url", server.url)
+    monkeypatch.setitem(batch._settings, "poll_interval", 0.01)
+    monkeypatch.setattr(batch, "_clients", {})
+    monkeypatch.setattr(batch, "_trackers", {})
+    # No event log in the working directory
+    monkeypatch.setattr(telemetry, "_telemetry", Telemetry())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def papers(*texts):
+    return [{"arxiv_id": str(i), "paper_md": text} for i, text in enumerate(texts)]
+
+
+def texts(results):
+    return sorted(result["text"] for result in results)
+
+
+def test_submit_skips_rows_in_a_running_job(server, tmp_path, monkeypatch):
+    monkeypatch.setitem(batch._settings, "max_items", 2)
+    llm = EchoLLM(tmp_path)
+    assert llm.submit_batch(papers("a", "b", "c")) == 3
+    assert server.submitted() == [["a", "b"], ["c"]]
+    assert llm.submit_batch(papers("a", "b", "c", "d")) == 1
+    assert server.submitted()[-1] == ["d"]
+    body = server.jobs["batch-0"]["requests"][0]["body"]
+    assert (body["model"], body["response_format"]["json_schema"]["name"]) == ("gemini-2.0-flash", "Answer")
+    assert get_batch_tracker(llm.batch_path).pending_namespaces("0") == {llm.batch_namespace}
+    assert llm.metrics_source == "curator-batch"
+
+
+def test_jobs_of_an_earlier_run_are_polled_again(server, tmp_path, monkeypatch):
+    EchoLLM(tmp_path).submit_batch(papers("a", "b"))
+    # A new process: no open tracker or client, only the jobs database
+    monkeypatch.setattr(batch, "_clients", {})
+    monkeypatch.setattr(batch, "_trackers", {})
+    llm = EchoLLM(tmp_path)
+    assert llm.submit_batch(papers("a", "b")) == 0
+    assert texts(llm.wait_batches()) == ["A", "B"]
+    assert len(server.jobs) == 1 and server.polls >= 2
+    assert llm.wait_batches() == []
+
+
+def test_completed_output_is_parsed_cached_and_metered(server, tmp_path):
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_batch(papers("a", "b"))) == ["A", "B"]
+    tracker = get_batch_tracker(llm.batch_path)
+    assert tracker._conn.execute("SELECT status, COUNT(*) FROM batch_items GROUP BY status").fetchall() == [("done", 2)]
+    summary = telemetry.get_telemetry().summary()[("curator-batch", "gemini-2.0-flash")]
+    assert (summary["requests"], summary["accepted"], summary["errors"]) == (2, 2, 0)
+    # Answered from the response cache, without another job
+    assert texts(EchoLLM(tmp_path).call_batch(papers("a", "b"))) == ["A", "B"]
+    assert len(server.jobs) == 1
+
+
+def test_only_failed_and_invalid_items_are_submitted_again(server, tmp_path):
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_batch(papers("ok", "fail", "invalid"))) == ["FAIL", "INVALID", "OK"]
+    assert server.submitted() == [["fail", "invalid", "ok"], ["fail", "invalid"]]
+
+
+def test_items_failing_every_attempt_are_left_for_a_later_run(server, tmp_path):
+    server.failures = MAX_ATTEMPTS
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_batch(papers("ok", "fail"))) == ["OK"]
+    assert server.submitted() == [["fail", "ok"]] + [["fail"]] * (MAX_ATTEMPTS - 1)
+    tracker = get_batch_tracker(llm.batch_path)
+    assert tracker.pending_namespaces("1") == set()
+    # Submitted anew from the paper stream, with a fresh count of attempts
+    assert texts(llm.call_batch(papers("ok", "fail"))) == ["FAIL", "OK"]
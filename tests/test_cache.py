@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from pydantic import BaseModel
+
+from pipeline import cache
+from pipeline.cache import CachedResponsesMixin, ResponseCache, replaying
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class ShortAnswer(BaseModel):
+    text: str
+    short: bool = True
+
+
+class EchoLLM(CachedResponsesMixin):
+    """An LLM without Curator: answers the prompt upper-cased and rejects prompts containing "bad"."""
+
+    def __init__(self, tmp_path, response_format=Answer, backend_params=None):
+        self.init_response_cache("gemini/gemini-2.0-flash", "litellm", backend_params, response_format, cache_path=str(tmp_path / "responses.sqlite"))
+        self.response_format = response_format
+        self.sent = []
+        self.replayed = []
+
+    def prompt(self, row):
+        return row["paper_md"]
+
+    def parse(self, row, response):
+        if replaying():
+            self.replayed.append(row["paper_md"])
+        if "bad" in response.text.lower():
+            return []
+        self.remember_response(row, response)
+        return [{"arxiv_id": row["arxiv_id"], "text": response.text}]
+
+    def __call__(self, rows):
+        self.sent.extend(row["paper_md"] for row in rows)
+        return [result for row in rows for result in self.parse(row, self.response_format(text=row["paper_md"].upper()))]
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    monkeypatch.setitem(cache._settings, "enabled", True)
+    monkeypatch.setattr(cache, "_caches", {})
+
+
+def papers(*texts):
+    return [{"arxiv_id": str(i), "paper_md": text} for i, text in enumerate(texts)]
+
+
+def texts(results):
+    return sorted(result["text"] for result in results)
+
+
+def test_a_repeated_request_is_answered_from_the_cache(tmp_path):
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_cached(papers("a", "b"))) == ["A", "B"]
+    assert llm.sent == ["a", "b"]
+    # Same model, prompt and params: parse() gets the cached response, the backend is not called
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_cached(papers("a", "b", "c"))) == ["A", "B", "C"]
+    assert llm.sent == ["c"] and sorted(llm.replayed) == ["a", "b"]
+    # Replays are not stored again
+    assert cache.get_response_cache(llm.cache_path)._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 3
+
+
+def test_a_different_response_format_misses(tmp_path):
+    EchoLLM(tmp_path).call_cached(papers("a"))
+    llm = EchoLLM(tmp_path, response_format=ShortAnswer)
+    assert texts(llm.call_cached(papers("a"))) == ["A"]
+    assert llm.sent == ["a"]
+
+
+def test_pacing_and_authentication_params_keep_the_cache(tmp_path):
+    EchoLLM(tmp_path, backend_params={"api_key": "one", "max_requests_per_minute": 10, "temperature": 0.5}).call_cached(papers("a"))
+    llm = EchoLLM(tmp_path, backend_params={"api_key": "two", "max_requests_per_minute": 20, "temperature": 0.5})
+    llm.call_cached(papers("a"))
+    assert llm.sent == []
+    llm = EchoLLM(tmp_path, backend_params={"api_key": "two", "temperature": 0.7})
+    llm.call_cached(papers("a"))
+    assert llm.sent == ["a"]
+
+
+def test_rejected_responses_are_not_cached(tmp_path):
+    EchoLLM(tmp_path).call_cached(papers("bad", "good"))
+    llm = EchoLLM(tmp_path)
+    assert texts(llm.call_cached(papers("bad", "good"))) == ["GOOD"]
+    assert llm.sent == ["bad"]
+
+
+def test_disabled_cache(tmp_path, monkeypatch):
+    monkeypatch.setitem(cache._settings, "enabled", False)
+    EchoLLM(tmp_path).call_cached(papers("a"))
+    llm = EchoLLM(tmp_path)
+    llm.call_cached(papers("a"))
+    assert llm.sent == ["a"]
+    assert not (tmp_path / "responses.sqlite").exists()
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    responses = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=10_000)
+    # Random text, which compresses little: eight responses are over max_bytes
+    data = [{"text": os.urandom(1500).hex()} for _ in range(8)]
+    for i, response in enumerate(data[:4]):
+        responses.put(bytes([i]), b"ns", response)
+    assert responses.get(bytes([0])) == data[0]
+    for i, response in enumerate(data[4:], start=4):
+        responses.put(bytes([i]), b"ns", response)
+    assert responses._size <= 10_000
+    assert responses.get(bytes([0])) == data[0]
+    assert responses.get(bytes([1])) is None
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import calibration
+from pipeline.calibration import calibrate, load_calibration, save_calibration, tuned_backend_params
+
+BASE_URL = "http://localhost:11434"
+
+
+class FakeServer:
+    """Answers `capacity` requests at a time, each in `seconds`, and queues the rest; fails past `fail_above` at once."""
+
+    def __init__(self, capacity, seconds=0.05, fail_above=None):
+        self.slots = threading.Semaphore(capacity)
+        self.seconds, self.fail_above = seconds, fail_above
+        self.active = 0
+        self.lock = threading.Lock()
+        self.models = set()
+
+    def request(self, base_url, model, prompt, max_tokens):
+        assert base_url == BASE_URL
+        self.models.add(model)
+        with self.lock:
+            self.active += 1
+            overloaded = self.fail_above is not None and self.active > self.fail_above
+        try:
+            if overloaded:
+                raise ConnectionError("server overloaded")
+            with self.slots:
+                time.sleep(self.seconds)
+            return max_tokens
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "concurrency.json")
+
+
+def test_stops_at_the_knee_of_the_throughput_curve(path, monkeypatch):
+    server = FakeServer(capacity=4)
+    monkeypatch.setattr(calibration, "_request", server.request)
+    result = calibrate("ollama/qwen3:8b", BASE_URL, prompt_tokens=10, max_tokens=20, path=path)
+    assert result["max_concurrent_requests"] == 4
+    # Doubling to 8 brought nothing, so the ramp stopped there
+    assert [level["concurrency"] for level in result["levels"]] == [1, 2, 4, 8]
+    assert server.models == {"qwen3:8b"}
+    assert load_calibration("qwen3:8b", BASE_URL + "/", path) == result
+
+
+def test_stops_before_the_level_that_fails(path, monkeypatch):
+    monkeypatch.setattr(calibration, "_request", FakeServer(capacity=8, fail_above=2).request)
+    result = calibrate("qwen3:8b", BASE_URL, prompt_tokens=10, max_tokens=20, path=path)
+    assert result["max_concurrent_requests"] == 2
+    assert result["levels"][-1]["errors"] > 0
+
+
+def test_max_concurrency_bounds_the_ramp(path, monkeypatch):
+    monkeypatch.setattr(calibration, "_request", FakeServer(capacity=64).request)
+    result = calibrate("qwen3:8b", BASE_URL, prompt_tokens=10, max_tokens=20, max_concurrency=2, path=path)
+    assert result["max_concurrent_requests"] == 2
+
+
+def test_tuned_backend_params_apply_the_stored_concurrency(path):
+    params = {"base_url": BASE_URL, "max_concurrent_requests": 1}
+    assert tuned_backend_params("ollama/qwen3:8b", params, path) == params
+    save_calibration("qwen3:8b", BASE_URL, {"max_concurrent_requests": 6}, path)
+    assert tuned_backend_params("ollama/qwen3:8b", params, path) == {"base_url": BASE_URL, "max_concurrent_requests": 6}
+    # Other servers and hosted backends keep their settings
+    assert tuned_backend_params("qwen3:8b", {"base_url": "http://other:8080"}, path) == {"base_url": "http://other:8080"}
+    assert tuned_backend_params("gemini/gemini-2.0-flash", {"max_requests_per_minute": 10}, path) == {"max_requests_per_minute": 10}
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from pipeline import conversion, mirror
+from pipeline.conversion import convert_to_store, iter_converted_to_store
+from pipeline.mirror import PaperMirror
+
+
+@pytest.fixture
+def converted(monkeypatch):
+    """docling replaced by a generator finishing the PDFs in reverse order; lists the arxiv_ids converted so far."""
+    done = []
+
+    def convert_pdfs(papers, workers=None, cache_path=None):
+        for paper in reversed(list(papers)):
+            done.append(paper["arxiv_id"])
+            yield paper, f"markdown of {paper['arxiv_id']}"
+
+    monkeypatch.setattr(conversion, "convert_pdfs", convert_pdfs)
+    # Small parts, so a few papers span several of them
+    monkeypatch.setattr(conversion, "ROWS_PER_PART", 2)
+    monkeypatch.setattr(mirror, "ROWS_PER_PART", 2)
+    return done
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    return PaperMirror(str(tmp_path / "local-papers"))
+
+
+def metadata(*arxiv_ids):
+    return [{"arxiv_id": arxiv_id, "pdf_url": f"https://arxiv.org/pdf/{arxiv_id}", "categories": "cs.CL"} for arxiv_id in arxiv_ids]
+
+
+def test_papers_are_yielded_as_they_are_converted(converted, local_store):
+    papers = iter_converted_to_store(metadata("1", "2", "3"), store=local_store)
+    item = next(papers)
+    assert (item["arxiv_id"], item["markdown"], item["categories"]) == ("3", "markdown of 3", ["cs.CL"])
+    assert converted == ["3"] and len(local_store) == 0
+    # A whole part is written as soon as it is full
+    assert next(papers)["arxiv_id"] == "2"
+    assert len(local_store) == 2
+    assert [item["arxiv_id"] for item in papers] == ["1"]
+    assert [item["arxiv_id"] for item in local_store.iter_items()] == ["3", "2", "1"]
+
+
+def test_stopping_early_keeps_the_converted_papers(converted, local_store):
+    papers = iter_converted_to_store(metadata("1", "2", "3"), store=local_store)
+    assert next(papers)["arxiv_id"] == "3"
+    papers.close()
+    assert local_store.arxiv_ids() == {"3"}
+    # The next run only converts the others
+    converted.clear()
+    assert convert_to_store(metadata("1", "2", "3"), store=local_store) == 2
+    assert converted == ["2", "1"]
+    assert convert_to_store(metadata("1", "2", "3"), store=local_store) == 0
+    assert local_store.arxiv_ids() == {"1", "2", "3"}
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pipeline import deadletter
+from pipeline.deadletter import backoff_for
+
+NOW = 1000.0
+
+
+@pytest.fixture
+def queue(dead_letters, monkeypatch):
+    monkeypatch.setitem(deadletter._settings, "max_attempts", 3)
+    monkeypatch.setitem(deadletter._settings, "backoff", 10.0)
+    monkeypatch.setattr(deadletter, "time", SimpleNamespace(time=lambda: NOW))
+    return dead_letters
+
+
+def paper(arxiv_id):
+    return {"arxiv_id": arxiv_id, "paper_md": f"paper {arxiv_id}"}
+
+
+def test_backoff_doubles_up_to_the_cap(queue):
+    assert [backoff_for(attempts) for attempts in (1, 2, 3)] == [10.0, 20.0, 40.0]
+    assert backoff_for(20) == deadletter.MAX_BACKOFF
+
+
+def test_failures_are_due_after_their_backoff(queue):
+    assert queue.record_failures("m", [(paper("1"), "multi-short"), (paper("2"), "single-long")], "Timeout") == 0
+    assert queue.next_attempt("m") == NOW + 10
+    assert queue.due("m", 10, now=NOW + 9) == []
+    assert queue.due("m", 10, now=NOW + 10) == [("multi-short", paper("1")), ("single-long", paper("2"))]
+    assert queue.due("m", 1, now=NOW + 10) == [("multi-short", paper("1"))]
+    # Per model
+    assert queue.due("other", 10, now=NOW + 10) == []
+    # A second failure waits twice as long
+    queue.record_failures("m", [(paper("1"), "multi-short")], "Timeout")
+    assert queue.due("m", 10, now=NOW + 19) == [("single-long", paper("2"))]
+    assert len(queue.due("m", 10, now=NOW + 20)) == 2
+
+
+def test_given_up_after_max_attempts(queue):
+    failure = [(paper("1"), "multi-short")]
+    assert [queue.record_failures("m", failure, "Timeout") for _ in range(3)] == [0, 0, 1]
+    assert queue.due("m", 10, now=NOW + 3600) == []
+    assert queue.next_attempt("m") is None
+    assert queue.open_for("1") == {("multi-short", "m")}
+    report = queue.report()["m"]
+    assert (report["pending"], report["failed"], report["items"][0]["attempts"]) == (0, {"Timeout": 1}, 3)
+    # Reset makes it due again, with a fresh attempt count
+    assert queue.reset(["other"]) == 0
+    assert queue.reset(["m"]) == 1
+    assert queue.due("m", 10, now=NOW) == [("multi-short", paper("1"))]
+    assert queue.record_failures("m", failure, "Timeout") == 0
+
+
+def test_resolve_drops_answered_items(queue):
+    queue.record_failures("m", [(paper("1"), "multi-short"), (paper("1"), "single-long")], "Dropped")
+    queue.resolve("m", [("1", "multi-short")])
+    assert queue.open_for("1") == {("single-long", "m")}
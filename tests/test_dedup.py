@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from pipeline import dedup
+from pipeline.dedup import DEFAULT_THRESHOLD, MinHasher, NearDuplicateFilter, NearDuplicateIndex, shingles
+
+
+def text(seed, words=400):
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(5000)}" for _ in range(words))
+
+
+def edited(original, changed_words, seed=0):
+    """The text with `changed_words` of its words replaced."""
+    rng = random.Random(seed)
+    words = original.split()
+    for i in rng.sample(range(len(words)), changed_words):
+        words[i] = "changed"
+    return " ".join(words)
+
+
+def test_shingles():
+    assert shingles("A b, c") == ["a b c"]
+    assert shingles("a b c d e f", size=5) == ["a b c d e", "b c d e f"]
+    assert shingles("") == []
+
+
+def test_signature_estimates_jaccard():
+    hasher = MinHasher()
+    original = text(1)
+    assert hasher.similarity(hasher.signature(original), hasher.signature(original.upper())) == 1.0
+    assert hasher.similarity(hasher.signature(original), hasher.signature(edited(original, 4))) > 0.8
+    assert hasher.similarity(hasher.signature(original), hasher.signature(text(2))) < 0.1
+
+
+def test_near_duplicates_share_a_bucket():
+    hasher = MinHasher()
+    original = text(1)
+    assert set(hasher.buckets(hasher.signature(original))) & set(hasher.buckets(hasher.signature(edited(original, 4))))
+
+
+def test_index_finds_near_duplicates(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.sqlite"))
+    original = text(1)
+    assert index.check("1", original) == (None, 0.0)
+    assert index.check("2", text(2)) == (None, 0.0)
+    duplicate_of, similarity = index.check("3", edited(original, 4))
+    assert duplicate_of == "1" and similarity >= DEFAULT_THRESHOLD
+    # Persistent, and a paper seen before is only compared with the papers indexed before it
+    index = NearDuplicateIndex(index.path)
+    assert index.check("1", "") == (None, 0.0)
+    assert index.check("3", "")[0] == "1"
+    assert index.counts() == {"indexed": 3, "near_duplicates": 1}
+
+
+def test_filter_modes(tmp_path):
+    original = text(1)
+    papers = [{"arxiv_id": str(i), "paper_md": edited(original, 2, seed=i) if i % 2 else text(i)} for i in range(8)]
+    skip = NearDuplicateFilter("skip", path=str(tmp_path / "skip.sqlite"))
+    assert [paper["arxiv_id"] for paper in skip(papers)] == ["0", "1", "2", "4", "6"]
+    assert skip.skipped == 3
+    defer = NearDuplicateFilter("defer", path=str(tmp_path / "defer.sqlite"))
+    assert [paper["arxiv_id"] for paper in defer(papers)] == ["0", "1", "2", "4", "6", "3", "5", "7"]
+    assert (defer.deferred, defer.skipped) == (3, 0)
+    off = NearDuplicateFilter("off", path=str(tmp_path / "off.sqlite"))
+    assert list(off(papers)) == papers
+    with pytest.raises(ValueError):
+        NearDuplicateFilter("drop")
+
+
+def test_defer_holds_at_most_max_deferred_papers(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "MAX_DEFERRED", 2)
+    original = text(1)
+    papers = [{"arxiv_id": str(i), "paper_md": edited(original, 2, seed=i) if i % 2 else text(i)} for i in range(8)]
+    defer = NearDuplicateFilter("defer", path=str(tmp_path / "defer.sqlite"))
+    assert [paper["arxiv_id"] for paper in defer(papers)] == ["0", "1", "2", "4", "6", "3", "5"]
+    assert (defer.deferred, defer.skipped) == (2, 1)
+    assert "2 deferred to the end of the stream, 1 skipped over the limit of 2" in defer.summary()
@@ -0,0 +1,76 @@
+import gzip
+import json
+
+import pytest
+
+from pipeline import journal
+from pipeline.journal import iter_journal, record_response, reparse
+from pipeline.tokens import content_hash
+from pipeline.writer import close_writer
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    """This process's journal, in the test's directory."""
+    directory = tmp_path / "journal"
+    monkeypatch.setattr(journal, "_journal_path", str(directory / "responses-test.jsonl.gz"))
+    yield directory
+    close_writer(journal.journal_path())
+
+
+def response(answer):
+    return {"conversations": [{"role": "user", "content": "Why?"}, {"role": "assistant", "content": f"<think>a b</think> {answer}."}]}
+
+
+def paper(arxiv_id):
+    return {"arxiv_id": arxiv_id, "paper_md": "markdown", "categories": ["cs.CL"]}
+
+
+def test_responses_are_journaled_without_the_markdown(journal_dir):
+    class Response:
+        def model_dump(self):
+            return response("dumped")
+
+    record_response(paper("1"), "multi-short", "m", response("plain"))
+    record_response(paper("2"), "single-long", "m", Response())
+    close_writer(journal.journal_path())
+    entries = list(iter_journal(journal.journal_path()))
+    assert [(e["paper"], e["entry_type"], e["model"]) for e in entries] == [
+        ({"arxiv_id": "1", "categories": ["cs.CL"]}, "multi-short", "m"),
+        ({"arxiv_id": "2", "categories": ["cs.CL"]}, "single-long", "m"),
+    ]
+    assert [e["response"] for e in entries] == [response("plain"), response("dumped")]
+
+
+def test_a_damaged_journal_is_read_up_to_the_damage(tmp_path):
+    path = tmp_path / "responses.jsonl.gz"
+    member = gzip.compress(b'{"n": 1}\n{"n": 2}\n')
+    path.write_bytes(member + gzip.compress(b'{"n": 3}\n')[:14])
+    # A crash mid-write leaves a truncated last member
+    assert [entry["n"] for entry in iter_journal(str(path))] == [1, 2]
+
+
+def test_reparse_rebuilds_records_from_the_journal(journal_dir, store, tmp_path):
+    pytest.importorskip("pydantic")
+    store.save_token_counts({content_hash("a b"): 2})
+    store.save_generation({"arxiv_id": "0", "entry_type": "multi-short", "model": "m", "conversations": []})
+    record_response(paper("1"), "multi-short", "m", response("first"))
+    record_response(paper("1"), "multi-short", "m", response("second"))
+    record_response(paper("2"), "multi-short", "m", {"not": "a conversation"})
+    record_response(paper("2"), "single-long", "m", response("long"))
+    # One combined response is a record per entry type
+    combined = {"multi_short": response("short")["conversations"], "single_long": response("Long")["conversations"]}
+    record_response(paper("4"), "combined", "m", combined)
+    # Rejected by the quality rules, as in the run
+    record_response(paper("3"), "multi-short", "m", response("About the paper"))
+    close_writer(journal.journal_path())
+
+    dataset_path = tmp_path / "zraw.jsonl"
+    assert reparse(str(dataset_path), str(journal_dir), store.path, workers=2) == 4
+    records = [json.loads(line) for line in dataset_path.read_text().splitlines()]
+    # Records without journal entries are kept, and the first response per key is the one kept
+    assert [(r["arxiv_id"], r["entry_type"]) for r in records] == [
+        ("0", "multi-short"), ("1", "multi-short"), ("2", "single-long"), ("4", "multi-short"), ("4", "single-long")
+    ]
+    assert records[1]["conversations"][1]["content"] == "<think>a b</think> first."
+    assert records[1]["avg_thinking_tokens"] == 2.0 and records[1]["categories"] == ["cs.CL"]
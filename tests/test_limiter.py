@@ -0,0 +1,127 @@
+import pytest
+
+from pipeline import limiter
+from pipeline.limiter import (
+    COOLDOWN,
+    DEFAULT_CEILING,
+    DEFAULT_FLOOR,
+    INCREASE_STEP,
+    MIN_BATCH_SIZE,
+    AdaptiveRateLimiter,
+    is_throttle_error,
+    limiter_for_backend,
+)
+
+
+class FakeClock:
+    """Stands in for the `time` module; sleeping only advances the clock, by at least a millisecond like a real sleep."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        seconds = max(seconds, 0.001)
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(limiter, "time", clock)
+    return clock
+
+
+def test_throttles_halve_the_rates_down_to_the_floor(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 60, 100_000)
+    rate_limiter.record_throttle()
+    assert rate_limiter.rates == {"requests": 30, "tokens": 50_000}
+    for _ in range(10):
+        rate_limiter.record_throttle()
+    assert rate_limiter.rates == {"requests": 60 * DEFAULT_FLOOR, "tokens": 100_000 * DEFAULT_FLOOR}
+
+
+def test_successes_add_a_step_after_the_cooldown_up_to_the_ceiling(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 60)
+    rate_limiter.record_throttle()
+    clock.now += COOLDOWN / 2
+    rate_limiter.record_success()
+    assert rate_limiter.rates == {"requests": 30}
+    clock.now += COOLDOWN / 2
+    rate_limiter.record_success()
+    assert rate_limiter.rates["requests"] == pytest.approx(30 + 60 * INCREASE_STEP)
+    for _ in range(100):
+        rate_limiter.record_success()
+    assert rate_limiter.rates == {"requests": 60 * DEFAULT_CEILING}
+
+
+def test_a_throttle_drops_the_remaining_budget(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 60)
+    rate_limiter.acquire(10)
+    assert clock.slept == 0
+    rate_limiter.record_throttle()
+    # The bucket starts empty at the halved rate: 30 requests per minute, so 10 take 20 seconds
+    rate_limiter.acquire(10)
+    assert clock.slept == pytest.approx(20, abs=0.01)
+
+
+def test_acquisitions_keep_the_average_rate(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 60, 6_000)
+    for _ in range(12):
+        rate_limiter.acquire(10, tokens=100)
+    # The first minute is the full bucket, the other 60 requests take another minute
+    assert clock.slept == pytest.approx(60, abs=0.01)
+
+
+def test_large_acquisitions_go_into_debt(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 60, 6_000)
+    # Twice the bucket only needs it full...
+    rate_limiter.acquire(1, tokens=12_000)
+    assert clock.slept == 0
+    # ...and the next acquisition waits for the debt to be paid off first
+    rate_limiter.acquire(1, tokens=600)
+    assert clock.slept == pytest.approx(66, abs=0.01)
+
+
+def test_batch_size_follows_the_rate(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 600)
+    assert rate_limiter.batch_size() == 100
+    rate_limiter.record_throttle()
+    assert rate_limiter.batch_size() == 50
+
+
+def test_slow_quotas_still_get_batches_of_the_minimum_size(clock):
+    rate_limiter = AdaptiveRateLimiter("test", 6)
+    assert rate_limiter.batch_size() == MIN_BATCH_SIZE
+    assert AdaptiveRateLimiter("test", 6, min_batch_size=0).batch_size() == 1
+    # The average rate still holds: 16 requests, of which the 10 beyond the full bucket take 100 seconds
+    for _ in range(4):
+        rate_limiter.acquire(rate_limiter.batch_size())
+    assert clock.slept == pytest.approx(100, abs=0.01)
+    rate_limiter.record_throttle()
+    assert rate_limiter.batch_size() == MIN_BATCH_SIZE
+
+
+def test_the_minimum_batch_size_is_the_backends_concurrency(monkeypatch):
+    monkeypatch.setattr(limiter, "_limiters", {})
+    backend = {"model_name": "gemini/gemini-2.0-flash", "backend_params": {"max_requests_per_minute": 10}}
+    assert limiter_for_backend(backend).batch_size() == MIN_BATCH_SIZE
+    local = {
+        "model_name": "local",
+        "rate_limit_key": "local",
+        "backend_params": {"max_requests_per_minute": 10, "max_concurrent_requests": 16},
+    }
+    assert limiter_for_backend(local).batch_size() == 16
+    # Backends sharing a key share the limiter
+    assert limiter_for_backend(dict(local, model_name="other")) is limiter_for_backend(local)
+    assert limiter_for_backend({"model_name": "unlimited", "backend_params": {}}) is None
+
+
+def test_throttle_errors():
+    assert is_throttle_error(RuntimeError("Error code: 429"))
+    assert is_throttle_error(Exception("RESOURCE_EXHAUSTED: Quota exceeded"))
+    assert not is_throttle_error(ValueError("invalid JSON at 1429"))
@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from pipeline import mirror
+from pipeline.mirror import PaperMirror
+
+
+@pytest.fixture
+def paper_mirror(tmp_path, monkeypatch):
+    # Small parts, so a few papers span several of them
+    monkeypatch.setattr(mirror, "ROWS_PER_PART", 4)
+    return PaperMirror(str(tmp_path / "mirror"))
+
+
+def ids(items):
+    return [item["arxiv_id"] for item in items]
+
+
+def test_sync_writes_the_first_limit_papers(paper_mirror, hub):
+    assert not paper_mirror.exists
+    assert paper_mirror.sync(limit=10) == 10
+    assert (paper_mirror.synced, paper_mirror.complete) == (10, False)
+    assert paper_mirror.covers(10) and not paper_mirror.covers(11) and not paper_mirror.covers(None)
+    assert ids(paper_mirror.iter_items()) == [str(i) for i in range(10)]
+    assert ids(paper_mirror.iter_items(limit=5)) == [str(i) for i in range(5)]
+    assert list(paper_mirror.iter_items(limit=1)) == [hub.rows[0]]
+    assert ids(paper_mirror.iter_positions([9, 2, 5, 42])) == ["9", "2", "5"]
+    assert paper_mirror.get("7") == hub.rows[7]
+    assert paper_mirror.get("missing") is None
+
+
+def test_sync_resumes_after_the_last_synced_paper(paper_mirror, hub):
+    paper_mirror.sync(limit=6)
+    hub.read.clear()
+    assert paper_mirror.sync(limit=6) == 0
+    assert paper_mirror.sync(limit=11) == 5
+    assert hub.read == list(range(6, 11))
+    # The short last part was rewritten together with the new papers
+    assert ids(PaperMirror(paper_mirror.mirror_dir).iter_items()) == [str(i) for i in range(11)]
+
+
+def test_an_interrupted_sync_keeps_the_complete_parts(paper_mirror, hub):
+    hub.fail_at = 10
+    with pytest.raises(ConnectionError):
+        paper_mirror.sync(limit=20)
+    assert paper_mirror.synced == 8
+    hub.fail_at = None
+    assert paper_mirror.sync(limit=20) == 12
+    assert ids(paper_mirror.iter_items()) == [str(i) for i in range(20)]
+
+
+def test_sync_to_the_end_marks_the_mirror_complete(paper_mirror, hub):
+    del hub.rows[9:]
+    assert paper_mirror.sync() == 9
+    assert paper_mirror.complete and paper_mirror.covers(None) and paper_mirror.covers(100)
+    assert paper_mirror.sync() == 0
+
+
+def test_append_continues_after_the_stored_rows(paper_mirror, hub):
+    assert paper_mirror.append(hub.rows[:6]) == 6
+    # A reopened store appends after the short last part, rewriting it whole
+    reopened = PaperMirror(paper_mirror.mirror_dir)
+    assert reopened.append(iter(hub.rows[6:9])) == 3
+    assert reopened.append([]) == 0
+    assert (reopened.synced, reopened.complete) == (9, False)
+    assert ids(reopened.iter_items()) == [str(i) for i in range(9)]
+    assert reopened.arxiv_ids() == {str(i) for i in range(9)}
+    assert reopened.get("8") == hub.rows[8]
@@ -0,0 +1,62 @@
+import itertools
+
+import pytest
+
+from pipeline.mirror import get_mirror
+from pipeline.papers import iter_papers, shuffle_buffer
+from pipeline.selection import PaperSelection
+from pipeline.shards import Shard
+
+
+def test_shuffle_buffer_is_a_seeded_permutation():
+    shuffled = list(shuffle_buffer(range(100), buffer_size=10, seed=1))
+    assert sorted(shuffled) == list(range(100))
+    assert shuffled != list(range(100))
+    assert shuffled == list(shuffle_buffer(range(100), buffer_size=10, seed=1))
+    assert shuffled != list(shuffle_buffer(range(100), buffer_size=10, seed=2))
+
+
+def test_shuffle_buffer_holds_at_most_buffer_size_items():
+    pulled = []
+    stream = (pulled.append(i) or i for i in itertools.count())
+    first = list(itertools.islice(shuffle_buffer(stream, buffer_size=10, seed=1), 5))
+    # Each yielded item was read at most buffer_size items before the latest one
+    assert len(pulled) == 15
+    assert all(i < 15 for i in first)
+
+
+def test_iter_papers_streams_the_first_limit_papers(workdir, hub):
+    loaded = list(iter_papers(limit=50, buffer_size=8, seed=0))
+    assert sorted(int(paper["arxiv_id"]) for paper in loaded) == list(range(50))
+    assert hub.read == list(range(50))
+    assert loaded[0] == {
+        "arxiv_id": loaded[0]["arxiv_id"], "paper_md": f"paper {loaded[0]['arxiv_id']}", "paper_doi": None,
+        "paper_authors": None, "paper_published_date": hub.rows[int(loaded[0]["arxiv_id"])]["paper_published_date"],
+        "paper_updated_date": None, "categories": hub.rows[int(loaded[0]["arxiv_id"])]["categories"],
+    }
+
+
+def test_shards_split_the_same_limit(workdir, hub):
+    shards = [{paper["arxiv_id"] for paper in iter_papers(limit=60, seed=0, selection=PaperSelection(shard=Shard(index, 3)))} for index in range(3)]
+    assert sorted(int(arxiv_id) for shard in shards for arxiv_id in shard) == list(range(60))
+
+
+def test_iter_papers_reads_the_mirror_when_it_covers_the_limit(workdir, hub):
+    pytest.importorskip("pyarrow")
+    get_mirror().sync(limit=40)
+    hub.read.clear()
+    assert sorted(int(paper["arxiv_id"]) for paper in iter_papers(limit=30, seed=0)) == list(range(30))
+    assert hub.read == []
+    # Beyond the mirror, papers are streamed again
+    assert len(list(iter_papers(limit=50, seed=0))) == 50
+    assert hub.read == list(range(50))
+
+
+def test_a_selection_yields_the_same_papers_from_the_mirror_and_the_hub(workdir, hub):
+    pytest.importorskip("pyarrow")
+    selection = PaperSelection(categories=("math.AG",), published_after="2024-03", published_before="2024-09")
+    streamed = sorted(paper["arxiv_id"] for paper in iter_papers(limit=100, seed=0, selection=selection))
+    get_mirror().sync(limit=100)
+    assert sorted(paper["arxiv_id"] for paper in iter_papers(limit=100, seed=0, selection=selection)) == streamed
+    assert streamed == sorted(row["arxiv_id"] for row in hub.rows[:100] if selection.matches(row))
+    assert 0 < len(streamed) < 50
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from pipeline.mirror import PaperMirror, get_mirror
+from pipeline.priority import PaperLengths, YieldPrioritizer, YieldStats, default_window, lookup_lengths
+
+MODEL = "gemini-2.0-flash"
+
+
+def write_verified(path, suitable_by_category, records=30):
+    with open(path, "w") as f:
+        for category, suitable in suitable_by_category.items():
+            for i in range(records):
+                f.write(json.dumps({
+                    "arxiv_id": f"{category}-{i}", "model": MODEL, "categories": category,
+                    "suitability": "Suitable" if i < suitable * records else "Unsuitable",
+                    "conversations": [{"role": "assistant", "content": "x" * 1000}],
+                }) + "\n")
+
+
+def paper(arxiv_id, category, chars=40_000):
+    return {"arxiv_id": arxiv_id, "categories": category, "paper_md": "x" * chars}
+
+
+def prioritizer(workdir, **kwargs):
+    return YieldPrioritizer([MODEL], verified_path=str(workdir / "verified.jsonl"), lengths_path=str(workdir / "lengths.sqlite"), **kwargs)
+
+
+def test_default_window():
+    assert default_window(None, 16) == 256
+    assert default_window(100, 16) == 32
+    assert default_window(400, 16) == 100
+    assert default_window(100_000, 16) == 256
+
+
+def test_rates_shrink_towards_the_parent_group():
+    stats = YieldStats()
+    for i in range(10):
+        stats.add(MODEL, "cs.CL", 0, True, 100)
+        stats.add(MODEL, "math.AG", 0, False, 100)
+    assert stats.rate(MODEL) == pytest.approx(0.5, abs=0.05)
+    assert stats.rate(MODEL) < stats.rate(MODEL, "cs.CL") < 1.0
+    assert 0.0 < stats.rate(MODEL, "math.AG") < stats.rate(MODEL)
+    # Unseen groups fall back to their parent
+    assert stats.rate(MODEL, "hep-th", 0) == stats.rate(MODEL)
+
+
+def test_more_suitable_categories_come_first(workdir):
+    write_verified(workdir / "verified.jsonl", {"cs.CL": 0.9, "math.AG": 0.1})
+    papers = [paper(str(i), "math.AG" if i % 2 else "cs.CL") for i in range(6)]
+    ordered = prioritizer(workdir)(papers)
+    assert [p["arxiv_id"] for p in ordered] == ["0", "2", "4", "1", "3", "5"]
+
+
+def test_cheaper_papers_come_first(workdir):
+    write_verified(workdir / "verified.jsonl", {"cs.CL": 0.5})
+    papers = [paper("long", "cs.CL", 60_000), paper("short", "cs.CL", 20_000)]
+    assert [p["arxiv_id"] for p in prioritizer(workdir)(papers)] == ["short", "long"]
+
+
+def test_window_bounds_the_reordering(workdir):
+    write_verified(workdir / "verified.jsonl", {"cs.CL": 0.9, "math.AG": 0.1})
+    papers = [paper(str(i), "math.AG" if i < 3 else "cs.CL") for i in range(6)]
+    ordered = prioritizer(workdir, window=1)(papers)
+    # Only one paper is held back: a good paper can overtake a single bad one
+    assert [p["arxiv_id"] for p in ordered] == ["0", "1", "3", "4", "5", "2"]
+
+
+def test_stream_order_without_verification_results(workdir):
+    papers = [paper(str(i), "math.AG" if i % 2 else "cs.CL", 1000 * (i + 1)) for i in range(4)]
+    prioritize = prioritizer(workdir)
+    assert list(prioritize(papers)) == papers
+    # The lengths are kept for the statistics of later runs
+    assert PaperLengths(str(workdir / "lengths.sqlite")).get(["0", "3"]) == {"0": 1000, "3": 4000}
+
+
+def test_stream_keeps_the_stream_order(workdir):
+    write_verified(workdir / "verified.jsonl", {"cs.CL": 0.9, "math.AG": 0.1})
+    papers = [paper(str(i), "math.AG" if i % 2 else "cs.CL") for i in range(4)]
+    assert list(prioritizer(workdir, mode="stream")(papers)) == papers
+    with pytest.raises(ValueError):
+        prioritizer(workdir, mode="random")
+
+
+def test_lengths_are_read_from_the_mirror_in_batches_and_misses_remembered(workdir, hub, monkeypatch):
+    pytest.importorskip("pyarrow")
+    read = []
+    iter_positions = PaperMirror.iter_positions
+
+    def reading(self, positions):
+        positions = sorted(positions)
+        read.append(positions)
+        return iter_positions(self, positions)
+
+    monkeypatch.setattr(PaperMirror, "iter_positions", reading)
+    get_mirror().sync(limit=10)
+    lengths = PaperLengths(str(workdir / "lengths.sqlite"))
+    assert lookup_lengths(["3", "7", "12"], lengths) == {"3": 7, "7": 7}
+    assert read == [[3, 7]]
+    # Neither the found lengths nor the paper the mirror doesn't hold are looked up again
+    assert lookup_lengths(["3", "7", "12"], lengths) == {"3": 7, "7": 7}
+    assert read == [[3, 7]]
+    # Until the mirror changes
+    get_mirror().sync(limit=20)
+    assert lookup_lengths(["3", "12"], lengths) == {"3": 7, "12": 8}
+    assert read == [[3, 7], [12]]
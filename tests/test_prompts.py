@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import pytest
+
+from pipeline.prompts import EXAMPLE_PAPERS, PROMPT_FILES, PromptTemplate, build_prompt, load_combined_prompt, load_prompts
+
+REPO_PROMPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
+
+
+@pytest.fixture
+def prompt_dir(tmp_path):
+    (tmp_path / "example_papers").mkdir()
+    for paper in EXAMPLE_PAPERS:
+        (tmp_path / "example_papers" / f"{paper}.md").write_text(f"<{paper} text>")
+    for entry_type, filename in PROMPT_FILES.items():
+        (tmp_path / filename).write_text(f"{entry_type} instructions {{paper_1}} {{paper_2}} {{paper_3}}\nNow: {{paper_4}}\nEnd {{paper_1}}")
+    return str(tmp_path)
+
+
+def test_render_is_a_join_around_the_slot():
+    template = PromptTemplate("before {paper_4} middle {paper_4} after")
+    assert template.has_slot and template.prefix == "before "
+    assert template.render("X") == "before X middle X after"
+    assert template.text == "before {paper_4} middle {paper_4} after"
+    assert not PromptTemplate("no slot").has_slot
+
+
+def test_template_pickles_by_value():
+    template = PromptTemplate("a {paper_4} b")
+    assert pickle.loads(pickle.dumps(template)) == template
+    assert hash(pickle.loads(pickle.dumps(template))) == hash(template)
+
+
+def test_examples_are_filled_in_once_at_load_time(prompt_dir):
+    prompts = load_prompts(prompt_dir)
+    assert set(prompts) == set(PROMPT_FILES)
+    prompt = build_prompt(prompts["multi-short"], {"arxiv_id": "1", "paper_md": "PAPER {paper_1}"})
+    # The paper is inserted as is, placeholders in it are not substituted
+    assert prompt == "multi-short instructions <paper_1 text> <paper_2 text> <paper_3 text>\nNow: PAPER {paper_1}\nEnd <paper_1 text>"
+    assert build_prompt(prompts["single-long"], {"arxiv_id": "1"}).endswith("Now: [PAPER MARKDOWN MISSING]\nEnd <paper_1 text>")
+
+
+def test_repo_prompts_render_as_plain_substitution():
+    prompts = load_prompts(REPO_PROMPTS)
+    for entry_type, filename in PROMPT_FILES.items():
+        with open(os.path.join(REPO_PROMPTS, filename)) as f:
+            text = f.read()
+        for paper in EXAMPLE_PAPERS:
+            with open(os.path.join(REPO_PROMPTS, "example_papers", f"{paper}.md")) as f:
+                text = text.replace("{" + paper + "}", f.read())
+        paper = {"arxiv_id": "1", "paper_md": "# Some paper\n\nBody."}
+        assert build_prompt(prompts[entry_type], paper) == text.replace("{paper_4}", paper["paper_md"])
+        # The static prefix holds the whole template up to the paper
+        assert len(prompts[entry_type].prefix) > 1000
+
+
+def test_the_combined_prompt_holds_both_tasks_and_the_papers_once(prompt_dir):
+    prompt = build_prompt(load_combined_prompt(prompt_dir), {"arxiv_id": "1", "paper_md": "PAPER"})
+    assert prompt.index("=== TASK 1: multi-short ===") < prompt.index("=== TASK 2: single-long ===") < prompt.index("=== OUTPUT FOR BOTH TASKS ===")
+    # Each task stops where its template took the paper, which comes once at the end
+    assert "multi-short instructions <paper_1 text> <paper_2 text> <paper_3 text>\nNow:" in prompt
+    assert "single-long instructions [Example paper 1: the same text as in the examples of task 1 above]" in prompt
+    assert prompt.count("<paper_1 text>") == 1 and "End" not in prompt
+    assert '{ "multi_short": [entries of task 1], "single_long": [entries of task 2] }' in prompt
+    assert prompt.endswith("The text:\n\nPAPER\n")
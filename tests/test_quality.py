@@ -0,0 +1,41 @@
+from pipeline.quality import RULES, failed_rules
+
+
+def record(*messages):
+    roles = ["user", "assistant"]
+    return {"conversations": [{"role": roles[i % 2], "content": content} for i, content in enumerate(messages)]}
+
+
+def test_a_good_record_passes():
+    assert failed_rules(record("What does the method assume?", "<think>It assumes x.</think> It assumes x.")) == []
+
+
+def test_thinking_is_required():
+    assert failed_rules(record("Why?", "Because.")) == ["opens_with_thinking", "has_thinking"]
+    assert failed_rules(record("Why?", "<think></think> Because.")) == ["has_thinking"]
+    # One non-empty thinking section is enough, but every answer opens with one
+    assert failed_rules(record("Why?", "<think>x</think> Because.", "And?", "<think></think> Also.")) == []
+    assert failed_rules(record("Why?", "<think>x</think> Because.", "And?", "Also.")) == ["opens_with_thinking"]
+
+
+def test_roles_alternate_starting_with_the_user():
+    answer = "<think>x</think> Because."
+    assert failed_rules({"conversations": [{"role": "assistant", "content": answer}]}) == ["alternating_roles"]
+    conversation = [{"role": "user", "content": "Why?"}, {"role": "user", "content": "Really?"}, {"role": "assistant", "content": answer}]
+    assert failed_rules({"conversations": conversation}) == ["alternating_roles"]
+    conversation = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Why?"}, {"role": "assistant", "content": answer}]
+    assert failed_rules({"conversations": conversation}) == ["alternating_roles"]
+
+
+def test_references_to_the_source_fail():
+    for phrase in ("the paper", "The text", "the document"):
+        assert failed_rules(record(f"What does {phrase} say?", "<think>x</think> Something.")) == ["no_source_references"]
+
+
+def test_the_last_answer_ends_with_a_period():
+    assert failed_rules(record("Why?", "<think>x</think> Because. ", "And?", "<think>y</think> Also")) == ["ends_with_period"]
+    assert failed_rules(record("Why?")) == ["has_thinking", "ends_with_period"]
+
+
+def test_a_raising_rule_counts_as_failed():
+    assert failed_rules({"conversations": None}) == list(RULES)
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("bespokelabs")
+
+from pipeline import scheduler
+from pipeline.config import ENTRY_TYPES
+from pipeline.scheduler import pending_entry_types
+
+pytestmark = pytest.mark.usefixtures("dead_letters")
+
+
+def make_worker(name, combined=False):
+    extractors = {entry_type: SimpleNamespace(batch_namespace=f"{name}/{entry_type}") for entry_type in ENTRY_TYPES}
+    return SimpleNamespace(name=name, extractors=extractors, combined=SimpleNamespace(batch_namespace=f"{name}/combined") if combined else None)
+
+
+def test_all_types_pending_for_a_new_paper(store):
+    assert pending_entry_types("1", [make_worker("a"), make_worker("b")], store) == ENTRY_TYPES
+
+
+def test_a_type_generated_by_any_worker_is_done(store):
+    store.save_generation({"arxiv_id": "1", "entry_type": "multi-short", "model": "b"})
+    assert pending_entry_types("1", [make_worker("a"), make_worker("b")], store) == ["single-long"]
+    assert pending_entry_types("2", [make_worker("a"), make_worker("b")], store) == ENTRY_TYPES
+
+
+def test_generations_of_inactive_backends_dont_count(store):
+    store.save_generation({"arxiv_id": "1", "entry_type": "multi-short", "model": "c"})
+    assert pending_entry_types("1", [make_worker("a")], store) == ENTRY_TYPES
+
+
+def test_only_the_given_entry_types_are_checked(store):
+    store.save_generation({"arxiv_id": "1", "entry_type": "single-long", "model": "a"})
+    assert pending_entry_types("1", [make_worker("a")], store, ["multi-short"]) == ["multi-short"]
+    assert pending_entry_types("1", [make_worker("a")], store, ["single-long"]) == []
+
+
+def test_dead_letters_are_not_scheduled_again(store, dead_letters):
+    dead_letters.record_failures("a", [({"arxiv_id": "1"}, "single-long")], "Timeout")
+    assert pending_entry_types("1", [make_worker("a")], store) == ["multi-short"]
+    assert pending_entry_types("2", [make_worker("a")], store) == ENTRY_TYPES
+
+
+def test_papers_in_a_running_batch_job_are_not_queued_again(store, monkeypatch):
+    submitted = {"1": {"a/single-long"}, "2": {"c/combined"}}
+    monkeypatch.setattr(scheduler, "batch_enabled", lambda: True)
+    monkeypatch.setattr(scheduler, "get_batch_tracker", lambda: SimpleNamespace(pending_namespaces=lambda arxiv_id: submitted.get(arxiv_id, set())))
+    assert pending_entry_types("1", [make_worker("a")], store) == ["multi-short"]
+    assert pending_entry_types("1", [make_worker("b")], store) == ENTRY_TYPES
+    assert pending_entry_types("2", [make_worker("a")], store) == ENTRY_TYPES
+    # A combined job answers both entry types
+    assert pending_entry_types("2", [make_worker("c", combined=True)], store) == []
@@ -0,0 +1,62 @@
+import pytest
+
+from pipeline.mirror import PaperMirror
+from pipeline.selection import PaperSelection, item_categories
+from pipeline.shards import Shard
+
+
+def row(arxiv_id="1", published="2024-03-15", updated=None, categories="cs.CL math.AG"):
+    return {"arxiv_id": arxiv_id, "paper_published_date": published, "paper_updated_date": updated, "categories": categories}
+
+
+def test_item_categories():
+    assert item_categories({"categories": "cs.CL math.AG"}) == ["cs.CL", "math.AG"]
+    assert item_categories({"categories": ["cs.CL"]}) == ["cs.CL"]
+    assert item_categories({}) == []
+
+
+def test_everything_matches_an_empty_selection():
+    assert PaperSelection().matches(row(published=None, categories=None))
+    assert PaperSelection().describe() == "all papers"
+
+
+def test_categories_match_any_of_them():
+    assert PaperSelection(categories=("math.AG", "hep-th")).matches(row())
+    assert not PaperSelection(categories=("hep-th",)).matches(row())
+
+
+def test_dates_after_are_inclusive_and_before_exclusive():
+    assert PaperSelection(published_after="2024-03").matches(row())
+    assert PaperSelection(published_before="2024-03-16").matches(row())
+    assert not PaperSelection(published_before="2024-03-15").matches(row())
+    assert not PaperSelection(published_after="2024-04").matches(row())
+    # Papers without the date don't match a bound on it
+    assert not PaperSelection(updated_after="2020").matches(row())
+    assert PaperSelection(updated_before="2025").matches(row(updated="2024-12-01"))
+
+
+def test_shard_and_exclusion_use_the_id_only():
+    shard = Shard(0, 2)
+    ids = [str(i) for i in range(20)]
+    assert [i for i in ids if PaperSelection(shard=shard).matches(row(i))] == [i for i in ids if shard.contains(i)]
+    assert not PaperSelection(exclude=lambda arxiv_id: arxiv_id == "1").matches(row("1"))
+    assert PaperSelection(exclude=lambda arxiv_id: arxiv_id == "1").matches(row("2"))
+
+
+def test_describe():
+    selection = PaperSelection(categories=("cs.CL",), published_after="2024", shard=Shard(1, 4), exclude=bool)
+    assert selection.describe() == "categories cs.CL; published >= 2024; shard 1/4; not generated yet"
+
+
+def test_the_mirror_index_agrees_with_matches(tmp_path, hub):
+    pytest.importorskip("pyarrow")
+    mirror = PaperMirror(str(tmp_path / "mirror"))
+    mirror.sync(limit=200)
+    for selection in (
+        PaperSelection(categories=("cs.LG",)),
+        PaperSelection(published_after="2024-05", published_before="2024-07"),
+        PaperSelection(categories=("cs.CL",), shard=Shard(2, 3), exclude=lambda arxiv_id: arxiv_id.endswith("7")),
+    ):
+        expected = [position for position, item in enumerate(hub.rows[:200]) if selection.matches(item)]
+        assert mirror.select(selection) == expected
+        assert mirror.select(selection, limit=50) == [position for position in expected if position < 50]
@@ -0,0 +1,24 @@
+from pipeline.shards import Shard, shard_of
+
+
+def test_shard_of_is_stable():
+    # blake2b, not hash(): the same on every host and Python version, so these must never change
+    ids = ("2101.00001", "2101.00002", "2101.00003", "2101.00004")
+    assert [shard_of(arxiv_id, 4) for arxiv_id in ids] == [2, 3, 2, 0]
+    assert [shard_of(arxiv_id, 7) for arxiv_id in ids] == [3, 2, 3, 6]
+    assert shard_of("2101.00001", 1) == 0
+
+
+def test_shards_split_the_stream():
+    ids = [f"2101.{i:05d}" for i in range(1000)]
+    shards = [Shard(index, 3) for index in range(3)]
+    parts = [[arxiv_id for arxiv_id in ids if shard.contains(arxiv_id)] for shard in shards]
+    assert sorted(sum(parts, [])) == ids
+    # Every shard gets a fair share
+    assert all(250 < len(part) < 420 for part in parts)
+
+
+def test_shard_paths_are_distinct():
+    shards = [Shard(0, 2), Shard(1, 2)]
+    for path in ("dataset_path", "store_path", "dead_letters_path"):
+        assert len({getattr(shard, path)() for shard in shards}) == 2
@@ -0,0 +1,83 @@
+def record(arxiv_id, value="", entry_type="multi-short", model="m"):
+    return {"arxiv_id": arxiv_id, "entry_type": entry_type, "model": model, "value": value}
+
+
+def test_generations(store):
+    assert store.save_generation(record("1", "first"))
+    assert not store.save_generation(record("1", "second"))
+    store.save_generation(record("1", entry_type="single-long"))
+    store.save_generation(record("2", model="other"))
+    assert store.is_generated("1", "multi-short", "m")
+    assert not store.is_generated("1", "multi-short", "other")
+    assert store.generated_for("1") == {("multi-short", "m"), ("single-long", "m")}
+    assert store.count_generated("multi-short", "m") == 1
+    # The first record is kept, in insertion order
+    assert [(r["arxiv_id"], r["value"]) for r in store.iter_generations()] == [("1", "first"), ("1", ""), ("2", "")]
+    # Complete once every entry type was generated by one of the models
+    assert store.is_complete("1", ["multi-short", "single-long"], ["m", "other"])
+    assert not store.is_complete("2", ["multi-short", "single-long"], ["m", "other"])
+    assert store.is_complete("2", ["multi-short"], ["other"])
+
+
+def test_verifications(store):
+    assert store.save_verification("c1", "v", {"arxiv_id": "1"})
+    assert not store.save_verification("c1", "v", {"arxiv_id": "1"})
+    assert store.is_verified("c1", "v")
+    assert not store.is_verified("c1", "other")
+
+
+def test_legacy_generation_checkpoint_is_imported_once_per_version(store, tmp_path):
+    path = tmp_path / ".checkpoint_multi-short"
+    path.write_text("1\n2\n\n")
+    assert store.import_legacy_generation_checkpoint(str(path), "multi-short", "m") == 2
+    assert store.import_legacy_generation_checkpoint(str(path), "multi-short", "m") == 0
+    assert store.is_generated("2", "multi-short", "m")
+    # Legacy checkpoints have no record
+    assert list(store.iter_generations()) == []
+    path.write_text("1\n2\n3\n")
+    assert store.import_legacy_generation_checkpoint(str(path), "multi-short", "m") == 3
+    assert store.count_generated("multi-short", "m") == 3
+    assert store.import_legacy_generation_checkpoint(str(tmp_path / "missing"), "multi-short", "m") == 0
+
+
+def test_legacy_verifier_checkpoint_splits_arxiv_id_and_content_id(store, tmp_path):
+    first, second = "123e4567-e89b-12d3-a456-426614174000", "123e4567-e89b-12d3-a456-426614174001"
+    path = tmp_path / ".checkpoint_verifier"
+    path.write_text(f"2101.00001_{first}\nsolv_int_9901001_{second}\nbroken\n")
+    assert store.import_legacy_verifier_checkpoint(str(path), "v") == 2
+    assert store.is_verified(second, "v")
+    arxiv_ids = {arxiv_id for arxiv_id, in store._conn.execute("SELECT arxiv_id FROM verifications")}
+    assert arxiv_ids == {"2101.00001", "solv_int_9901001"}
+
+
+def test_merge_adds_missing_records(make_store):
+    main, shard = make_store("main"), make_store("shard")
+    main.save_generation(record("1", "main"))
+    shard.save_generation(record("2", "shard"))
+    shard.save_generation(record("2", "shard", entry_type="single-long"))
+    shard.save_token_counts({b"hash": 3})
+    assert main.merge_from(shard.path) == 2
+    assert sorted((r["arxiv_id"], r["entry_type"]) for r in main.iter_generations()) == [("1", "multi-short"), ("2", "multi-short"), ("2", "single-long")]
+    assert main.get_token_counts([b"hash"]) == {b"hash": 3}
+
+
+def test_merge_keeps_existing_records(make_store):
+    main, shard = make_store("main"), make_store("shard")
+    main.save_generation(record("1", "main"))
+    shard.save_generation(record("1", "shard"))
+    assert main.merge_from(shard.path) == 0
+    assert [r["value"] for r in main.iter_generations()] == ["main"]
+
+
+def test_merge_replaces_legacy_rows(make_store, tmp_path):
+    main, shard = make_store("main"), make_store("shard")
+    (tmp_path / "main.txt").write_text("1\n")
+    (tmp_path / "shard.txt").write_text("2\n")
+    main.import_legacy_generation_checkpoint(str(tmp_path / "main.txt"), "multi-short", "m")
+    shard.import_legacy_generation_checkpoint(str(tmp_path / "shard.txt"), "multi-short", "m")
+    shard.save_generation(record("1", "shard"))
+    assert main.merge_from(shard.path) == 2
+    assert [r["value"] for r in main.iter_generations()] == ["shard"]
+    # A legacy row never replaces a record, and merging twice changes nothing
+    assert main.is_generated("2", "multi-short", "m")
+    assert main.merge_from(shard.path) == 0
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from pipeline.quality import RULES, failed_rules
+from pipeline.streaming import PATTERN_OVERLAP, STREAMED_RULES, ConversationStream
+
+CHUNK_SIZES = (1, 2, 3, 7, 64, 100_000)
+ANSWER = "<think>\nIf the effect holds, the signal should grow with the sample.\n</think>\nIt should grow with the sample."
+
+
+def document(*messages, roles=("user", "assistant")):
+    return json.dumps({"conversations": [{"role": roles[i % len(roles)], "content": content} for i, content in enumerate(messages)]})
+
+
+def stream(text, size, max_output_tokens=None):
+    """Feed `text` in chunks of `size` characters until a rule is violated."""
+    checker = ConversationStream(max_output_tokens)
+    for start in range(0, len(text), size):
+        if checker.feed(text[start:start + size]) is not None:
+            break
+    return checker
+
+
+def splits(text):
+    """`text` split in two at every position."""
+    return [(text[:i], text[i:]) for i in range(1, len(text))]
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_a_good_response_passes(size):
+    text = document("What should happen to the signal?", ANSWER, "And with less noise?", ANSWER)
+    checker = stream(text, size)
+    assert checker.violation is None
+    assert checker.finish() == json.loads(text)
+    assert failed_rules(checker.finish()) == []
+
+
+def test_a_think_tag_split_across_chunks():
+    good, bad = document("Why?", ANSWER), document("Why?", "I think it should grow with the sample.")
+    for first, second in splits(good):
+        checker = ConversationStream()
+        checker.feed(first)
+        assert checker.feed(second) is None, (first, second)
+    for first, second in splits(bad):
+        checker = ConversationStream()
+        checker.feed(first)
+        assert checker.feed(second) == "opens_with_thinking", (first, second)
+
+
+def test_a_missing_think_tag_cancels_before_the_answer_is_complete():
+    text = document("Why?", "Because " * 500 + ".")
+    checker = stream(text, 1)
+    assert checker.violation == "opens_with_thinking"
+    assert checker.length < len(text) // 10
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_escaped_characters(size):
+    # \u escapes (which an escaping encoder also uses for the tag itself) and escaped quotes decode before the checks
+    text = json.dumps(json.loads(document("Does \"Schrödinger\" hold?", ANSWER)), ensure_ascii=True)
+    escaped = text.replace("<", "\\u003c").replace(">", "\\u003e")
+    assert "\\u00f6" in escaped and "\\u003cthink\\u003e" in escaped
+    assert stream(escaped, size).violation is None
+    assert stream(document("Why?", ANSWER).replace("the signal", "\\u0074he p\\u0061per"), size).violation == "no_source_references"
+    assert stream(document("Why?", "\\u0049 think so."), size).violation == "opens_with_thinking"
+
+
+def test_a_source_reference_spanning_two_chunks():
+    padding = "The signal grows with the sample, as expected. " * 3
+    assert len(padding) > PATTERN_OVERLAP
+    text = document("Why?", f"<think>\n{padding}As the paper shows, it grows.\n</think>\n{padding}")
+    start = text.index("the paper")
+    for split in range(start + 1, start + len("the paper")):
+        checker = ConversationStream()
+        assert checker.feed(text[:split]) is None
+        assert checker.feed(text[split:]) == "no_source_references"
+    # Fed one character at a time, it is found as soon as it is complete
+    assert stream(text, 1).length == start + len("the paper")
+    assert stream(text.replace("the paper", "the theory"), 1).violation is None
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_roles(size):
+    assert stream(document(ANSWER, "Why?", roles=("assistant", "user")), size).violation == "alternating_roles"
+    assert stream(document("Be brief.", "Why?", ANSWER, roles=("system", "user", "assistant")), size).violation == "alternating_roles"
+    assert stream(document("Why?", "Really?", roles=("user",)), size).violation == "alternating_roles"
+
+
+def test_runaway_output_is_cancelled():
+    text = document("Why?", "<think>" + "and so on " * 1000 + "</think> Done.")
+    checker = stream(text, 64, max_output_tokens=100)
+    assert checker.violation == "max_output_tokens"
+    assert checker.length < len(text)
+
+
+def test_streamed_rules_are_the_quality_rules():
+    assert set(STREAMED_RULES) <= RULES.keys()
+    bad_responses = [
+        document("Why?", "Because."),
+        document(ANSWER, "Why?", roles=("assistant", "user")),
+        document("What does the paper say?", ANSWER),
+    ]
+    for text in bad_responses:
+        violation = stream(text, 5).violation
+        assert violation in STREAMED_RULES and violation in failed_rules(json.loads(text))
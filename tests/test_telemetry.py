@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from pipeline.telemetry import Telemetry, percentile
+from pipeline.writer import close_writer
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert [percentile(values, q) for q in (0.5, 0.95, 0.99, 1.0)] == [50, 95, 99, 100]
+    assert percentile([3.0], 0.5) == 3.0
+    assert percentile([], 0.5) is None
+
+
+def test_summary():
+    telemetry = Telemetry()
+    for latency in range(1, 101):
+        telemetry.record_request("curator", "gemini-2.0-flash", float(latency), input_tokens=10_000, output_tokens=5_000)
+    telemetry.record_request("curator", "gemini-2.0-flash", 0.5, retries=1, error="Timeout")
+    telemetry.record_outcome("curator", "gemini-2.0-flash", accepted=True)
+    telemetry.record_outcome("curator", "gemini-2.0-flash", accepted=True)
+    telemetry.record_outcome("curator", "gemini-2.0-flash", accepted=False)
+    summary = telemetry.summary()[("curator", "gemini-2.0-flash")]
+    assert (summary["requests"], summary["errors"], summary["retries"]) == (101, 1, 1)
+    assert (summary["accepted"], summary["rejected"]) == (2, 1)
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (50.0, 95.0, 99.0)
+    assert summary["tokens_per_second"] == pytest.approx(500_000 / 5050.5)
+    # 1M input tokens at $0.10 and 0.5M output tokens at $0.40 per million
+    assert summary["cost"] == pytest.approx(0.3)
+    assert summary["cost_per_accepted"] == pytest.approx(0.15)
+
+
+def test_batch_requests_cost_half():
+    telemetry = Telemetry()
+    telemetry.record_request("curator", "gemini-2.0-flash", 1.0, input_tokens=1_000_000)
+    telemetry.record_request("curator-batch", "gemini-2.0-flash", 1.0, input_tokens=1_000_000)
+    summary = telemetry.summary()
+    assert summary[("curator", "gemini-2.0-flash")]["cost"] == pytest.approx(0.1)
+    assert summary[("curator-batch", "gemini-2.0-flash")]["cost"] == pytest.approx(0.05)
+
+
+def test_unpriced_models_have_no_cost():
+    telemetry = Telemetry()
+    telemetry.record_request("curator", "some/model", 1.0, output_tokens=10)
+    summary = telemetry.summary()[("curator", "some/model")]
+    assert summary["cost"] is None and summary["cost_per_accepted"] is None
+
+
+def test_prometheus_text():
+    telemetry = Telemetry()
+    telemetry.record_request("together", 'odd"model', 2.0, output_tokens=7)
+    text = telemetry.prometheus_text()
+    assert 'academic_chains_requests_total{source="together",model="odd\\"model"} 1' in text
+    assert 'academic_chains_output_tokens_total{source="together",model="odd\\"model"} 7' in text
+    assert 'academic_chains_request_latency_seconds{source="together",model="odd\\"model",quantile="0.5"} 2.0' in text
+    # Unpriced, so no cost sample
+    assert "academic_chains_cost_usd_total{" not in text
+
+
+def test_events_are_logged(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    telemetry = Telemetry(path)
+    telemetry.record_request("curator", "m", 1.25, requests=4)
+    telemetry.record_outcome("curator", "m", accepted=False, arxiv_id="1")
+    close_writer(path)
+    events = [json.loads(line) for line in open(path)]
+    assert [(e["event"], e.get("requests"), e.get("arxiv_id")) for e in events] == [("request", 4, None), ("outcome", None, "1")]
@@ -0,0 +1,71 @@
+import pytest
+
+from pipeline import tokens
+from pipeline.tokens import ThinkingTokenCounter, extract_thinking
+
+
+@pytest.fixture
+def tokenized(monkeypatch):
+    """Batches sent to the tokenizer; a text counts one token per word."""
+    batches = []
+
+    def tokenize_counts(texts):
+        batches.append(list(texts))
+        return [len(text.split()) for text in texts]
+
+    monkeypatch.setattr(tokens, "_tokenize_counts", tokenize_counts)
+    return batches
+
+
+def conversation(*thinking):
+    messages = [{"role": "user", "content": "<think>not counted</think> question"}]
+    for text in thinking:
+        messages.append({"role": "assistant", "content": f"<think>{text}</think> answer." if text else "answer."})
+    return messages
+
+
+def test_extract_thinking():
+    assert extract_thinking("<think> a b </think> c") == "a b"
+    assert extract_thinking("<think>unclosed") == "unclosed"
+    assert extract_thinking("no tags") == ""
+
+
+def test_average_over_assistant_messages(store, tokenized):
+    counter = ThinkingTokenCounter(store_path=store.path)
+    assert counter.count_avg(conversation("one two", "three four five six", None)) == 2.0
+    assert counter.submit(conversation(None)).result() == 0.0
+    counter.close()
+
+
+def test_texts_are_counted_in_one_batch_and_once(store, tokenized):
+    counter = ThinkingTokenCounter(max_wait=5.0, store_path=store.path)
+    futures = [counter.submit(conversation(f"text {i % 3}", "shared words here")) for i in range(10)]
+    # Closing flushes the batch still being filled
+    counter.close()
+    assert [future.result() for future in futures] == [2.5] * 10
+    assert len(tokenized) == 1 and sorted(tokenized[0]) == ["shared words here", "text 0", "text 1", "text 2"]
+
+
+def test_counts_are_memoized_in_the_store(store, tokenized):
+    counter = ThinkingTokenCounter(store_path=store.path)
+    counter.count_avg(conversation("one two three"))
+    counter.close()
+    counter = ThinkingTokenCounter(store_path=store.path)
+    assert counter.count_avg(conversation("one two three")) == 3.0
+    counter.close()
+    assert tokenized == [["one two three"]]
+
+
+def test_a_failed_batch_counts_as_zero_and_isnt_memoized(store, tokenized, monkeypatch):
+    def broken(texts):
+        raise OSError("tokenizer unavailable")
+
+    tokenize_counts = tokens._tokenize_counts
+    monkeypatch.setattr(tokens, "_tokenize_counts", broken)
+    counter = ThinkingTokenCounter(store_path=store.path)
+    assert counter.submit(conversation("one two")).result(timeout=5) == 0.0
+    counter.close()
+    monkeypatch.setattr(tokens, "_tokenize_counts", tokenize_counts)
+    counter = ThinkingTokenCounter(store_path=store.path)
+    assert counter.count_avg(conversation("one two")) == 2.0
+    counter.close()
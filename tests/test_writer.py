@@ -0,0 +1,104 @@
+import gzip
+import json
+import pickle
+import time
+
+import pytest
+
+from pipeline import writer
+from pipeline.writer import GroupCommitWriter, close_writer, get_writer
+
+
+@pytest.fixture
+def writers(monkeypatch):
+    """Process-wide writers of this test only, closed afterwards."""
+    monkeypatch.setattr(writer, "_writers", {})
+    monkeypatch.setattr(writer, "_defaults", dict(writer._defaults))
+    yield
+    writer.close_all()
+
+
+def lines(path):
+    if not path.exists():
+        return []
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_records_are_flushed_once_the_batch_is_full(tmp_path):
+    path = tmp_path / "out.jsonl"
+    out = GroupCommitWriter(str(path), max_records=3, max_delay=60)
+    out.write({"i": 0})
+    out.write({"i": 1})
+    assert lines(path) == []
+    out.write({"i": 2})
+    assert lines(path) == [{"i": 0}, {"i": 1}, {"i": 2}]
+    out.write({"i": 3})
+    assert len(lines(path)) == 3
+    out.close()
+    assert lines(path) == [{"i": i} for i in range(4)]
+
+
+def test_records_are_flushed_after_the_delay(tmp_path):
+    path = tmp_path / "out.jsonl"
+    out = GroupCommitWriter(str(path), max_records=100, max_delay=0.05)
+    out.write({"i": 0})
+    assert wait_for(lambda: lines(path) == [{"i": 0}])
+    out.close()
+    assert not out._flusher.is_alive()
+
+
+def test_close_writer_drains_the_queue(tmp_path, writers):
+    path = tmp_path / "out.jsonl"
+    writer.configure_writers(max_records=100, max_delay=60)
+    records = [{"i": i} for i in range(10)]
+    for record in records:
+        get_writer(str(path)).write(record)
+    assert lines(path) == []
+    close_writer(str(path))
+    assert lines(path) == records
+    # A closed writer is replaced by a new one, appending to the same file
+    get_writer(str(path)).write({"i": 10})
+    close_writer(str(path))
+    assert lines(path) == records + [{"i": 10}]
+
+
+def test_a_closed_writer_refuses_records(tmp_path):
+    out = GroupCommitWriter(str(tmp_path / "out.jsonl"))
+    out.write({"i": 0})
+    out.close()
+    with pytest.raises(ValueError):
+        out.write({"i": 1})
+
+
+def test_gzip_appends_one_member_per_commit(tmp_path):
+    path = tmp_path / "out.jsonl.gz"
+    out = GroupCommitWriter(str(path), max_records=2)
+    for i in range(5):
+        out.write({"i": i})
+    out.close()
+    assert lines(path) == [{"i": i} for i in range(5)]
+
+
+def test_unpickled_writers_open_the_file_on_the_first_write(tmp_path):
+    path = tmp_path / "nested" / "out.jsonl"
+    out = pickle.loads(pickle.dumps(GroupCommitWriter(str(path), max_records=1, max_delay=60, fsync="close")))
+    assert (out.path, out.max_records, out.max_delay, out.fsync) == (str(path), 1, 60, "close")
+    assert not path.parent.exists() and out._flusher is None
+    out.write({"i": 0})
+    assert lines(path) == [{"i": 0}]
+    assert out._flusher.is_alive()
+    out.close()
+    # Closing a writer that never wrote is a no-op
+    GroupCommitWriter(str(tmp_path / "unused.jsonl")).close()
+    assert not (tmp_path / "unused.jsonl").exists()